@@ -0,0 +1,175 @@
+"""
+Benchmarks every stage of the analysis pipeline on synthetic templates of
+growing size, and compares the results against stored baselines.
+
+    python benchmarks/bench.py                  # compare against baselines.json
+    python benchmarks/bench.py --save           # record new baselines
+    python benchmarks/bench.py --sizes 10,1000  # only some sizes
+
+Memory is the peak of the Python heap during each stage (tracemalloc), so
+it does not include z3's native memory.
+
+Baselines are machine-specific: record them on the machine that runs the
+comparison.
+"""
+
+from __future__ import annotations
+import argparse
+import copy
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from cloudcap import estimates, synthetic
+from cloudcap.analyzer import Analyzer
+from cloudcap.aws import AWS, Account, CloudFormationStack, Regions
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+
+# a stage regresses if it is this much slower (or bigger) than its baseline...
+DEFAULT_TOLERANCE = 1.5
+# ...and the difference is above the noise floor
+MIN_SECONDS = 0.005
+MIN_BYTES = 1 << 20
+
+# stage name -> {"seconds": ..., "peak_bytes": ...}
+Measurements = dict[str, dict[str, float]]
+
+
+def run_stages(size: int, workdir: str, measure: Callable[..., Any]) -> None:
+    """
+    Runs the pipeline once on a synthetic template of `size` resources,
+    calling `measure(stage, fn)` to run (and measure) each stage.
+    """
+    template, user_estimates = measure(
+        "generate",
+        lambda: synthetic.generate(size, fan_in=2, cross_references=size // 100),
+    )
+    template_path = os.path.join(workdir, f"{size}.yaml")
+    measure("write", lambda: synthetic.write(template, user_estimates, template_path))
+
+    data = measure("parse", lambda: CloudFormationStack.load(template_path))
+    # resolution rewrites bodies in place: keep unresolved copies to resolve again
+    bodies = copy.deepcopy(data["Resources"])
+
+    aws = AWS()
+    stack = measure(
+        "stack",
+        lambda: CloudFormationStack(aws, Regions.us_east_1, Account("123"), data),
+    )
+    # the stack builds its dependency graph and resolves intrinsic functions
+    # while creating resources; measure both again on their own
+    measure("dependency_graph", stack._init_dependency_graph)
+    measure(
+        "intrinsic_resolution",
+        lambda: [stack.resolve_intrinsic_functions(b) for b in bodies.values()],
+    )
+
+    analyzer = Analyzer(aws)
+    measure("constrain", analyzer.constrain)
+    measure("solve", lambda: analyzer.check(user_estimates))
+    measure("estimates_template", lambda: estimates.template_to_string(aws))
+
+
+def bench(size: int, memory: bool) -> Measurements:
+    results: Measurements = {}
+
+    def timed(stage: str, fn: Callable[[], Any]) -> Any:
+        gc.collect()
+        start = time.perf_counter()
+        value = fn()
+        results.setdefault(stage, {})["seconds"] = time.perf_counter() - start
+        return value
+
+    def traced(stage: str, fn: Callable[[], Any]) -> Any:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            value = fn()
+            results[stage]["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return value
+
+    with tempfile.TemporaryDirectory() as workdir:
+        run_stages(size, workdir, timed)
+        # tracing slows everything down, so memory is measured in a second run
+        if memory:
+            run_stages(size, workdir, traced)
+    return results
+
+
+def compare(
+    size: int, results: Measurements, baseline: Measurements, tolerance: float
+) -> list[str]:
+    """Prints a comparison and returns the regressions."""
+    regressions = []
+    for stage, measured in results.items():
+        line = f"{size:>8} {stage:<22}"
+        for metric, floor in (("seconds", MIN_SECONDS), ("peak_bytes", MIN_BYTES)):
+            if metric not in measured:
+                continue
+            value = measured[metric]
+            line += (
+                f" {value:>14.4f}"
+                if metric == "seconds"
+                else f" {value / 2**20:>10.1f}MiB"
+            )
+            base = baseline.get(stage, {}).get(metric)
+            if base:
+                line += f" ({value / base:4.2f}x)"
+                if value > base * tolerance and value - base > floor:
+                    regressions.append(
+                        f"{size} {stage} {metric}: {base:.4g} -> {value:.4g}"
+                    )
+        print(line)
+    return regressions
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)))
+    parser.add_argument("--baselines", default=BASELINES)
+    parser.add_argument("--save", action="store_true", help="record new baselines")
+    parser.add_argument("--no-memory", action="store_true", help="skip memory tracking")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    baselines: dict[str, Measurements] = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    # warm up: the first run also pays for lazy imports (networkx, z3, ...)
+    bench(10, memory=False)
+
+    regressions: list[str] = []
+    print(f"{'size':>8} {'stage':<22} {'seconds':>14} {'peak':>13}")
+    for size in map(int, args.sizes.split(",")):
+        results = bench(size, memory=not args.no_memory)
+        regressions += compare(
+            size, results, baselines.get(str(size), {}), args.tolerance
+        )
+        if args.save:
+            baselines[str(size)] = results
+
+    if args.save:
+        with open(args.baselines, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"saved baselines to {args.baselines}")
+        return 0
+
+    for regression in regressions:
+        print(f"regression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -11,3 +11,18 @@ __version__ = "0.1.0"
     SOLVER_ERROR,
     INVALID_INPUT,
 ) = range(4)
+
+# how an analysis result (the name of an `AnalyzerResult`) is reported, and
+# the status the CLI exits with; any other result is a solver failure
+_RESULTS = {"PASS": ("✅ Pass", SUCCESS), "REJECT": ("❌ Reject", SOLVER_REJECT)}
+_SOLVER_FAILED = ("⚠️ The solver failed to solve the constraints", SOLVER_ERROR)
+
+
+def describe(result: str) -> str:
+    """How an analysis result (an `AnalyzerResult` name) is reported."""
+    return _RESULTS.get(result, _SOLVER_FAILED)[0]
+
+
+def exit_status(result: str) -> int:
+    """The status the CLI exits with for an analysis result."""
+    return _RESULTS.get(result, _SOLVER_FAILED)[1]
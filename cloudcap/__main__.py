@@ -1,5 +1,18 @@
-from cloudcap import cli, __app_name__
+import sys
+from cloudcap import __app_name__, __version__
 
 
 def main() -> None:
+    # answer `--version` before importing the CLI framework: it's the one
+    # command that needs nothing but the package metadata
+    if sys.argv[1:] in (["--version"], ["-v"]):
+        print(f"{__app_name__} v{__version__}")
+        return
+
+    from cloudcap import cli
+
     cli.app(prog_name=__app_name__)
+
+
+if __name__ == "__main__":
+    main()
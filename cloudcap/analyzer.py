@@ -1,17 +1,25 @@
 from __future__ import annotations
 from collections import defaultdict
+import contextlib
 import enum
+import itertools
 import logging
-from typing import Any, TYPE_CHECKING
+import re
+from typing import IO, Any, Hashable, Iterable, Iterator, Mapping, Optional
+from cloudcap import profiling
+from cloudcap.estimates import (
+    Estimates,
+    UnknownResourcesError,
+    validate as validate_estimates,
+)
+from cloudcap.flows import Flows
 from cloudcap.plugins import Plugin, builtin_plugins
 from cloudcap.metrics import NREQUESTS, Metric
 
-from z3 import *  # type: ignore
+import z3  # type: ignore
+from z3 import z3core  # type: ignore
 from cloudcap.aws import AWS, Resource
 
-if TYPE_CHECKING:
-    from cloudcap.estimates import Estimates
-
 logger = logging.getLogger(__name__)
 
 Constraint = Any
@@ -19,6 +27,9 @@ Variable = Any
 NodeVariableIndex = tuple[Resource, str]
 EdgeVariableIndex = tuple[Resource, Resource, str]
 
+# a symbol of an SMT-LIB expression (quoted or not), or a number
+_TOKEN = re.compile(r"\|[^|]*\||[^\s()|]+")
+
 
 class AnalyzerResult(enum.Enum):
     PASS = 1
@@ -37,59 +48,490 @@ class AnalyzerResult(enum.Enum):
             case _:
                 return AnalyzerResult.UNKNOWN
 
+    @staticmethod
+    def combine(results: Iterable[AnalyzerResult]) -> AnalyzerResult:
+        """
+        Combines the results of independent sets of constraints: one REJECT
+        rejects everything, otherwise any UNKNOWN makes the result unknown.
+        """
+        results = set(results)
+        if AnalyzerResult.REJECT in results:
+            return AnalyzerResult.REJECT
+        if AnalyzerResult.UNKNOWN in results:
+            return AnalyzerResult.UNKNOWN
+        return AnalyzerResult.PASS
+
+
+class Component:
+    """
+    A set of resources whose constraints share no variables with the
+    constraints of any other resource, so that it can be solved on its own.
+    """
+
+    resources: list[Resource]
+    constraints: list[Constraint]
+
+    def __init__(self, resources: list[Resource]) -> None:
+        self.resources = resources
+        self.constraints = []
+
+    @property
+    def key(self) -> frozenset[int]:
+        return frozenset(id(r) for r in self.resources)
+
 
 class Analyzer:
+    """
+    Constrains an infrastructure and solves the constraints with estimates.
+
+    Each analyzer creates its variables and solvers in a z3 context of its
+    own, so analyzers on different threads are independent, and z3 releases
+    the GIL while they solve. An analyzer itself is not thread-safe; the
+    `AWS` registry it analyzes is only read, and can be shared by analyzers
+    on several threads once it is built.
+
+    Args:
+    - aws (AWS): The infrastructure to analyze.
+    - ctx (Optional[z3.Context]): The z3 context to work in. Defaults to a
+      new one.
+    """
+
     aws: AWS
     plugins: list[Plugin]
+    ctx: Any
     solver: Any
     node_variables: dict[NodeVariableIndex, Variable]
     edge_variables: dict[EdgeVariableIndex, Variable]
+    # constraints generated by plugins, by the resource they were generated
+    # for (None: constraints of plugins that don't attribute them), and the
+    # variables each group uses. This is what Analyzer.update() works on.
+    groups: defaultdict[Optional[Resource], list[Constraint]]
+    group_variables: defaultdict[
+        Optional[Resource], set[NodeVariableIndex | EdgeVariableIndex]
+    ]
 
-    def __init__(self, aws: AWS) -> None:
+    def __init__(self, aws: AWS, ctx: Optional[Any] = None) -> None:
         # initialize with builtin plugins
         self.aws = aws
         self.plugins = [p(self) for p in builtin_plugins.plugins]
-        self.solver = z3.Solver()
+        self.ctx = ctx if ctx is not None else z3.Context()
+        self.solver = z3.Solver(ctx=self.ctx)
         self.node_variables = {}
         self.edge_variables = {}
+        self.groups = defaultdict(list)
+        self.group_variables = defaultdict(set)
+        self._recording = False
+        self._owner: Optional[Resource] = None
+        # constraints added to the solver besides the plugins' and the flows,
+        # e.g. estimates: the presolve doesn't know about them
+        self._unrecorded = 0
 
     def add_plugin(self, plugin: type[Plugin]) -> None:
         self.plugins.append(plugin(self))
 
+    @contextlib.contextmanager
+    def owned_by(self, resource: Resource) -> Iterator[None]:
+        """
+        Attributes the constraints added within the context to `resource`,
+        so that they can be dropped and regenerated when it changes.
+        """
+        owner = self._owner
+        self._owner = resource
+        try:
+            yield
+        finally:
+            self._owner = owner
+
     def constrain(self) -> None:
         # call all plugins
-        for plugin in self.plugins:
-            plugin.constrain()
+        with profiling.span("constrain"):
+            self._recording = True
+            try:
+                for plugin in self.plugins:
+                    with profiling.span(plugin.name()):
+                        plugin.constrain()
+            finally:
+                self._recording = False
 
-        # generate incoming constraints
-        incomings_map: defaultdict[tuple[Resource, Metric], list[Variable]] = (
-            defaultdict(list)
-        )
-        for (_, resource2, metric), var in self.edge_variables.items():
-            incomings_map[(resource2, metric)].append(var)
+            with profiling.span("flows"):
+                self._constrain_flows()
 
-        for (resource, metric), incomings in incomings_map.items():
-            self.add(self[resource, metric] == sum(incomings[1:], incomings[0]))
+    def update(
+        self, removed: Iterable[Resource], changed: Iterable[Resource]
+    ) -> list[Resource]:
+        """
+        Constrains again after part of the infrastructure changed.
 
-        # generate basic constraints
-        # TODO: only doing NREQUESTS >= 0 for now
-        self.add(
-            *[
-                var >= 0
-                for (_, metric), var in self.node_variables.items()
-                if metric == NREQUESTS
-            ]
+        Drops the constraints generated for or using the `removed` resources,
+        and runs the plugins again for the `changed` ones (plus the resources
+        whose constraints used a removed resource). The solver is rebuilt from
+        the constraints that are kept; constraints that were added to it
+        directly, e.g. estimates, are not kept.
+
+        Args:
+        - removed (Iterable[Resource]): Resources no longer in the registry.
+        - changed (Iterable[Resource]): New resources, and resources whose
+          inputs to the plugins changed.
+
+        Returns:
+        - list[Resource]: The resources whose constraints may have changed.
+        """
+        stale = {id(r) for r in removed}
+        redo = {id(r): r for r in changed}
+        affected: dict[int, Resource] = {}
+        # a plugin may record variables for a resource without constraining it
+        for owner in [*self.groups, *self.group_variables.keys() - self.groups.keys()]:
+            uses_stale = any(
+                id(r) in stale
+                for index in self.group_variables.get(owner, ())
+                for r in index[:-1]
+            )
+            if owner is None or id(owner) in stale or id(owner) in redo or uses_stale:
+                self.groups.pop(owner, None)
+                for index in self.group_variables.pop(owner, ()):
+                    for r in index[:-1]:
+                        if id(r) not in stale:
+                            affected[id(r)] = r
+                if owner is not None and id(owner) not in stale:
+                    redo[id(owner)] = owner
+
+        # only keep the variables that the remaining constraints use
+        live: set[NodeVariableIndex | EdgeVariableIndex] = set().union(
+            *self.group_variables.values()
         )
-        self.add(
-            *[
-                var >= 0
-                for (_, _, metric), var in self.edge_variables.items()
-                if metric == NREQUESTS
-            ]
+        self.node_variables = {
+            k: v for k, v in self.node_variables.items() if k in live
+        }
+        self.edge_variables = {
+            k: v for k, v in self.edge_variables.items() if k in live
+        }
+
+        self._recording = True
+        try:
+            for plugin in self.plugins:
+                plugin.constrain_resources(redo.values())
+        finally:
+            self._recording = False
+
+        self.solver = z3.Solver(ctx=self.ctx)
+        self._unrecorded = 0
+        for group in self.groups.values():
+            self.solver.add(*group)
+        self._constrain_flows()
+        logger.info("re-constrained %d resources, dropped %d", len(redo), len(stale))
+
+        # constraints that aren't attributed were all regenerated
+        affected.update(redo)
+        for index in self.group_variables.get(None, ()):
+            for r in index[:-1]:
+                affected[id(r)] = r
+        return list(affected.values())
+
+    def replicate(self, replicas: Iterable[Mapping[Resource, Resource]]) -> None:
+        """
+        Constrains replicas of constrained resources, e.g. the same template
+        deployed to other targets, without running the plugins again: each
+        constraint is instantiated with the replicas' variables substituted
+        for the originals'.
+
+        Args:
+        - replicas (Iterable[Mapping[Resource, Resource]]): For each copy of
+          the infrastructure, its resources by the resources they replicate
+          (see `CloudFormationStack.replicate`).
+        """
+        replicas = list(replicas)
+        # plugins may only create variables for a resource, without constraints
+        owners = list(dict.fromkeys([*self.group_variables, *self.groups]))
+        groups = [(owner, list(self.groups.get(owner, ()))) for owner in owners]
+        self._recording = True
+        try:
+            for replica in replicas:
+                for owner, group in groups:
+                    if owner is not None and owner not in replica:
+                        continue
+                    indexes = [
+                        index
+                        for index in self.group_variables[owner]
+                        if any(r in replica for r in index[:-1])
+                    ]
+                    if owner is None and not indexes:
+                        # doesn't involve this copy
+                        continue
+                    with self.owned_by(replica.get(owner)):  # type: ignore
+                        pairs = [
+                            (
+                                self._variable(index),
+                                self[self._replica_index(index, replica)],
+                            )
+                            for index in indexes
+                        ]
+                        for constraint in group:
+                            self.add(z3.substitute(constraint, *pairs))
+        finally:
+            self._recording = False
+
+        copies = {id(r) for replica in replicas for r in replica.values()}
+        for resource, constraint in self._flow_constraints():
+            if id(resource) in copies:
+                self.solver.add(constraint)
+        logger.info("replicated constraints to %d copies", len(replicas))
+
+    def _variable(self, index: NodeVariableIndex | EdgeVariableIndex) -> Variable:
+        """The variable of an index, without recording its use."""
+        if len(index) == 2:
+            return self.node_variables[index]  # type: ignore
+        return self.edge_variables[index]  # type: ignore
+
+    @staticmethod
+    def _replica_index(
+        index: NodeVariableIndex | EdgeVariableIndex,
+        replica: Mapping[Resource, Resource],
+    ) -> NodeVariableIndex | EdgeVariableIndex:
+        *resources, metric = index
+        return (*(replica.get(r, r) for r in resources), metric)  # type: ignore
+
+    def _constrain_flows(self) -> None:
+        # generated again from the variables whenever needed: not recorded
+        for _, constraint in self._flow_constraints():
+            self.solver.add(constraint)
+
+    def _flow_constraints(self) -> Iterator[tuple[Resource, Constraint]]:
+        """
+        Generates the constraints on flows through the resources, each with
+        the resource it constrains.
+        """
+        for (resource, metric), incomings in self.flow_sums().items():
+            variables = [self.edge_variables[i] for i in incomings]
+            yield resource, self[resource, metric] == sum(variables[1:], variables[0])
+
+        for index in self.nonnegative():
+            yield index[0], self._variable(index) >= 0
+
+    def flow_sums(self) -> dict[NodeVariableIndex, list[EdgeVariableIndex]]:
+        """
+        The flow constraints: each metric of a resource with incoming edges
+        is the sum of the edges' metric.
+        """
+        incomings_map: defaultdict[NodeVariableIndex, list[EdgeVariableIndex]] = (
+            defaultdict(list)
         )
+        for index in self.edge_variables:
+            incomings_map[(index[1], index[2])].append(index)
+        return incomings_map
+
+    def nonnegative(self) -> list[NodeVariableIndex | EdgeVariableIndex]:
+        """The variables constrained to be >= 0."""
+        # TODO: only doing NREQUESTS >= 0 for now
+        return [
+            index
+            for index in itertools.chain(self.node_variables, self.edge_variables)
+            if index[-1] == NREQUESTS
+        ]
+
+    def components(self) -> list[Component]:
+        """
+        Splits the constraints into components that share no variables.
+
+        Two resources are in the same component if a plugin constrained them
+        together or if there is an edge between them. Constraints that no
+        plugin attributed to a resource join all the resources they use.
+
+        Returns:
+        - list[Component]: The components, with their constraints (but
+          without estimates).
+        """
+        parent: dict[int, int] = {}
+        resources: dict[int, Resource] = {}
+
+        def find(i: int) -> int:
+            root = i
+            while parent[root] != root:
+                root = parent[root]
+            while parent[i] != root:
+                parent[i], i = root, parent[i]
+            return root
+
+        def union(*rs: Resource) -> None:
+            for r in rs:
+                if id(r) not in parent:
+                    parent[id(r)] = id(r)
+                    resources[id(r)] = r
+            roots = {find(id(r)) for r in rs}
+            if len(roots) > 1:
+                first, *rest = roots
+                for root in rest:
+                    parent[root] = first
+
+        for owner, indexes in self.group_variables.items():
+            union(
+                *([owner] if owner is not None else []),
+                *(r for i in indexes for r in i[:-1]),
+            )
+        for resource, _ in self.node_variables:
+            union(resource)
+        for resource1, resource2, _ in self.edge_variables:
+            union(resource1, resource2)
+
+        components: dict[int, Component] = {}
+        for i, r in resources.items():
+            components.setdefault(find(i), Component([])).resources.append(r)
+
+        def component_of(r: Resource) -> Component:
+            return components[find(id(r))]
+
+        for owner, group in self.groups.items():
+            if owner is not None:
+                component_of(owner).constraints.extend(group)
+            elif self.group_variables.get(None):
+                first = next(iter(self.group_variables[None]))[0]
+                component_of(first).constraints.extend(group)
+            elif group:
+                # constraints without any variables
+                components[-1] = Component([])
+                components[-1].constraints.extend(group)
+        for resource, constraint in self._flow_constraints():
+            component_of(resource).constraints.append(constraint)
+        return list(components.values())
+
+    def check_component(
+        self, component: Component, estimates: Estimates
+    ) -> AnalyzerResult:
+        """
+        Solves one component's constraints together with the estimates of
+        its resources, in a solver of its own.
+        """
+        return ComponentChecker(self, estimates).check(component)
+
+    def check_components(
+        self, estimates: Estimates
+    ) -> list[tuple[Component, AnalyzerResult]]:
+        """
+        Solves every component on its own, and copies of a component once
+        (see `ComponentChecker`).
+
+        Returns:
+        - list[tuple[Component, AnalyzerResult]]: Every component, with its
+          result. Combined, they are the result of `check(estimates)`.
+
+        Raises:
+        - UnknownResourcesError: If an estimated resource doesn't exist.
+        """
+        try:
+            validate_estimates(self.aws, estimates)
+        except UnknownResourcesError as e:
+            logger.error("%s", e)
+            raise
+        checker = ComponentChecker(self, estimates)
+        results = [(c, checker.check(c)) for c in self.components()]
+        profiling.count("components", len(results))
+        profiling.count("component_shapes", len(checker.verdicts))
+        return results
 
     def solve(self) -> AnalyzerResult:
-        return AnalyzerResult.from_z3_check_result(self.solver.check())
+        return self._solve(self.solver)
+
+    def model(self) -> dict[str, int]:
+        """
+        The value of every variable in the solution found by the last
+        `solve()`, by variable name. Only valid after it returned PASS.
+        """
+        nodes, edges = self.values()
+        return dict(
+            zip(
+                map(
+                    _variable_name,
+                    itertools.chain(self.node_variables, self.edge_variables),
+                ),
+                itertools.chain(nodes, edges),
+            )
+        )
+
+    def values(self) -> tuple[list[int], list[int]]:
+        """
+        The value of every variable in the solution found by the last
+        `solve()`. Only valid after it returned PASS.
+
+        The values are read in bulk through z3's C API: going through a
+        Python object per variable (`model[v]`, `model.eval(v)`) costs
+        several times as much as solving on large models.
+
+        Returns:
+        - tuple[list[int], list[int]]: The values of the node and of the edge
+          variables, in the order of `node_variables` and `edge_variables`.
+        """
+        model = self.solver.model()
+        ctx, ref = model.ctx.ref(), model.model
+        get_interp = z3core.Z3_model_get_const_interp
+        get_decl = z3core.Z3_get_app_decl
+        get_numeral = z3core.Z3_get_numeral_string
+
+        def read(variables: Iterable[Variable]) -> list[int]:
+            values = []
+            for v in variables:
+                interp = get_interp(ctx, ref, get_decl(ctx, v.as_ast()))
+                # a variable that the solution doesn't need can be anything
+                values.append(int(get_numeral(ctx, interp)) if interp else 0)
+            return values
+
+        return read(self.node_variables.values()), read(self.edge_variables.values())
+
+    def flows(self) -> Flows:
+        """
+        The flow through every resource and edge in the solution found by the
+        last `solve()`. Only valid after it returned PASS.
+        """
+        nodes, edges = self.values()
+        return Flows(list(self.node_variables), nodes, list(self.edge_variables), edges)
+
+    def _solve(self, solver: Any) -> AnalyzerResult:
+        profile = profiling.current()
+        if profile is None:
+            return AnalyzerResult.from_z3_check_result(solver.check())
+
+        profile.count("node_variables", len(self.node_variables))
+        profile.count("edge_variables", len(self.edge_variables))
+        profile.count("constraints", len(solver.assertions()))
+        with profile.span("solve"):
+            result = solver.check()
+        profile.solver_statistics(solver.statistics())
+        return AnalyzerResult.from_z3_check_result(result)
+
+    def check(self, estimates: Estimates, presolve: bool = False) -> AnalyzerResult:
+        """
+        Solves the constraints together with the given estimates.
+
+        The estimates are added in a solver scope that is popped afterwards,
+        so the same constrained analyzer can check many estimates in a row.
+
+        Args:
+        - estimates (Estimates): The usage estimates to check.
+        - presolve (bool): Simplify the constraints with the estimates before
+          solving (see `cloudcap.presolve`). Ignored if constraints were added
+          to the solver besides the plugins'.
+
+        Returns:
+        - AnalyzerResult: The analysis result for these estimates.
+        """
+        if presolve and not self._unrecorded:
+            from cloudcap.presolve import presolve as presolve_constraints
+
+            presolved = presolve_constraints(self, estimates)
+            if presolved.result is not None:
+                return presolved.result
+            solver = z3.Solver(ctx=self.ctx)
+            solver.add(*presolved.constraints)
+            return self._solve(solver)
+        if presolve:
+            logger.info("not presolving: constraints were added to the solver")
+
+        unrecorded = self._unrecorded
+        self.solver.push()
+        try:
+            self.add_estimates(estimates)
+            return self.solve()
+        finally:
+            self.solver.pop()
+            self._unrecorded = unrecorded
 
     def __getitem__(self, key: NodeVariableIndex | EdgeVariableIndex) -> Variable:
         if not isinstance(key, tuple) and (len(key) == 2 or len(key == 3)):  # type: ignore
@@ -102,9 +544,10 @@ class Analyzer:
             resource = key[0]
             metric = key[1]
             assert isinstance(resource, Resource) and isinstance(metric, Metric)
+            if self._recording:
+                self.group_variables[self._owner].add((resource, metric))
             if (resource, metric) not in self.node_variables:
-                v_name = f"{resource.arn}.{metric}"
-                v = Int(v_name)  # type: ignore
+                v = z3.Int(_variable_name((resource, metric)), ctx=self.ctx)
                 self.node_variables[(resource, metric)] = v
             return self.node_variables[(resource, metric)]
         elif len(key) == 3:
@@ -117,9 +560,10 @@ class Analyzer:
                 and isinstance(resource2, Resource)
                 and isinstance(metric, Metric)
             )
+            if self._recording:
+                self.group_variables[self._owner].add((resource1, resource2, metric))
             if (resource1, resource2, metric) not in self.edge_variables:
-                v_name = f"{resource1.arn}.{resource2.arn}.{metric}"
-                v = Int(v_name)  # type: ignore
+                v = z3.Int(_variable_name((resource1, resource2, metric)), ctx=self.ctx)
                 self.edge_variables[(resource1, resource2, metric)] = v
             return self.edge_variables[(resource1, resource2, metric)]
         else:
@@ -128,11 +572,40 @@ class Analyzer:
             )
 
     def add(self, *args: list[Constraint]) -> None:
+        if self._recording:
+            self.groups[self._owner].extend(args)
+        else:
+            self._unrecorded += len(args)
         self.solver.add(*args)
 
     def sexpr(self) -> Any:
         return self.solver.sexpr()
 
+    def write_smt2(self, f: IO[str]) -> None:
+        """
+        Writes the model as SMT-LIB, like `sexpr`, but one declaration or
+        assertion at a time: the text of the whole model is never built,
+        and it reaches `f` as soon as the first assertion is printed.
+
+        Each function is declared right before the first assertion that
+        uses it, instead of all the declarations coming first. As in
+        `values`, the assertions are walked through z3's C API.
+        """
+        ctx = self.ctx.ref()
+        assertions = self.solver.assertions()
+        vector = assertions.vector
+        to_string = z3core.Z3_ast_to_string
+        declared: set[int] = set()
+        visited: set[int] = set()
+        for i in range(z3core.Z3_ast_vector_size(ctx, vector)):
+            assertion = z3core.Z3_ast_vector_get(ctx, vector, i)
+            for decl in _new_declarations(ctx, assertion, declared, visited):
+                f.write(z3core.Z3_func_decl_to_string(ctx, decl))
+                f.write("\n")
+            f.write("(assert ")
+            f.write(to_string(ctx, assertion))
+            f.write(")\n")
+
     def add_estimates(self, estimates: Estimates):
         # for arn, metrics in estimates.items():
         # if arn not in self.aws.arns:
@@ -140,9 +613,139 @@ class Analyzer:
         # resource = self.aws[arn]
         # for metric, estimate in metrics.items():
         #     self.add(self[resource, metric] == estimate)
+        try:
+            validate_estimates(self.aws, estimates)
+        except UnknownResourcesError as e:
+            logger.error("%s", e)
+            raise
         for logical_id, metrics in estimates.items():
-            if logical_id not in self.aws.logical_id_to_resource:
-                logger.error("%s does not exist in the infrastructure", logical_id)
             resource = self.aws.logical_id_to_resource[logical_id]
             for metric, estimate in metrics.items():
                 self.add(self[resource, metric] == estimate)
+
+
+class ComponentChecker:
+    """
+    Solves components against one set of estimates, once per shape.
+
+    Stacks often repeat one pipeline (e.g. queue -> event source mapping ->
+    Lambda) many times over, with only the names changing. Each copy is a
+    component whose constraints are the same up to the names of their
+    variables, so a component's shape is its constraints with the variables
+    numbered in order of appearance, together with the estimates of those
+    variables. Components of the same shape are equisatisfiable, and only the
+    first one is solved: the cost tracks the number of distinct shapes rather
+    than the number of copies.
+
+    Plugins constrain copies in the same order, so they get the same shape;
+    components that are isomorphic in some other order are only solved
+    more than once.
+    """
+
+    analyzer: Analyzer
+    # shape -> result
+    verdicts: dict[Hashable, AnalyzerResult]
+
+    def __init__(self, analyzer: Analyzer, estimates: Estimates) -> None:
+        self.analyzer = analyzer
+        self.verdicts = {}
+        # estimates by resource, to find a component's in one pass
+        self._estimates: defaultdict[int, list[tuple[Resource, str, int]]] = (
+            defaultdict(list)
+        )
+        for logical_id, metrics in estimates.items():
+            resource = analyzer.aws.logical_id_to_resource.get(logical_id)
+            if resource is not None:
+                for metric, estimate in metrics.items():
+                    self._estimates[id(resource)].append((resource, metric, estimate))
+        # (str() would pretty-print each variable, which is much slower)
+        self._names = {
+            v.decl().name()
+            for v in itertools.chain(
+                analyzer.node_variables.values(), analyzer.edge_variables.values()
+            )
+        }
+
+    def check(self, component: Component) -> AnalyzerResult:
+        estimates = [
+            e for r in component.resources for e in self._estimates.get(id(r), ())
+        ]
+        shape = self.shape(component, estimates)
+        if shape not in self.verdicts:
+            solver = z3.Solver(ctx=self.analyzer.ctx)
+            solver.add(*component.constraints)
+            for resource, metric, estimate in estimates:
+                solver.add(self.analyzer[resource, metric] == estimate)
+            self.verdicts[shape] = self.analyzer._solve(solver)
+        return self.verdicts[shape]
+
+    def shape(
+        self, component: Component, estimates: list[tuple[Resource, str, int]]
+    ) -> Hashable:
+        canonical: dict[str, str] = {}
+
+        def rename(match: re.Match[str]) -> str:
+            token = match.group(0)
+            name = token[1:-1] if token.startswith("|") else token
+            if name not in self._names:
+                return token
+            if name not in canonical:
+                canonical[name] = f"v{len(canonical)}"
+            return canonical[name]
+
+        constraints = tuple(
+            _TOKEN.sub(rename, c.sexpr()) for c in component.constraints
+        )
+        variables = self.analyzer.node_variables
+        pattern = sorted(
+            # a variable that no constraint uses is only named by its metric
+            (canonical.get(_name(variables.get((r, metric))), f"?{metric}"), estimate)
+            for r, metric, estimate in estimates
+        )
+        return constraints, tuple(pattern)
+
+
+def _variable_name(index: NodeVariableIndex | EdgeVariableIndex) -> str:
+    *resources, metric = index
+    return ".".join([*(str(r.arn) for r in resources), metric])
+
+
+def _name(variable: Optional[Variable]) -> Optional[str]:
+    return variable.decl().name() if variable is not None else None
+
+
+def _new_declarations(
+    ctx: Any, expression: Any, declared: set[int], visited: set[int]
+) -> list[Any]:
+    """
+    The uninterpreted functions (e.g. variables) of an expression that aren't
+    in `declared` yet, in the order of z3's own declarations; adds them.
+
+    `visited` holds the ids of the subexpressions already walked, which
+    expressions share.
+    """
+    ast_id = z3core.Z3_get_ast_id
+    ast_kind = z3core.Z3_get_ast_kind
+    app_decl = z3core.Z3_get_app_decl
+    decl_kind = z3core.Z3_get_decl_kind
+    to_ast = z3core.Z3_func_decl_to_ast
+    num_args = z3core.Z3_get_app_num_args
+    arg = z3core.Z3_get_app_arg
+    found = []
+    todo = [expression]
+    while todo:
+        e = todo.pop()
+        i = ast_id(ctx, e)
+        if i in visited:
+            continue
+        visited.add(i)
+        if ast_kind(ctx, e) != z3.Z3_APP_AST:
+            continue
+        decl = app_decl(ctx, e)
+        if decl_kind(ctx, decl) == z3.Z3_OP_UNINTERPRETED:
+            d = ast_id(ctx, to_ast(ctx, decl))
+            if d not in declared:
+                declared.add(d)
+                found.append(decl)
+        todo.extend(arg(ctx, e, j) for j in range(num_args(ctx, e)))
+    return found
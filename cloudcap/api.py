@@ -0,0 +1,305 @@
+"""
+Asynchronous analysis API, for services that embed cloudcap in an asyncio
+event loop.
+
+Parsing, constraining and solving run in an executor, so the loop keeps
+serving while z3 runs. Every analysis has its own z3 context (see
+`Analyzer`), so analyses on threads run in parallel while z3 solves, as z3
+releases the GIL:
+
+    result = await api.analyze(template_text, estimates_text, timeout=10)
+
+- executor: `THREAD` (the default) or `PROCESS`; see `configure`.
+- concurrency: at most `max_concurrency` analyses run at a time, the others
+  wait (on the loop, without holding a worker).
+- cancellation: cancelling the awaiting task, or running out of `timeout`,
+  interrupts the analysis, including a z3 check in progress. Its slot is
+  only released once the analysis has actually stopped.
+"""
+
+from __future__ import annotations
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import contextlib
+import logging
+import os
+import threading
+from typing import Any, Callable, Iterator, Optional, TYPE_CHECKING
+import weakref
+
+from cloudcap.estimates import YAML, Estimates
+
+if TYPE_CHECKING:
+    from cloudcap.analyzer import AnalyzerResult
+
+logger = logging.getLogger(__name__)
+
+# executors
+THREAD = "thread"
+PROCESS = "process"
+EXECUTORS = (THREAD, PROCESS)
+
+
+class AnalysisCancelled(Exception):
+    """Raised in a worker whose analysis was cancelled."""
+
+
+class _Cancellation:
+    """
+    The cancellation of one analysis: checked between its phases, and
+    interrupts the z3 check it runs. `event` may be shared with another
+    process.
+    """
+
+    def __init__(self, event: Any) -> None:
+        self.event = event
+        self._lock = threading.Lock()
+        self._solver: Any = None
+
+    def check(self) -> None:
+        if self.event.is_set():
+            raise AnalysisCancelled()
+
+    @contextlib.contextmanager
+    def solving(self, solver: Any) -> Iterator[None]:
+        with self._lock:
+            self.check()
+            self._solver = solver
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._solver = None
+        # an interrupted check returns unknown
+        self.check()
+
+    def cancel(self) -> None:
+        self.event.set()
+        self.interrupt()
+
+    def interrupt(self) -> None:
+        with self._lock:
+            if self._solver is not None:
+                self._solver.interrupt()
+
+
+def _analyze(
+    template: str,
+    estimates: str | Estimates,
+    estimates_format: str,
+    cancellation: _Cancellation,
+) -> str:
+    from cloudcap import estimates as estimates_io
+    from cloudcap.analyzer import Analyzer
+    from cloudcap.aws import AWS, Account, CloudFormationStack, Regions
+
+    if isinstance(estimates, str):
+        estimates = estimates_io.loads(estimates, estimates_format)
+    aws = AWS()
+    CloudFormationStack(
+        aws, Regions.us_east_1, Account("123"), CloudFormationStack.loads(template)
+    )
+    cancellation.check()
+    # in a z3 context of its own, so it runs alongside other analyses
+    analyzer = Analyzer(aws)
+    analyzer.constrain()
+    cancellation.check()
+    analyzer.add_estimates(estimates)
+    with cancellation.solving(analyzer.solver):
+        return analyzer.solve().name
+
+
+def _estimates_template(template: str, cancellation: _Cancellation) -> str:
+    from cloudcap import estimates as estimates_io
+    from cloudcap.aws import AWS, Account, CloudFormationStack, Regions
+
+    aws = AWS()
+    CloudFormationStack(
+        aws, Regions.us_east_1, Account("123"), CloudFormationStack.loads(template)
+    )
+    cancellation.check()
+    return estimates_io.template_to_string(aws)
+
+
+def _in_process(fn: Callable[..., Any], args: tuple[Any, ...], event: Any) -> Any:
+    """Runs `fn` in a worker process, interrupted when `event` is set."""
+    cancellation = _Cancellation(event)
+
+    def watch() -> None:
+        event.wait()
+        cancellation.interrupt()
+
+    threading.Thread(target=watch, daemon=True).start()
+    try:
+        return fn(*args, cancellation)
+    finally:
+        # stops the watcher
+        event.set()
+
+
+class AnalysisPool:
+    """
+    Runs analyses in an executor, a bounded number at a time.
+
+    Args:
+    - executor (str): `THREAD` or `PROCESS`. Threads only run Python code
+      (parsing, constraining) one at a time; processes don't share the GIL,
+      but cost more to start and to send templates to.
+    - max_concurrency (Optional[int]): Number of analyses that run at the
+      same time. Defaults to the number of CPUs.
+    """
+
+    executor: str
+    max_concurrency: int
+
+    def __init__(self, executor: str = THREAD, max_concurrency: Optional[int] = None):
+        if executor not in EXECUTORS:
+            raise ValueError(f"executor must be one of {EXECUTORS}, got {executor}")
+        self.executor = executor
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self._pool: Optional[Executor] = None
+        self._manager: Any = None
+        self._lock = threading.Lock()
+        # one semaphore per event loop
+        self._semaphores: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, asyncio.Semaphore
+        ] = weakref.WeakKeyDictionary()
+
+    async def analyze(
+        self,
+        template: str,
+        estimates: str | Estimates,
+        estimates_format: str = YAML,
+        timeout: Optional[float] = None,
+    ) -> AnalyzerResult:
+        """
+        Checks whether estimates satisfy the constraints of a template.
+
+        Args:
+        - template (str): The CloudFormation template, in YAML or JSON.
+        - estimates (str | Estimates): The estimates, as loaded or as text.
+        - estimates_format (str): The format of estimates given as text
+          (see `cloudcap.estimates`).
+        - timeout (Optional[float]): Seconds before the analysis is
+          cancelled.
+
+        Returns:
+        - AnalyzerResult: The result.
+
+        Raises:
+        - asyncio.TimeoutError: If the analysis timed out.
+        - cloudcap.estimates.UnknownResourcesError: If an estimated resource
+          doesn't exist.
+        """
+        from cloudcap.analyzer import AnalyzerResult
+
+        name = await self._run(
+            _analyze, (template, estimates, estimates_format), timeout
+        )
+        return AnalyzerResult[name]
+
+    async def estimates_template(
+        self, template: str, timeout: Optional[float] = None
+    ) -> str:
+        """An estimates template for a CloudFormation template (see `cloudcap.estimates`)."""
+        return await self._run(_estimates_template, (template,), timeout)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
+
+    async def _run(
+        self,
+        fn: Callable[..., Any],
+        args: tuple[Any, ...],
+        timeout: Optional[float],
+    ) -> Any:
+        loop = asyncio.get_running_loop()
+        async with self._semaphore(loop):
+            cancel: Callable[[], None]
+            if self.executor == PROCESS:
+                event = self._get_manager().Event()
+                future = loop.run_in_executor(
+                    self._get_pool(), _in_process, fn, args, event
+                )
+                cancel = event.set
+            else:
+                cancellation = _Cancellation(threading.Event())
+                future = loop.run_in_executor(self._get_pool(), fn, *args, cancellation)
+                cancel = cancellation.cancel
+
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                cancel()
+                # keep the slot until the analysis has stopped
+                with contextlib.suppress(Exception, asyncio.CancelledError):
+                    await future
+                raise
+
+    def _semaphore(self, loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+        with self._lock:
+            if loop not in self._semaphores:
+                self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+            return self._semaphores[loop]
+
+    def _get_pool(self) -> Executor:
+        with self._lock:
+            if self._pool is None:
+                if self.executor == PROCESS:
+                    self._pool = ProcessPoolExecutor(self.max_concurrency)
+                else:
+                    self._pool = ThreadPoolExecutor(
+                        self.max_concurrency, thread_name_prefix="cloudcap"
+                    )
+            return self._pool
+
+    def _get_manager(self) -> Any:
+        """Serves the events that cancel analyses in worker processes."""
+        import multiprocessing
+
+        with self._lock:
+            if self._manager is None:
+                self._manager = multiprocessing.Manager()
+            return self._manager
+
+
+_default: Optional[AnalysisPool] = None
+_default_lock = threading.Lock()
+
+
+def configure(executor: str = THREAD, max_concurrency: Optional[int] = None) -> None:
+    """Replaces the pool that `analyze` and `estimates_template` run on."""
+    global _default  # pylint: disable=global-statement
+    with _default_lock:
+        previous, _default = _default, AnalysisPool(executor, max_concurrency)
+    if previous is not None:
+        previous.shutdown()
+
+
+def _pool() -> AnalysisPool:
+    global _default  # pylint: disable=global-statement
+    with _default_lock:
+        if _default is None:
+            _default = AnalysisPool()
+        return _default
+
+
+async def analyze(
+    template: str,
+    estimates: str | Estimates,
+    estimates_format: str = YAML,
+    timeout: Optional[float] = None,
+) -> AnalyzerResult:
+    """`AnalysisPool.analyze` on the default pool (see `configure`)."""
+    return await _pool().analyze(template, estimates, estimates_format, timeout)
+
+
+async def estimates_template(template: str, timeout: Optional[float] = None) -> str:
+    """`AnalysisPool.estimates_template` on the default pool (see `configure`)."""
+    return await _pool().estimates_template(template, timeout)
@@ -0,0 +1,194 @@
+"""
+An index of the resources of a registry by their ARNs and URLs.
+
+ARNs (`arn:<partition>:<service>:<region>:<account>:<resource>`) and SQS
+queue URLs (`https://sqs.<region>.amazonaws.com/<account>/<name>`) are parsed
+once each (the parses are memoized) into `ArnKey`s, so that a queue's URL
+and its ARN have the same key. Resources can then be found by their exact
+ARN or URL, by key, by service and name in any region and account, or by
+ARN prefix, and strings that aren't the ARN or URL of any resource (e.g.
+most values of Lambda environments) miss cheaply instead of raising.
+"""
+
+from __future__ import annotations
+import bisect
+from collections import defaultdict
+import functools
+from typing import NamedTuple, Iterable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from cloudcap.aws import Resource
+
+# memoized parses
+PARSE_CACHE_SIZE = 1 << 17
+
+_ARN_PREFIX = "arn:"
+_SQS_URL_PREFIX = "https://sqs."
+
+
+class ArnKey(NamedTuple):
+    """The parts of an ARN (or of the ARN that a URL stands for)."""
+
+    partition: str
+    service: str
+    region: str
+    account: str
+    # e.g. `function:my-function` or `my-queue`
+    resource: str
+
+    @property
+    def name(self) -> str:
+        """The resource's name, without its type or a Lambda's version or alias."""
+        if self.service == "lambda":
+            # function:<name>[:<version or alias>]
+            parts = self.resource.split(":")
+            return parts[1] if len(parts) > 1 else parts[0]
+        return self.resource.rsplit("/", 1)[-1].rsplit(":", 1)[-1]
+
+    def __str__(self) -> str:
+        return ":".join(("arn", *self))
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse(text: str) -> Optional[ArnKey]:
+    """
+    Parses an ARN or an SQS queue URL.
+
+    Returns:
+    - Optional[ArnKey]: None if `text` is neither.
+    """
+    if text.startswith(_ARN_PREFIX):
+        parts = text.split(":", 5)
+        if len(parts) < 6:
+            return None
+        return ArnKey(*parts[1:])
+    if text.startswith(_SQS_URL_PREFIX):
+        host, _, path = text[len(_SQS_URL_PREFIX) :].partition("/")
+        region = host.split(".", 1)[0]
+        account, _, name = path.partition("/")
+        if not region or not account or not name or "/" in name:
+            return None
+        return ArnKey(_partition(region), "sqs", region, account, name)
+    return None
+
+
+def lambda_function_key(
+    reference: str, partition: str, region: str, account: str
+) -> ArnKey:
+    """
+    The key of the Lambda function that a reference names, as in the
+    `FunctionName` of an event source mapping.
+
+    Args:
+    - reference (str): A function name, a function ARN (possibly with a
+      version or an alias), or a partial ARN (`<account>:function:<name>`).
+    - partition, region, account: Where a name or a partial ARN is looked up.
+    """
+    parsed = parse(reference)
+    if parsed is not None and parsed.service == "lambda":
+        return parsed._replace(resource=f"function:{parsed.name}")
+    parts = reference.split(":")
+    if len(parts) >= 3 and parts[1] == "function":
+        return ArnKey(partition, "lambda", region, parts[0], f"function:{parts[2]}")
+    return ArnKey(partition, "lambda", region, account, f"function:{reference}")
+
+
+class ResourceIndex:
+    """
+    The resources of a registry, by ARN and URL.
+
+    - arns: the resources by their ARN.
+    - urls: the resources that have URLs, by URL.
+    """
+
+    arns: dict[str, Resource]
+    urls: dict[str, Resource]
+
+    def __init__(self) -> None:
+        self.arns = {}
+        self.urls = {}
+        self._keys: dict[ArnKey, Resource] = {}
+        self._names: defaultdict[tuple[str, str], list[Resource]] = defaultdict(list)
+        # the ARNs, sorted, for prefix lookups; built on demand
+        self._sorted: Optional[list[str]] = None
+
+    def add(self, resource: Resource) -> None:
+        arn = str(resource.arn)
+        self.arns[arn] = resource
+        key = parse(arn)
+        if key is not None:
+            self._keys[key] = resource
+            self._names[key.service, key.name].append(resource)
+        self._sorted = None
+
+    def add_url(self, url: str, resource: Resource) -> None:
+        self.urls[url] = resource
+
+    def remove(self, resources: Iterable[Resource]) -> None:
+        removed = {id(r) for r in resources}
+        if not removed:
+            return
+        self.arns = {a: r for a, r in self.arns.items() if id(r) not in removed}
+        self.urls = {u: r for u, r in self.urls.items() if id(r) not in removed}
+        self._keys = {k: r for k, r in self._keys.items() if id(r) not in removed}
+        names: defaultdict[tuple[str, str], list[Resource]] = defaultdict(list)
+        for name, rs in self._names.items():
+            kept = [r for r in rs if id(r) not in removed]
+            if kept:
+                names[name] = kept
+        self._names = names
+        self._sorted = None
+
+    def __getitem__(self, reference: str) -> Resource:
+        resource = self.get(reference)
+        if resource is None:
+            raise KeyError(f"no resource has the ARN or URL {reference}")
+        return resource
+
+    def __contains__(self, reference: object) -> bool:
+        return isinstance(reference, str) and self.get(reference) is not None
+
+    def __len__(self) -> int:
+        return len(self.arns)
+
+    def get(self, reference: object) -> Optional[Resource]:
+        """
+        The resource with this ARN or URL, or None (also for values that
+        aren't strings).
+        """
+        if not isinstance(reference, str):
+            return None
+        resource = self.arns.get(reference) or self.urls.get(reference)
+        if resource is not None:
+            return resource
+        key = parse(reference)
+        return self._keys.get(key) if key is not None else None
+
+    def find(self, key: ArnKey) -> Optional[Resource]:
+        """The resource with this key, or None."""
+        return self._keys.get(key)
+
+    def named(self, service: str, name: str) -> list[Resource]:
+        """The resources of a service with this name, in any region and account."""
+        return list(self._names.get((service, name), ()))
+
+    def with_prefix(self, prefix: str) -> list[Resource]:
+        """The resources whose ARNs start with `prefix`, in ARN order."""
+        if self._sorted is None:
+            self._sorted = sorted(self.arns)
+        start = bisect.bisect_left(self._sorted, prefix)
+        resources = []
+        for arn in self._sorted[start:]:
+            if not arn.startswith(prefix):
+                break
+            resources.append(self.arns[arn])
+        return resources
+
+
+def _partition(region: str) -> str:
+    # as Regions.get
+    if region.startswith("cn-"):
+        return "aws-cn"
+    if region.startswith("us-gov-"):
+        return "aws-us-gov"
+    return "aws"
@@ -2,17 +2,30 @@ from __future__ import annotations
 from collections import defaultdict
 import logging
 import sys
-from typing import Any, Optional, cast
-import cfn_flip  # type: ignore
-import networkx as nx
+from typing import Any, Callable, Iterable, Iterator, Optional, TYPE_CHECKING, cast
 import abc
-
-from cloudcap import INVALID_INPUT
-from cloudcap.cfn_template import CfnValue, exists_in_cfn_value
+import itertools
+
+from cloudcap import INVALID_INPUT, compression, profiling
+from cloudcap.arns import ResourceIndex, lambda_function_key
+from cloudcap.cfn_template import (
+    CfnValue,
+    map_strings_in_cfn_value,
+    strings_in_cfn_value,
+)
 import os
 import yaml
 import json
 
+if TYPE_CHECKING:
+    import networkx as nx
+
+    from cloudcap.nested import TemplateLoader
+
+# INFO: networkx and cfn_flip are slow to import, so they are only imported
+# when a template is actually loaded (see CloudFormationStack). Keep it that
+# way: `cloudcap --version` and the CLI's startup must not pay for them.
+
 logger = logging.getLogger(__name__)
 
 
@@ -52,6 +65,8 @@ class Partition:
 
 class Partitions:
     aws = Partition("aws")
+    aws_cn = Partition("aws-cn")
+    aws_us_gov = Partition("aws-us-gov")
 
 
 class Region:
@@ -70,11 +85,25 @@ class Regions:
     us_east_1 = Region(Partitions.aws, "us-east-1")
     us_east_2 = Region(Partitions.aws, "us-east-2")
 
+    @staticmethod
+    def get(name: str) -> Region:
+        """The region with this name, e.g. `eu-west-1`, in its partition."""
+        for region in vars(Regions).values():
+            if isinstance(region, Region) and region.region == name:
+                return region
+        if name.startswith("cn-"):
+            return Region(Partitions.aws_cn, name)
+        if name.startswith("us-gov-"):
+            return Region(Partitions.aws_us_gov, name)
+        return Region(Partitions.aws, name)
+
 
 ##### Arn
 
 Arn = str
 Url = str
+# maps the ARNs and URLs that a resource refers to, to the ones of their replicas
+Translate = Callable[[str], str]
 
 
 class ArnBuilder:
@@ -90,18 +119,25 @@ class ArnBuilder:
 
 
 class AWS:
-    arns: dict[Arn, Resource]
-    urls: dict[Url, Resource]
+    # the resources by ARN and URL
+    index: ResourceIndex
     deployments: list[Deployment]
     # TODO: this is a temporary mapping of logical_id to Resource
     logical_id_to_resource: dict[str, Resource]
 
     def __init__(self):
-        self.arns = {}
-        self.urls = {}
+        self.index = ResourceIndex()
         self.deployments = []
         self.logical_id_to_resource = {}
 
+    @property
+    def arns(self) -> dict[Arn, Resource]:
+        return self.index.arns
+
+    @property
+    def urls(self) -> dict[Url, Resource]:
+        return self.index.urls
+
     @property
     def resources(self) -> list[Resource]:
         return list(self.arns.values())
@@ -112,31 +148,49 @@ class AWS:
         return d
 
     def __getitem__(self, key: Arn | Url) -> Resource:
-        if not (isinstance(key, Arn) or isinstance(key, Url)):  # type: ignore
+        if not isinstance(key, str):
             raise KeyError(
                 f"AWS.__getitem__ expected an Arn or Url, but got a {type(key)}. Got: {key}"
             )
+        resource = self.index.get(key)
+        if resource is None:
+            raise KeyError(f"AWS.__getitem__ received unknown key: {key}")
+        return resource
 
-        try:
-            return self.arns[key]
-        except KeyError:
-            try:
-                return self.urls[key]
-            except KeyError:
-                raise KeyError(f"AWS.__getitem__ received unknown key: {key}")
+    def get(self, key: object) -> Optional[Resource]:
+        """
+        The resource with this ARN or URL, or None: unlike `self[key]`, for
+        values that may or may not refer to a resource.
+        """
+        return self.index.get(key)
 
     def register_resource(self, r: Resource) -> None:
         if r.arn in self.arns:
             logger.warning("%s is already a registered resource", r.arn)
-        self.arns[r.arn] = r
+        self.index.add(r)
         logger.info("registered resource %s", r.arn)
 
     def register_url(self, url: Url, r: Resource) -> None:
         if url in self.urls:
             logger.warning("%s is already a registered URL", url)
-        self.urls[url] = r
+        self.index.add_url(url, r)
         logger.info("registered url for %s: %s", r.arn, url)
 
+    def unregister_resources(self, resources: Iterable[Resource]) -> None:
+        """
+        Removes resources (and their URLs) from the registry, e.g. before the
+        part of a template that defines them is loaded again.
+        """
+        resources = list(resources)
+        removed = {id(r) for r in resources}
+        if not removed:
+            return
+        self.index.remove(resources)
+        self.logical_id_to_resource = {
+            i: r for i, r in self.logical_id_to_resource.items() if id(r) not in removed
+        }
+        logger.info("unregistered %d resources", len(removed))
+
 
 class Deployment:
     def __init__(self, aws: AWS, region: Region, account: Account):
@@ -145,8 +199,26 @@ class Deployment:
         self.region = region
         self.account = account
 
-    def from_cloudformation_template(self, path: str) -> None:
-        CloudFormationStack.from_file(self.aws, self.region, self.account, path)
+    def from_cloudformation_template(
+        self,
+        path: str,
+        streaming: bool = False,
+        demand: Optional[Iterable[str]] = None,
+        assets: Optional[str] = None,
+        template: Optional[CfnValue] = None,
+        loader: Optional[TemplateLoader] = None,
+    ) -> CloudFormationStack:
+        return CloudFormationStack.from_file(
+            self.aws,
+            self.region,
+            self.account,
+            path,
+            streaming=streaming,
+            demand=demand,
+            assets=assets,
+            template=template,
+            loader=loader,
+        )
 
 
 ##### Resources
@@ -188,6 +260,7 @@ class ResourceTypes:
     AWS_IAM_UserToGroupAddition = "AWS::IAM::UserToGroupAddition"
     AWS_IAM_VirtualMFADevice = "AWS::IAM::VirtualMFADevice"
     AWS_CDK_Metadata = "AWS::CDK::Metadata"
+    AWS_CloudFormation_Stack = "AWS::CloudFormation::Stack"
 
 
 class Resource(abc.ABC):
@@ -210,19 +283,30 @@ class Resource(abc.ABC):
     def arn(self) -> Arn:
         raise NotImplementedError
 
-    # TODO this could be a fxn name or an ARN or (https://docs.aws.amazon.com/AWSCloudFormation/latest/UserGuide/aws-resource-lambda-eventsourcemapping.html#cfn-lambda-eventsourcemapping-functionname)
+    @abc.abstractmethod
+    def replicate(
+        self, region: Region, account: Account, translate: Translate
+    ) -> Resource:
+        """
+        Creates (and registers) a copy of this resource in another region and
+        account, e.g. for another target of the same template.
+        """
+        raise NotImplementedError
+
     def find_lambda_by_name(self, lambda_name: str) -> Optional[AWSLambdaFunction]:
         """
-        Finding Lambda by name is a common thing.
-        This will find the ARN of the Lambda with this name within the same region and account.
+        Finds the Lambda that a function name refers to, as in the
+        `FunctionName` of an event source mapping (https://docs.aws.amazon.com/AWSCloudFormation/latest/UserGuide/aws-resource-lambda-eventsourcemapping.html#cfn-lambda-eventsourcemapping-functionname):
+        a name, found within the same region and account, a function ARN
+        (possibly qualified with a version or an alias) or a partial ARN.
         """
-        lambda_arn = ArnBuilder.AWSLambdaFunctionArn(
-            self.region, self.account, lambda_name
+        key = lambda_function_key(
+            lambda_name,
+            str(self.region.partition),
+            str(self.region),
+            self.account.account_id,
         )
-        if lambda_arn in self.aws.arns:
-            return cast(AWSLambdaFunction, self.aws[lambda_arn])
-        else:
-            return None
+        return cast(Optional[AWSLambdaFunction], self.aws.index.find(key))
 
 
 class LambdaEventSource(abc.ABC):
@@ -235,16 +319,36 @@ class LambdaEventSource(abc.ABC):
     def add_event_source_mapping(
         self, event_source_mapping: LambdaEventSourceMapping
     ) -> None:
+        event_source_mapping.event_source = self
         self.event_source_mappings.append(event_source_mapping)
 
+    def remove_event_source_mapping(
+        self, event_source_mapping: LambdaEventSourceMapping
+    ) -> None:
+        self.event_source_mappings.remove(event_source_mapping)
+
 
 class LambdaEventSourceMapping:
     function_name: str
     event_source_arn: Arn
+    event_source: Optional[LambdaEventSource]
 
     def __init__(self, function_name: str, event_source_arn: Arn) -> None:
         self.function_name = function_name
         self.event_source_arn = event_source_arn
+        self.event_source = None
+
+    def replicate(self, translate: Translate) -> LambdaEventSourceMapping:
+        """Copies the mapping, and adds the copy to the replica of its event source."""
+        mapping = LambdaEventSourceMapping(
+            function_name=translate(self.function_name),
+            event_source_arn=translate(self.event_source_arn),
+        )
+        if self.event_source is not None:
+            source = cast(Resource, self.event_source)
+            replica = source.aws[translate(source.arn)]
+            cast(LambdaEventSource, replica).add_event_source_mapping(mapping)
+        return mapping
 
     @staticmethod
     def from_cloudformation_stack(
@@ -288,6 +392,18 @@ class AWSLambdaFunction(Resource):
             self.region, self.account, self.function_name
         )
 
+    def replicate(
+        self, region: Region, account: Account, translate: Translate
+    ) -> AWSLambdaFunction:
+        return AWSLambdaFunction(
+            self.aws,
+            region,
+            account,
+            self.function_name,
+            environment=map_strings_in_cfn_value(self.environment, translate),
+            logical_id=self.logical_id,
+        )
+
     @staticmethod
     def from_cloudformation_stack(
         stack: CloudFormationStack, logical_id: str, body: CfnValue
@@ -311,7 +427,7 @@ class AWSLambdaFunction(Resource):
             stack.account,
             function_name,
             environment=environment,
-            logical_id=logical_id,
+            logical_id=stack.qualify(logical_id),
         )
         stack.refs[logical_id] = str(r.arn)
         stack.atts[logical_id]["Arn"] = r.function_name
@@ -349,6 +465,13 @@ class AWSSQSQueue(Resource, LambdaEventSource):
     def arn(self) -> Arn:
         return ArnBuilder.AWSSQSQueueArn(self.region, self.account, self.queue_name)
 
+    def replicate(
+        self, region: Region, account: Account, translate: Translate
+    ) -> AWSSQSQueue:
+        return AWSSQSQueue(
+            self.aws, region, account, self.queue_name, logical_id=self.logical_id
+        )
+
     @staticmethod
     def from_cloudformation_stack(
         stack: CloudFormationStack, logical_id: str, body: CfnValue
@@ -362,7 +485,11 @@ class AWSSQSQueue(Resource, LambdaEventSource):
 
         queue_name: str = prop["QueueName"]
         r = AWSSQSQueue(
-            stack.aws, stack.region, stack.account, queue_name, logical_id=logical_id
+            stack.aws,
+            stack.region,
+            stack.account,
+            queue_name,
+            logical_id=stack.qualify(logical_id),
         )
         stack.refs[logical_id] = r.queue_url
         stack.atts[logical_id]["Arn"] = str(r.arn)
@@ -376,6 +503,16 @@ class CloudFormationTemplateError(Exception):
     pass
 
 
+# the properties that `from_cloudformation_stack` reads, by resource type.
+# Streaming loads keep nothing else.
+MODELED_PROPERTIES: dict[str, tuple[str, ...]] = {
+    ResourceTypes.AWS_Lambda_Function: ("FunctionName", "Environment"),
+    ResourceTypes.AWS_SQS_Queue: ("QueueName",),
+    ResourceTypes.AWS_Lambda_EventSourceMapping: ("FunctionName", "EventSourceArn"),
+    ResourceTypes.AWS_CloudFormation_Stack: ("TemplateURL", "Parameters"),
+}
+
+
 class CloudFormationStack:
     """A CloudFormation Stack, usually instantiated from a CloudFormation template file."""
 
@@ -389,6 +526,19 @@ class CloudFormationStack:
     logical_ids_by_dependency_order: list[str]
     refs: dict[str, str]
     atts: defaultdict[str, dict[str, str]]
+    event_source_mappings: dict[str, LambdaEventSourceMapping]
+    # lazy stacks only materialize the resources that the demanded logical
+    # ids reach; the others are kept as stubs (their unresolved bodies)
+    demand: Optional[set[str]]
+    stubs: dict[str, CfnValue]
+    # nested stacks, by logical id, and their resources' logical ids prefix
+    # in the registry (`Child.`; "" for the root stack)
+    nested: dict[str, CloudFormationStack]
+    prefix: str
+    outputs: dict[str, CfnValue]
+    loader: Optional[TemplateLoader]
+    # the files of the templates of the stacks that nest this one
+    ancestors: tuple[str, ...]
 
     def __init__(
         self,
@@ -397,7 +547,39 @@ class CloudFormationStack:
         account: Account,
         template: CfnValue,
         path: str | os.PathLike[Any] = "",
+        keep_template: bool = True,
+        demand: Optional[Iterable[str]] = None,
+        parameters: Optional[dict[str, CfnValue]] = None,
+        prefix: str = "",
+        loader: Optional[TemplateLoader] = None,
+        ancestors: tuple[str, ...] = (),
     ):
+        """
+        Args:
+        - aws (AWS): The registry to create the resources in.
+        - region (Region): The region the stack is deployed to.
+        - account (Account): The account the stack is deployed to.
+        - template (CfnValue): The parsed template. Resource bodies are
+          resolved in place.
+        - path: Where the template comes from, for messages.
+        - keep_template (bool): Keep the template once the resources are created.
+        - demand (Optional[Iterable[str]]): Only materialize these logical ids
+          and the modeled resources they reach in the dependency graph
+          (see `reachable`), e.g. the resources of an estimates file. By
+          default, every resource is materialized. Nested stacks that are
+          materialized are materialized whole.
+        - parameters (Optional[dict[str, CfnValue]]): Values of the
+          template's parameters, e.g. those a parent stack passes to a nested
+          stack. Parameters without one take their `Default`.
+        - prefix (str): Prefix of the logical ids of the stack's resources in
+          the registry, for nested stacks (see `cloudcap.nested`).
+        - loader (Optional[TemplateLoader]): Loads the templates of nested
+          stacks. Defaults to a new one, for this stack's tree.
+        - ancestors (tuple[str, ...]): The files of the templates of the
+          stacks that nest this one, to tell cycles of nested stacks.
+        """
+        from cloudcap.nested import TemplateLoader, nested_stacks
+
         self.aws = aws
         self.region = region
         self.account = account
@@ -405,21 +587,225 @@ class CloudFormationStack:
         self.path = path
         self.refs = {}
         self.atts = defaultdict(lambda: {})
-        self._init_dependency_graph()
+        self.event_source_mappings = {}
+        self.demand = set(demand) if demand is not None else None
+        self.stubs = {}
+        self.nested = {}
+        self.prefix = prefix
+        self.outputs = {}
+        self.ancestors = ancestors
+        self._keep_template = keep_template
+        self._init_parameters(parameters or {})
+        with profiling.span("dependency_graph"):
+            self._init_dependency_graph()
         # instantiate the resources in order, and register them at aws
         resources = self.template["Resources"]
-        for logical_id in self.logical_ids_by_dependency_order:
-            self.create_resource(logical_id, resources[logical_id])
+        materialize = self.reachable(self.demand) if self.demand is not None else None
+        own_loader = loader is None and any(nested_stacks(self.template))
+        self.loader = TemplateLoader() if own_loader else loader
+        try:
+            # nested templates load while the resources before them are created
+            for logical_id, body in resources.items():
+                nested_path = self._nested_template(body)
+                if nested_path and (materialize is None or logical_id in materialize):
+                    self.loader.prefetch(nested_path)  # type: ignore
+            with profiling.span("create_resources"):
+                for logical_id in self.logical_ids_by_dependency_order:
+                    if materialize is None or logical_id in materialize:
+                        self.create_resource(logical_id, resources[logical_id])
+                    else:
+                        self.stubs[logical_id] = resources[logical_id]
+        finally:
+            if own_loader:
+                self.loader.close()  # type: ignore
+        self._init_outputs()
+        if not prefix:
+            stacks = list(self.stacks())
+            profiling.count(
+                "resources",
+                sum(
+                    len(s.logical_ids_by_dependency_order) - len(s.stubs)
+                    for s in stacks
+                ),
+            )
+            profiling.count("stubs", len(self.stubs))
+            profiling.count("nested_stacks", len(stacks) - 1)
+            profiling.count(
+                "dependency_edges",
+                sum(s.dependency_graph.number_of_edges() for s in stacks),
+            )
+        if not keep_template:
+            # the resources are created: don't hold on to the raw template
+            self.template = {}
+
+    def reachable(self, logical_ids: Iterable[str]) -> set[str]:
+        """
+        The logical ids that the given ones reach through modeled resources.
+
+        Walks the dependency graph in both directions (what a resource refers
+        to, and what refers to it), but only through resources of a modeled
+        type: an unmodeled resource, e.g. an `AWS::SNS::Topic`, ends the walk.
+        The logical id of a nested stack's resource (`Child.Queue`) reaches
+        the nested stack. Logical ids that are not in the template are
+        ignored.
+
+        Raises:
+        - UnknownResourceError: If one of the given resources isn't modeled.
+        """
+        from cloudcap.nested import SEPARATOR
+
+        resources = self.template["Resources"]
+
+        def rtype(logical_id: str) -> Optional[str]:
+            body = resources[logical_id]
+            return body.get("Type") if isinstance(body, dict) else None
+
+        def modeled(logical_id: str) -> bool:
+            return rtype(logical_id) in MODELED_PROPERTIES
+
+        seen = {
+            logical_id.split(SEPARATOR, 1)[0]
+            for logical_id in logical_ids
+            if logical_id.split(SEPARATOR, 1)[0] in resources
+        }
+        unmodeled = sorted(i for i in seen if not modeled(i))
+        if unmodeled:
+            raise UnknownResourceError(
+                f"{len(unmodeled)} estimated resources are not of a modeled type: "
+                + ", ".join(f"{self.qualify(i)} ({rtype(i)})" for i in unmodeled)
+            )
+        todo = list(seen)
+        while todo:
+            logical_id = todo.pop()
+            for neighbor in itertools.chain(
+                self.dependency_graph.predecessors(logical_id),  # type: ignore
+                self.dependency_graph.successors(logical_id),  # type: ignore
+            ):
+                if neighbor not in seen and modeled(neighbor):
+                    seen.add(neighbor)
+                    todo.append(neighbor)
+        return seen
+
+    def qualify(self, logical_id: str) -> str:
+        """The logical id of one of the stack's resources in the registry."""
+        return self.prefix + logical_id
+
+    def stacks(self) -> Iterator[CloudFormationStack]:
+        """This stack and its nested stacks, parents first."""
+        yield self
+        for child in self.nested.values():
+            yield from child.stacks()
+
+    def created_resources(self) -> list[Resource]:
+        """The resources that this stack and its nested stacks created."""
+        return [
+            self.aws.logical_id_to_resource[stack.qualify(logical_id)]
+            for stack in self.stacks()
+            for logical_id in stack.logical_ids_by_dependency_order
+            if stack.qualify(logical_id) in self.aws.logical_id_to_resource
+        ]
+
+    def _init_parameters(self, parameters: dict[str, CfnValue]) -> None:
+        # pseudo parameters
+        self.refs["AWS::Region"] = str(self.region)
+        self.refs["AWS::AccountId"] = self.account.account_id
+        self.refs["AWS::Partition"] = str(self.region.partition)
+        self.refs["AWS::URLSuffix"] = (
+            "amazonaws.com.cn"
+            if self.region.partition is Partitions.aws_cn
+            else "amazonaws.com"
+        )
+        declared = self.template.get("Parameters") or {}
+        for name, declaration in declared.items():
+            if name in parameters:
+                self.refs[name] = parameters[name]  # type: ignore
+            elif isinstance(declaration, dict) and "Default" in declaration:
+                self.refs[name] = declaration["Default"]
+        for name in parameters.keys() - declared.keys():
+            logger.warning("%s: unknown parameter %s", self.path, name)
+
+    def _init_outputs(self) -> None:
+        for name, output in (self.template.get("Outputs") or {}).items():
+            if not isinstance(output, dict) or "Value" not in output:
+                continue
+            try:
+                self.outputs[name] = self.resolve_intrinsic_functions(output["Value"])
+            except KeyError as e:
+                # refers to something that isn't modeled
+                logger.debug("%s: output %s not resolved (%s)", self.path, name, e)
+
+    def _nested_template(self, body: CfnValue) -> Optional[str]:
+        """The file of a nested stack's template, if `body` is a nested stack."""
+        if not isinstance(body, dict):
+            return None
+        if body.get("Type") != ResourceTypes.AWS_CloudFormation_Stack:
+            return None
+        if self.loader is None:
+            # e.g. the first nested stack of an updated template
+            from cloudcap.nested import TemplateLoader
+
+            self.loader = TemplateLoader()
+        return self.loader.template_path(self.path, body)
+
+    def _create_nested_stack(
+        self, logical_id: str, body: CfnValue
+    ) -> CloudFormationStack:
+        from cloudcap.nested import SEPARATOR
+
+        path = self._nested_template(body)
+        if path is None:
+            raise CloudFormationTemplateError(
+                f"{self.path}: nested stack {logical_id} has no TemplateURL"
+            )
+        ancestors = self.ancestors
+        if self.path:
+            ancestors += (os.path.realpath(self.path),)
+        if os.path.realpath(path) in ancestors:
+            raise CloudFormationTemplateError(
+                f"{self.path}: nested stack {logical_id} nests its own template: {path}"
+            )
+        try:
+            template = self.loader.get(path)  # type: ignore[union-attr]
+        except OSError as e:
+            raise CloudFormationTemplateError(
+                f"{self.path}: template of nested stack {logical_id} not found: {path}"
+            ) from e
+        prop = body.get("Properties") or {}
+        child = CloudFormationStack(
+            self.aws,
+            self.region,
+            self.account,
+            template,
+            path,
+            keep_template=self._keep_template,
+            parameters=prop.get("Parameters") or {},
+            prefix=self.qualify(logical_id) + SEPARATOR,
+            loader=self.loader,
+            ancestors=ancestors,
+        )
+        self.nested[logical_id] = child
+        self.refs[logical_id] = (
+            f"arn:{self.region.partition}:cloudformation:{self.region}:"
+            f"{self.account.account_id}:stack/{self.qualify(logical_id)}"
+        )
+        for name, value in child.outputs.items():
+            self.atts[logical_id][f"Outputs.{name}"] = value  # type: ignore
+        logger.debug("created nested stack %s from %s", self.qualify(logical_id), path)
+        return child
 
     def _init_dependency_graph(self) -> None:
+        import networkx as nx
+
         self.dependency_graph = nx.DiGraph()
         resources = self.template["Resources"]
         for r in resources:
             self.dependency_graph.add_node(r)  # type: ignore
 
-        for r1 in resources:
-            for r2, r2_body in resources.items():
-                if exists_in_cfn_value(r2_body, r1):
+        # r2 depends on r1 if r1's logical id occurs in r2's body.
+        # Each body is only traversed once.
+        for r2, r2_body in resources.items():
+            for r1 in strings_in_cfn_value(r2_body):
+                if r1 in resources:
                     self.dependency_graph.add_edge(r1, r2)  # type: ignore
 
         try:
@@ -443,25 +829,185 @@ class CloudFormationStack:
             self.logical_ids_by_dependency_order,
         )
 
-    def create_resource(self, logical_id: str, body: CfnValue) -> None:
-        body = self.resolve_intrinsic_functions(body)
+    def create_resource(
+        self, logical_id: str, body: CfnValue
+    ) -> Resource | LambdaEventSourceMapping | CloudFormationStack:
+        with profiling.span("intrinsic_resolution"):
+            body = self.resolve_intrinsic_functions(body)
         rtype = body["Type"]
         assert isinstance(rtype, str)
         match rtype:
             case ResourceTypes.AWS_Lambda_Function:
-                self.aws.logical_id_to_resource[logical_id] = (
-                    AWSLambdaFunction.from_cloudformation_stack(self, logical_id, body)
-                )
+                r = AWSLambdaFunction.from_cloudformation_stack(self, logical_id, body)
+                self.aws.logical_id_to_resource[self.qualify(logical_id)] = r
+                return r
             case ResourceTypes.AWS_SQS_Queue:
-                self.aws.logical_id_to_resource[logical_id] = (
-                    AWSSQSQueue.from_cloudformation_stack(self, logical_id, body)
-                )
+                r = AWSSQSQueue.from_cloudformation_stack(self, logical_id, body)
+                self.aws.logical_id_to_resource[self.qualify(logical_id)] = r
+                return r
+            case ResourceTypes.AWS_CloudFormation_Stack:
+                return self._create_nested_stack(logical_id, body)
             case ResourceTypes.AWS_Lambda_EventSourceMapping:
-                LambdaEventSourceMapping.from_cloudformation_stack(
+                mapping = LambdaEventSourceMapping.from_cloudformation_stack(
                     self, logical_id, body
                 )
+                self.event_source_mappings[logical_id] = mapping
+                return mapping
             case _:
-                raise UnknownResourceError(f"{rtype}")
+                raise UnknownResourceError(
+                    f"{self.qualify(logical_id)} ({rtype}) is not of a modeled type"
+                )
+
+    def update(
+        self, template: CfnValue, changed: Iterable[str]
+    ) -> tuple[list[Resource], list[Resource]]:
+        """
+        Loads a new revision of the template, re-creating only the resources
+        that changed and the resources that depend on them.
+
+        Args:
+        - template (CfnValue): The new revision of the template.
+        - changed (Iterable[str]): Logical ids that were added, removed or
+          whose body changed since the current revision.
+
+        Returns:
+        - tuple[list[Resource], list[Resource]]: The resources that were
+          removed from the registry, and the resources that need to be
+          constrained again (re-created ones, and event sources whose
+          mappings changed).
+        """
+        import networkx as nx
+
+        old_graph = self.dependency_graph
+        self.template = template
+        self._init_dependency_graph()
+
+        affected = set(changed)
+        materialize = None
+        if self.demand is not None:
+            materialize = self.reachable(self.demand)
+            # stubs that a change made reachable are materialized (and so
+            # their dependents are re-created, to resolve them)
+            affected |= {
+                logical_id
+                for logical_id in self.stubs
+                if logical_id in materialize and logical_id not in affected
+            }
+        for logical_id in list(affected):
+            for graph in (old_graph, self.dependency_graph):
+                if logical_id in graph:
+                    affected |= nx.descendants(graph, logical_id)  # type: ignore
+
+        removed: list[Resource] = []
+        dirty: list[Resource] = []
+        for logical_id in affected:
+            self.refs.pop(logical_id, None)
+            self.atts.pop(logical_id, None)
+            if self.qualify(logical_id) in self.aws.logical_id_to_resource:
+                removed.append(
+                    self.aws.logical_id_to_resource[self.qualify(logical_id)]
+                )
+            mappings = [self.event_source_mappings.pop(logical_id, None)]
+            if logical_id in self.nested:
+                # re-created whole, from its template
+                child = self.nested.pop(logical_id)
+                removed.extend(child.created_resources())
+                for stack in child.stacks():
+                    mappings.extend(stack.event_source_mappings.values())
+            for mapping in mappings:
+                if mapping and mapping.event_source:
+                    mapping.event_source.remove_event_source_mapping(mapping)
+                    dirty.append(cast(Resource, mapping.event_source))
+        self.aws.unregister_resources(removed)
+
+        try:
+            resources = self.template["Resources"]
+            for logical_id in affected:
+                self.stubs.pop(logical_id, None)
+            for logical_id in self.logical_ids_by_dependency_order:
+                if logical_id not in affected:
+                    continue
+                if materialize is not None and logical_id not in materialize:
+                    self.stubs[logical_id] = resources[logical_id]
+                    continue
+                created = self.create_resource(logical_id, resources[logical_id])
+                if isinstance(created, LambdaEventSourceMapping):
+                    dirty.append(cast(Resource, created.event_source))
+                elif isinstance(created, CloudFormationStack):
+                    dirty.extend(created.created_resources())
+                    for stack in created.stacks():
+                        for mapping in stack.event_source_mappings.values():
+                            dirty.append(cast(Resource, mapping.event_source))
+                else:
+                    dirty.append(created)
+        finally:
+            # a nested stack may have been (re-)created: the loader's pool is
+            # only needed meanwhile
+            if self.loader is not None:
+                self.loader.close()
+
+        logger.debug(
+            "CloudFormation template (%s) updated: re-created %s", self.path, affected
+        )
+        stale = {id(r) for r in removed}
+        dirty = list({id(r): r for r in dirty if id(r) not in stale}.values())
+        return removed, dirty
+
+    def replicate(self, region: Region, account: Account) -> dict[Resource, Resource]:
+        """
+        Deploys the stack's resources again, to another region and account,
+        without loading or resolving the template again: each resource is
+        copied with only the ARNs and URLs it refers to substituted.
+
+        Returns:
+        - dict[Resource, Resource]: The replicas, by the resource they copy.
+        """
+        names: dict[str, str] = {}
+
+        def translate(name: str) -> str:
+            return names.get(name, name)
+
+        replicas: dict[Resource, Resource] = {}
+        self._replicate_resources(region, account, translate, names, replicas)
+        for stack in self.stacks():
+            for mapping in stack.event_source_mappings.values():
+                if mapping.event_source in replicas:
+                    mapping.replicate(translate)
+        logger.debug(
+            "CloudFormation template (%s) replicated to (%s, %s)",
+            self.path,
+            region,
+            account.account_id,
+        )
+        return replicas
+
+    def _replicate_resources(
+        self,
+        region: Region,
+        account: Account,
+        translate: Translate,
+        names: dict[str, str],
+        replicas: dict[Resource, Resource],
+    ) -> None:
+        for logical_id in self.logical_ids_by_dependency_order:
+            if logical_id in self.nested:
+                self.nested[logical_id]._replicate_resources(
+                    region, account, translate, names, replicas
+                )
+                continue
+            r = self.aws.logical_id_to_resource.get(self.qualify(logical_id))
+            if (
+                r is None
+                or r.region is not self.region
+                or r.account is not self.account
+            ):
+                # a stub, an event source mapping, or another stack's
+                continue
+            replica = r.replicate(region, account, translate)
+            replicas[r] = replica
+            names[r.arn] = replica.arn
+            if isinstance(r, AWSSQSQueue):
+                names[r.queue_url] = cast(AWSSQSQueue, replica).queue_url
 
     def resolve_intrinsic_functions(self, body: CfnValue) -> CfnValue:
         """
@@ -483,6 +1029,8 @@ class CloudFormationStack:
                 for k, v in _body.items():
                     if k == "Ref":
                         # v is the logical id
+                        if v in self.stubs:
+                            return _body
                         return self.refs[v]
                     elif k == "Fn::GetAtt":
                         try:
@@ -490,6 +1038,9 @@ class CloudFormationStack:
                             attribute_name = v[1]
                         except Exception as e:
                             raise InvalidCloudFormationTemplate from e
+                        if logical_id in self.stubs:
+                            # not materialized: left unresolved
+                            return _body
                         return self.atts[logical_id][attribute_name]
                 for k, v in _body.items():
                     _body[k] = rec(v)
@@ -505,22 +1056,121 @@ class CloudFormationStack:
 
     @classmethod
     def from_file(
-        cls, aws: AWS, region: Region, account: Account, path: str | os.PathLike[Any]
+        cls,
+        aws: AWS,
+        region: Region,
+        account: Account,
+        path: str | os.PathLike[Any],
+        streaming: bool = False,
+        demand: Optional[Iterable[str]] = None,
+        assets: Optional[str] = None,
+        template: Optional[CfnValue] = None,
+        loader: Optional[TemplateLoader] = None,
     ) -> CloudFormationStack:
-        with open(path, "r", encoding="utf-8") as f:
+        """
+        Loads a template and creates its stack (see `load`). Nested stacks'
+        templates are loaded from `assets`, or from the template's directory
+        (see `cloudcap.nested`).
+
+        `template` is the template of `path`, if it is loaded already, e.g. to
+        be fingerprinted first (which must happen before the stack resolves it
+        in place), and `loader` a loader of nested templates to share, e.g.
+        with `fingerprint`. The caller closes a loader that it passes.
+        """
+        from cloudcap.nested import TemplateLoader
+
+        shared = loader is not None
+        if loader is None:
+            loader = TemplateLoader(streaming=streaming, assets=assets)
+        try:
+            return cls(
+                aws,
+                region,
+                account,
+                cls.load(path, streaming) if template is None else template,
+                path,
+                keep_template=not streaming,
+                demand=demand,
+                loader=loader,
+            )
+        finally:
+            if not shared:
+                loader.close()
+
+    @staticmethod
+    def load(path: str | os.PathLike[Any], streaming: bool = False) -> CfnValue:
+        """
+        Loads a CloudFormation template (YAML or JSON) from a file.
+
+        Args:
+        - path: The template file.
+        - streaming (bool): Parse the file as a stream, and only keep the
+          resources' types and their `MODELED_PROPERTIES` (see
+          `cloudcap.cfn_stream`). Memory then scales with what the analysis
+          models rather than with the size of the file.
+
+        Returns:
+        - CfnValue: The template.
+        """
+        with profiling.span("load"):
+            if streaming:
+                data = CloudFormationStack._load_streaming(path)
+            else:
+                data = CloudFormationStack._load_full(path)
+
+        if not isinstance(data, dict) or "Resources" not in data:
+            raise CloudFormationTemplateError(
+                f"{path} is not a CloudFormation template: it has no Resources"
+            )
+        return data
+
+    @staticmethod
+    def _load_streaming(path: str | os.PathLike[Any]) -> CfnValue:
+        from cloudcap import cfn_stream
+
+        try:
+            data = cfn_stream.load_resources(path, MODELED_PROPERTIES)
+        except yaml.YAMLError as e:
+            # e.g. JSON that isn't valid YAML: load all of it, then prune
+            logger.warning("Unable to stream %s (%s), loading it whole", path, e)
+            return cfn_stream.prune(
+                CloudFormationStack._load_full(path), MODELED_PROPERTIES
+            )
+        logger.info("Streamed the modeled resources of %s", path)
+        return data
+
+    @staticmethod
+    def _load_full(path: str | os.PathLike[Any]) -> CfnValue:
+        with compression.open_file(path) as f:
+            text = f.read()
+        return CloudFormationStack._parse(text, path)
+
+    @staticmethod
+    def loads(text: str) -> CfnValue:
+        """Loads a CloudFormation template (YAML or JSON) from a string."""
+        data = CloudFormationStack._parse(text, "<string>")
+        if not isinstance(data, dict) or "Resources" not in data:
+            raise CloudFormationTemplateError(
+                "not a CloudFormation template: it has no Resources"
+            )
+        return data
+
+    @staticmethod
+    def _parse(text: str, path: str | os.PathLike[Any]) -> CfnValue:
+        import cfn_flip  # type: ignore
+
+        try:
+            data = cfn_flip.load_yaml(text)  # type: ignore
+            logger.info("Loaded %s as CloudFormation template in YAML format", path)
+        except yaml.YAMLError:
             try:
-                data = cfn_flip.load_yaml(f)  # type: ignore
-                logger.info("Loaded %s as CloudFormation template in YAML format", path)
-            except yaml.YAMLError:
-                try:
-                    data = cfn_flip.load_json(f)  # type: ignore
-                    logger.info(
-                        "Loaded %s as a CloudFormation template in JSON format", path
-                    )
-                except json.JSONDecodeError:
-                    # pylint: disable=raise-missing-from
-                    raise CloudFormationTemplateError(
-                        f"Unable to load {path} as a CloudFormation template"
-                    )
-
-        return cls(aws, region, account, data, path)
+                data = cfn_flip.load_json(text)  # type: ignore
+                logger.info(
+                    "Loaded %s as a CloudFormation template in JSON format", path
+                )
+            except json.JSONDecodeError:
+                # pylint: disable=raise-missing-from
+                raise CloudFormationTemplateError(
+                    f"Unable to load {path} as a CloudFormation template"
+                )
+        return data
@@ -0,0 +1,255 @@
+"""
+Batch analysis of many (template, estimates) pairs across a process pool.
+"""
+
+from __future__ import annotations
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Iterable, Iterator, Optional, TextIO, TYPE_CHECKING
+
+import yaml
+
+if TYPE_CHECKING:
+    from cloudcap.analyzer import Analyzer
+
+logger = logging.getLogger(__name__)
+
+# a (template path, estimates path) pair
+Pair = tuple[str, str]
+# one JSON Lines record
+Result = dict[str, Any]
+
+TEMPLATE_SUFFIXES = (".yaml", ".yml", ".json")
+ESTIMATES_MARKER = ".estimates"
+
+ERROR = "ERROR"
+
+
+def discover_pairs(path: str | os.PathLike[Any]) -> list[Pair]:
+    """
+    Finds the (template, estimates) pairs to analyze.
+
+    Args:
+    - path: Either a manifest file or a directory.
+      A manifest is a YAML or JSON list of ``{template: ..., estimates: ...}``
+      mappings, with relative paths resolved against the manifest's directory.
+      In a directory, every ``<name>[.<scenario>].estimates.<ext>`` file is
+      paired with the template ``<name>.<ext>`` (``.yaml``, ``.yml`` or ``.json``).
+
+    Returns:
+    - list[Pair]: The pairs, in a deterministic order.
+    """
+    if os.path.isdir(path):
+        return _discover_directory(path)
+    return _load_manifest(path)
+
+
+def _load_manifest(path: str | os.PathLike[Any]) -> list[Pair]:
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding="utf-8") as f:
+        entries = yaml.safe_load(f) or []
+    if not isinstance(entries, list):
+        raise ValueError(f"{path}: a manifest must be a list of pairs")
+
+    pairs: list[Pair] = []
+    for entry in entries:
+        try:
+            template, estimates = entry["template"], entry["estimates"]
+        except (TypeError, KeyError) as e:
+            raise ValueError(
+                f"{path}: manifest entries need a template and an estimates path, got {entry}"
+            ) from e
+        pairs.append((os.path.join(base, template), os.path.join(base, estimates)))
+    return pairs
+
+
+def _discover_directory(path: str | os.PathLike[Any]) -> list[Pair]:
+    pairs: list[Pair] = []
+    for name in sorted(os.listdir(path)):
+        stem, ext = os.path.splitext(name)
+        if ext not in TEMPLATE_SUFFIXES or not stem.endswith(ESTIMATES_MARKER):
+            continue
+        # <name>.estimates, or else <name>.<scenario>.estimates; names can
+        # have dots of their own
+        base = stem[: -len(ESTIMATES_MARKER)]
+        candidates = [base]
+        if "." in base:
+            candidates.append(base.rsplit(".", 1)[0])
+        template = next(
+            (
+                os.path.join(path, candidate + suffix)
+                for candidate in candidates
+                for suffix in TEMPLATE_SUFFIXES
+                if os.path.isfile(os.path.join(path, candidate + suffix))
+            ),
+            None,
+        )
+        if template is not None:
+            pairs.append((template, os.path.join(path, name)))
+        else:
+            logger.warning("%s has no matching template in %s", name, path)
+    return pairs
+
+
+def group_by_template(pairs: Iterable[Pair]) -> dict[str, list[Pair]]:
+    """
+    Groups pairs whose templates are byte-identical, so that each distinct
+    template is only parsed and constrained once.
+
+    Returns:
+    - dict[str, list[Pair]]: The pairs, keyed by the template's content hash.
+    """
+    groups: defaultdict[str, list[Pair]] = defaultdict(list)
+    digests: dict[str, str] = {}
+    for template, estimates_file in pairs:
+        if template not in digests:
+            try:
+                with open(template, "rb") as f:
+                    digests[template] = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                # reported by the worker, keyed by its path
+                digests[template] = template
+        groups[digests[template]].append((template, estimates_file))
+    return groups
+
+
+def analyze_template(pairs: list[Pair]) -> list[Result]:
+    """
+    Analyzes pairs that share one template.
+
+    The template is parsed and constrained once; every estimates file is then
+    checked in its own solver scope. Runs in a worker process.
+    """
+    start = time.perf_counter()
+    try:
+        analyzer = prepare(pairs[0][0])
+    except Exception as e:  # pylint: disable=broad-except
+        return setup_failed(pairs, time.perf_counter() - start, e)
+    return check_pairs(analyzer, pairs, time.perf_counter() - start)
+
+
+def prepare(template: str) -> Analyzer:
+    """Parses and constrains a template, ready to check estimates against."""
+    from cloudcap.analyzer import Analyzer
+    from cloudcap.aws import AWS, Regions, Account
+
+    aws = AWS()
+    deployment = aws.add_deployment(Regions.us_east_1, Account("123"))
+    deployment.from_cloudformation_template(path=template)
+    analyzer = Analyzer(aws)
+    analyzer.constrain()
+    return analyzer
+
+
+def check_pairs(
+    analyzer: Analyzer, pairs: list[Pair], setup_seconds: float
+) -> list[Result]:
+    """Checks each pair's estimates against the analyzer of their template."""
+    from cloudcap import estimates
+
+    results: list[Result] = []
+    for t, estimates_file in pairs:
+        start = time.perf_counter()
+        try:
+            status = analyzer.check(estimates.load(estimates_file)).name
+            error = None
+        except Exception as e:  # pylint: disable=broad-except
+            status, error = ERROR, e
+        seconds = time.perf_counter() - start
+        results.append(
+            _result(t, estimates_file, status, seconds, setup_seconds, error)
+        )
+    return results
+
+
+def setup_failed(pairs: list[Pair], seconds: float, error: Exception) -> list[Result]:
+    """The results of pairs whose template couldn't be set up."""
+    return [
+        _result(t, est, ERROR, seconds, setup_seconds=seconds, error=error)
+        for t, est in pairs
+    ]
+
+
+def _result(
+    template: str,
+    estimates_file: str,
+    status: str,
+    seconds: float,
+    setup_seconds: float,
+    error: Optional[Exception] = None,
+) -> Result:
+    return {
+        "template": template,
+        "estimates": estimates_file,
+        "status": status,
+        "seconds": round(seconds, 6),
+        "setup_seconds": round(setup_seconds, 6),
+        "error": f"{type(error).__name__}: {error}" if error else None,
+    }
+
+
+def analyze_many(
+    pairs: Iterable[Pair], workers: Optional[int] = None
+) -> Iterator[Result]:
+    """
+    Analyzes pairs across a pool of worker processes.
+
+    Args:
+    - pairs (Iterable[Pair]): The (template, estimates) pairs to analyze.
+    - workers (Optional[int]): Number of worker processes. Defaults to the
+      number of CPUs.
+
+    Returns:
+    - Iterator[Result]: One result per pair, yielded as soon as the pair's
+      shard is done (so not in input order).
+    """
+    groups = list(group_by_template(pairs).values())
+    if not groups:
+        return
+    workers = workers or os.cpu_count() or 1
+    # the pairs of a template are split between workers when there are fewer
+    # templates than workers; each shard constrains the template once
+    size = math.ceil(sum(len(group) for group in groups) / workers)
+    shards = [
+        group[i : i + size] for group in groups for i in range(0, len(group), size)
+    ]
+    workers = min(workers, len(shards))
+    logger.info(
+        "analyzing %d templates in %d shards on %d workers",
+        len(groups),
+        len(shards),
+        workers,
+    )
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analyze_template, shard): shard for shard in shards}
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                # the worker itself died
+                results = [
+                    _result(t, est, ERROR, 0.0, 0.0, error=e)
+                    for t, est in futures[future]
+                ]
+            yield from results
+
+
+def write_jsonl(results: Iterable[Result], out: TextIO) -> dict[str, int]:
+    """
+    Writes results as JSON Lines, flushing after each line.
+
+    Returns:
+    - dict[str, int]: Number of results per status.
+    """
+    counts: defaultdict[str, int] = defaultdict(int)
+    for result in results:
+        counts[result["status"]] += 1
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+    return dict(counts)
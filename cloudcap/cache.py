@@ -0,0 +1,207 @@
+"""
+Cache of analysis results, keyed by what determines them: the fingerprint of
+the template (see `cloudcap.fingerprint`) and the estimates, the targets
+they are deployed to, and the versions of cloudcap and of its plugins.
+
+Results are kept in an in-process LRU (for long-lived processes such as a
+warm Lambda), backed by a directory of small JSON files that is shared
+between processes and bounded in size: the least recently used entries are
+evicted first.
+"""
+
+from __future__ import annotations
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Iterable, Optional
+
+from cloudcap import __version__
+from cloudcap.estimates import Estimates
+
+logger = logging.getLogger(__name__)
+
+# overrides the default cache directory
+CACHE_DIR_ENV = "CLOUDCAP_CACHE_DIR"
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 64 << 20
+
+_SUFFIX = ".json"
+
+
+class CachedResult:
+    """
+    - result: the name of the `AnalyzerResult` (PASS, REJECT or UNKNOWN).
+    - model: for a PASS, the value of every variable in a satisfying
+      solution, by variable name.
+    """
+
+    result: str
+    model: Optional[dict[str, int]]
+
+    def __init__(self, result: str, model: Optional[dict[str, int]] = None) -> None:
+        self.result = result
+        self.model = model
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"result": self.result, "model": self.model}
+
+    @staticmethod
+    def from_dict(data: dict[str, Any]) -> CachedResult:
+        return CachedResult(data["result"], data.get("model"))
+
+
+def default_directory() -> str:
+    if os.environ.get(CACHE_DIR_ENV):
+        return os.environ[CACHE_DIR_ENV]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "cloudcap")
+
+
+def key(fingerprint: str, estimates: Estimates, targets: Iterable[str] = ()) -> str:
+    """
+    The cache key of an analysis.
+
+    Args:
+    - fingerprint (str): The fingerprint of the CloudFormation template (see
+      `cloudcap.fingerprint`), so that edits that can't change the result
+      share a key.
+    - estimates (Estimates): The loaded estimates, so that the same estimates
+      in another file format or order share a key.
+    - targets (Iterable[str]): The targets the template is deployed to.
+
+    Returns:
+    - str: A hex digest.
+    """
+    from cloudcap.plugins import builtin_plugins
+
+    digest = hashlib.sha256()
+    versions = [__version__] + [
+        f"{p.__module__}.{p.__qualname__}={p.version}" for p in builtin_plugins.plugins
+    ]
+    for part in (
+        json.dumps(versions).encode(),
+        fingerprint.encode(),
+        json.dumps(estimates, sort_keys=True, separators=(",", ":")).encode(),
+        json.dumps(list(targets)).encode(),
+    ):
+        # length-prefixed, so that parts can't run into each other
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    An in-process LRU of analysis results, backed by an on-disk store.
+
+    Args:
+    - directory (Optional[str]): The on-disk store. Defaults to
+      `$CLOUDCAP_CACHE_DIR`, or `cloudcap` in the user's cache directory.
+    - max_entries (int): Size of the in-process LRU.
+    - max_bytes (int): Size limit of the on-disk store.
+    """
+
+    directory: str
+    max_entries: int
+    max_bytes: int
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        self.directory = directory or default_directory()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memory: OrderedDict[str, CachedResult] = OrderedDict()
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cached = CachedResult.from_dict(json.load(f))
+            # recently used: evicted last
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("ignoring unreadable cache entry %s: %s", path, e)
+            return None
+        self._remember(key, cached)
+        return cached
+
+    def put(self, key: str, cached: CachedResult) -> None:
+        self._remember(key, cached)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # written aside and renamed, so that concurrent readers never see
+            # a partial entry
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(cached.to_dict(), f, separators=(",", ":"))
+            os.replace(tmp, self._path(key))
+            self._evict()
+        except OSError as e:
+            # a read-only or full disk only loses the cache
+            logger.warning("could not write to the cache in %s: %s", self.directory, e)
+
+    def clear(self) -> None:
+        self._memory.clear()
+        for path, _, _ in self._entries():
+            _remove(path)
+
+    def _remember(self, key: str, cached: CachedResult) -> None:
+        self._memory[key] = cached
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def _entries(self) -> list[tuple[str, float, int]]:
+        """(path, last use, size) of every on-disk entry."""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        for name in names:
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_mtime, st.st_size))
+        return entries
+
+    def _evict(self) -> None:
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+        if total <= self.max_bytes:
+            return
+        for path, _, size in sorted(entries, key=lambda e: e[1]):
+            _remove(path)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
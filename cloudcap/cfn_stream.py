@@ -0,0 +1,239 @@
+"""
+Bounded-memory loading of large CloudFormation templates.
+
+The template is parsed as a stream of YAML events (JSON templates are YAML
+too), and only the parts that the analysis models are built: the `Type` of
+every resource, and the properties listed for that type. Everything else
+(metadata, inline policies, state machine definitions, ...) is skipped while
+it is parsed, so memory scales with the modeled subset of the template
+rather than with the size of the file.
+"""
+
+from __future__ import annotations
+import os
+from typing import Any, Iterator, Mapping, Optional, Sequence
+
+import yaml
+
+from cloudcap import compression
+from cloudcap.cfn_template import CfnValue
+
+# resource type -> the properties to keep for it
+Properties = Mapping[str, Sequence[str]]
+
+# top-level sections kept whole: they wire nested stacks to their parents
+SECTIONS = ("Parameters", "Outputs")
+# metadata kept for every resource: where CDK put a nested stack's template
+METADATA = ("aws:asset:path",)
+
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_STR = "tag:yaml.org,2002:str"
+_SCALAR_CONSTRUCTORS = yaml.constructor.SafeConstructor.yaml_constructors
+
+
+def load_resources(path: str | os.PathLike[Any], properties: Properties) -> CfnValue:
+    """
+    Loads the modeled part of a template.
+
+    Args:
+    - path: The template file, in YAML or JSON, possibly compressed (see
+      `cloudcap.compression`).
+    - properties (Properties): The properties to keep, by resource type.
+      Resources of other types only keep their `Type`.
+
+    Returns:
+    - CfnValue: A template with only `Resources` and the `SECTIONS`, if the
+      file has them.
+
+    Raises:
+    - yaml.YAMLError: If the file can't be parsed.
+    """
+    with compression.open_file(path) as f:
+        return _Builder(yaml.parse(f, Loader=_Loader), properties).document()
+
+
+def prune(template: CfnValue, properties: Properties) -> CfnValue:
+    """Keeps the same subset of an already loaded template as `load_resources`."""
+    resources = template.get("Resources") if isinstance(template, dict) else None
+    if not isinstance(resources, dict):
+        return {}
+    pruned: dict[str, CfnValue] = {
+        section: template[section] for section in SECTIONS if section in template
+    }
+    pruned["Resources"] = {
+        logical_id: _prune_resource(body, properties)
+        for logical_id, body in resources.items()
+    }
+    return pruned
+
+
+def _prune_resource(body: CfnValue, properties: Properties) -> CfnValue:
+    if not isinstance(body, dict):
+        return body
+    pruned: dict[str, CfnValue] = {}
+    if "Type" in body:
+        pruned["Type"] = body["Type"]
+    keep = properties.get(body.get("Type"), ())  # type: ignore
+    if isinstance(body.get("Properties"), dict):
+        pruned["Properties"] = {
+            k: v for k, v in body["Properties"].items() if k in keep
+        }
+    if isinstance(body.get("Metadata"), dict):
+        metadata = {k: v for k, v in body["Metadata"].items() if k in METADATA}
+        if metadata:
+            pruned["Metadata"] = metadata
+    return pruned
+
+
+def _intrinsic_function(tag: str, value: CfnValue) -> CfnValue:
+    """Expands the short form of an intrinsic function, as cfn_flip does."""
+    name = tag[1:]
+    if name == "GetAtt" and isinstance(value, str):
+        value = value.split(".", 1)
+    return {name if name in ("Ref", "Condition") else f"Fn::{name}": value}
+
+
+class _Builder:
+    """Builds the modeled subset of a template from its parser events."""
+
+    def __init__(self, events: Iterator[yaml.Event], properties: Properties) -> None:
+        self.events = events
+        self.properties = properties
+        self.anchors: dict[str, CfnValue] = {}
+        self.resolver = yaml.resolver.Resolver()
+        self.constructor = yaml.constructor.SafeConstructor()
+
+    def document(self) -> CfnValue:
+        self._expect(yaml.StreamStartEvent)
+        if isinstance(next(self.events), yaml.StreamEndEvent):
+            return {}
+        event = next(self.events)
+        if not isinstance(event, yaml.MappingStartEvent):
+            self._skip(event)
+            return {}
+
+        template: dict[str, CfnValue] = {}
+        for key in self._keys():
+            if key == "Resources":
+                template["Resources"] = self._resources()
+            elif key in SECTIONS:
+                template[key] = self._value(next(self.events))
+            else:
+                self._skip(next(self.events))
+        return template
+
+    def _expect(self, event_type: type) -> yaml.Event:
+        event = next(self.events)
+        if not isinstance(event, event_type):
+            raise yaml.YAMLError(f"expected {event_type.__name__}, got {event}")
+        return event
+
+    def _keys(self) -> Iterator[Any]:
+        """Yields the keys of the current mapping; the caller consumes the values."""
+        while True:
+            event = next(self.events)
+            if isinstance(event, yaml.MappingEndEvent):
+                return
+            yield self._value(event)
+
+    def _resources(self) -> CfnValue:
+        event = next(self.events)
+        if not isinstance(event, yaml.MappingStartEvent):
+            return self._value(event)
+        return {logical_id: self._resource() for logical_id in self._keys()}
+
+    def _resource(self) -> CfnValue:
+        event = next(self.events)
+        if not isinstance(event, yaml.MappingStartEvent):
+            return self._value(event)
+
+        body: dict[str, CfnValue] = {}
+        early_properties: Optional[CfnValue] = None
+        for key in self._keys():
+            if key == "Type":
+                body["Type"] = self._value(next(self.events))
+            elif key == "Properties" and "Type" not in body:
+                # rare: the type isn't known yet, so keep everything for now
+                early_properties = self._value(next(self.events))
+            elif key == "Properties":
+                keep = self.properties.get(body["Type"], ())  # type: ignore
+                body["Properties"] = self._mapping(next(self.events), keep)
+            elif key == "Metadata":
+                metadata = self._mapping(next(self.events), METADATA)
+                if metadata:
+                    body["Metadata"] = metadata
+            else:
+                self._skip(next(self.events))
+
+        if early_properties is not None:
+            body["Properties"] = early_properties
+            return _prune_resource(body, self.properties)
+        return body
+
+    def _mapping(self, event: yaml.Event, keep: Sequence[str]) -> CfnValue:
+        """Builds only the `keep` keys of a mapping."""
+        if not isinstance(event, yaml.MappingStartEvent):
+            self._skip(event)
+            return {}
+        mapping: dict[str, CfnValue] = {}
+        for key in self._keys():
+            if key in keep:
+                mapping[key] = self._value(next(self.events))
+            else:
+                self._skip(next(self.events))
+        return mapping
+
+    def _skip(self, event: yaml.Event) -> None:
+        """Consumes the rest of the node that starts with `event`."""
+        depth = 0
+        while True:
+            if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+                depth += 1
+            elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+                depth -= 1
+            if depth == 0:
+                return
+            event = next(self.events)
+
+    def _value(self, event: yaml.Event) -> CfnValue:
+        """Builds the node that starts with `event`."""
+        value: CfnValue
+        if isinstance(event, yaml.ScalarEvent):
+            value = self._scalar(event)
+        elif isinstance(event, yaml.SequenceStartEvent):
+            value = []
+            while not isinstance(item := next(self.events), yaml.SequenceEndEvent):
+                value.append(self._value(item))
+        elif isinstance(event, yaml.MappingStartEvent):
+            value = {}
+            for key in self._keys():
+                value[key] = self._value(next(self.events))
+        elif isinstance(event, yaml.AliasEvent):
+            if event.anchor not in self.anchors:
+                raise yaml.YAMLError(f"unknown or skipped anchor: {event.anchor}")
+            return self.anchors[event.anchor]
+        else:
+            raise yaml.YAMLError(f"unexpected {event}")
+
+        tag = getattr(event, "tag", None)
+        if tag and tag.startswith("!") and tag != "!":
+            value = _intrinsic_function(tag, value)
+        if event.anchor:
+            self.anchors[event.anchor] = value
+        return value
+
+    def _scalar(self, event: yaml.ScalarEvent) -> CfnValue:
+        tag = event.tag
+        if tag is None or tag == "!" or tag.startswith("!"):
+            if event.style or tag:
+                # quoted, or the argument of an intrinsic function
+                return event.value
+            tag = self.resolver.resolve(yaml.ScalarNode, event.value, event.implicit)
+        if tag == _STR:
+            return event.value
+        construct = _SCALAR_CONSTRUCTORS.get(tag)
+        if construct is None:
+            return event.value
+        return construct(
+            self.constructor, yaml.ScalarNode(tag, event.value, style=event.style)
+        )
@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Callable
 
 CfnValue = Any
 
@@ -33,3 +33,57 @@ def exists_in_cfn_value(value: CfnValue, target: str) -> bool:
                 return True
     # If the value is not found in the current level, return False
     return False
+
+
+def strings_in_cfn_value(value: CfnValue) -> set[str]:
+    """
+    Collects every string that `exists_in_cfn_value` could find within a
+    CloudFormation template value, i.e. the string values of dictionaries
+    and the string elements of lists (but not dictionary keys).
+
+    Checking membership in this set is equivalent to calling
+    `exists_in_cfn_value`, but the value is only traversed once.
+
+    Args:
+    - value (CfnValue): The CloudFormation template value to search within.
+
+    Returns:
+    - set[str]: The strings found within the value.
+    """
+    found: set[str] = set()
+    stack: list[Any] = [value]
+    while stack:
+        v = stack.pop()
+        if isinstance(v, dict):
+            children = v.values()
+        elif isinstance(v, list):
+            children = v
+        else:
+            continue
+        for child in children:
+            if isinstance(child, str):
+                found.add(child)
+            else:
+                stack.append(child)
+    return found
+
+
+def map_strings_in_cfn_value(value: CfnValue, fn: Callable[[str], str]) -> CfnValue:
+    """
+    Copies a CloudFormation template value, applying `fn` to its strings
+    (but not to dictionary keys).
+
+    Args:
+    - value (CfnValue): The CloudFormation template value to copy.
+    - fn (Callable[[str], str]): Maps each string.
+
+    Returns:
+    - CfnValue: The copy.
+    """
+    if isinstance(value, str):
+        return fn(value)
+    elif isinstance(value, dict):
+        return {k: map_strings_in_cfn_value(v, fn) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [map_strings_in_cfn_value(v, fn) for v in value]
+    return value
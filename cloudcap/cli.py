@@ -1,22 +1,76 @@
 import sys
-from typing import Optional
+from typing import Iterable, Optional, TYPE_CHECKING
 from typing_extensions import Annotated
 import logging
 import typer
 from cloudcap import (
+    INVALID_INPUT,
     SOLVER_ERROR,
     SOLVER_REJECT,
     SUCCESS,
     __app_name__,
     __version__,
-    estimates,
+    compression,
+    describe,
+    exit_status,
+    profiling,
 )
-from cloudcap.analyzer import Analyzer, AnalyzerResult
-from cloudcap.aws import AWS, Regions, Account
 from cloudcap.logging import setup_logging
 
+if TYPE_CHECKING:
+    from cloudcap import batch
+
+# INFO: commands import the analysis pipeline (cloudcap.analyzer -> z3,
+# cloudcap.aws -> networkx/cfn_flip) locally, so each command only pays for
+# what it uses. Don't move these imports back to the top of the module;
+# tests/test_import_time.py guards this.
+
 app = typer.Typer()
 
+logger = logging.getLogger(__name__)
+
+LazyOption = Annotated[
+    bool,
+    typer.Option(
+        "--lazy",
+        help="Only model the resources that the estimates reach, leaving the rest of the template unparsed.",
+    ),
+]
+
+TargetOption = Annotated[
+    Optional[list[str]],
+    typer.Option(
+        "--target",
+        "-t",
+        help="Deploy the template to <region>/<account id>; repeat for more targets. Plain logical ids in the estimates apply to every target, <region>/<account id>/<logical id> to one. Defaults to us-east-1/123.",
+    ),
+]
+
+OutputOption = Annotated[
+    Optional[str],
+    typer.Option(
+        "--output",
+        "-o",
+        help="Write to this file instead of stdout, compressed if its name ends in .gz, .bz2, .xz or .zst.",
+    ),
+]
+
+StreamOption = Annotated[
+    bool,
+    typer.Option(
+        "--stream",
+        help="Stream the template and only keep what the analysis models, to load very large templates in bounded memory.",
+    ),
+]
+
+AssetsOption = Annotated[
+    Optional[str],
+    typer.Option(
+        "--assets",
+        help="Directory of the templates of nested stacks (AWS::CloudFormation::Stack), e.g. cdk.out. Defaults to the template's directory.",
+    ),
+]
+
 
 def version_callback(value: bool) -> None:
     if value:
@@ -26,6 +80,7 @@ def version_callback(value: bool) -> None:
 
 @app.callback()
 def main(
+    ctx: typer.Context,
     version: Annotated[
         Optional[bool],
         typer.Option(
@@ -44,6 +99,13 @@ def main(
             help="Enable debug mode for more detailed tracing.",
         ),
     ] = None,
+    profile: Annotated[
+        bool,
+        typer.Option(
+            "--profile",
+            help="Print a JSON report of the time spent in each phase, and the solver's statistics, to stderr.",
+        ),
+    ] = False,
 ) -> None:
     """
     IaC analysis tool.
@@ -52,85 +114,439 @@ def main(
     if debug:
         logging_level = logging.DEBUG
     setup_logging(logging_level)
+    if profile:
+        report = profiling.enable()
+        # runs even when the command exits with a status code
+        ctx.call_on_close(lambda: print_profile(report))
+
+
+def print_profile(report: profiling.Profile) -> None:
+    import json
+
+    print(json.dumps(report.to_dict(), indent=2), file=sys.stderr)
 
 
 @app.command()
 def analyze(
     cfn_template: Annotated[str, typer.Argument(help="CloudFormation template")],
-    estimates_file: Annotated[str, typer.Argument(help="Estimates file")],
+    estimates_file: Annotated[
+        str, typer.Argument(help="Estimates file (YAML, JSON or CSV)")
+    ],
+    watch: Annotated[
+        bool,
+        typer.Option(
+            "--watch",
+            "-w",
+            help="Keep running and analyze again whenever either file changes.",
+        ),
+    ] = False,
+    interval: Annotated[
+        float, typer.Option(help="Seconds between checks for changes in --watch mode.")
+    ] = 0.5,
+    target: TargetOption = None,
+    stream: StreamOption = False,
+    lazy: LazyOption = False,
+    assets: AssetsOption = None,
+    cache: Annotated[
+        bool,
+        typer.Option(
+            "--cache",
+            help="Reuse the result of an earlier analysis of the same template, estimates and targets.",
+        ),
+    ] = False,
+    cache_dir: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Directory of the result cache (implies --cache). Defaults to $CLOUDCAP_CACHE_DIR, or ~/.cache/cloudcap."
+        ),
+    ] = None,
+    components: Annotated[
+        bool,
+        typer.Option(
+            "--components",
+            help="Solve each independent part of the infrastructure on its own, and repeated copies of a part with the same estimates once.",
+        ),
+    ] = False,
+    presolve: Annotated[
+        bool,
+        typer.Option(
+            "--presolve",
+            help="Propagate the estimates through the constraints first, and only solve what that leaves undecided.",
+        ),
+    ] = False,
+    model_file: Annotated[
+        Optional[str],
+        typer.Option(
+            "--model",
+            help="On a pass, write the flow through every resource and edge in the solution to this JSON (or .csv) file.",
+        ),
+    ] = None,
 ):
     """
     Check whether the usage estimates satisfy the constraints of the infrastructure.
     """
-    # TODO: multiple CFN templates
+    if watch:
+        from cloudcap import targets
+        from cloudcap.watch import watch as watch_files
 
-    # simulate AWS deployments
-    aws = AWS()
-    deployment = aws.add_deployment(Regions.us_east_1, Account("123"))
-    deployment.from_cloudformation_template(path=cfn_template)
+        unsupported = [
+            option
+            for option, given in (
+                ("--lazy", lazy),
+                ("--cache", cache or cache_dir),
+                ("--components", components),
+                ("--presolve", presolve),
+                ("--model", model_file),
+            )
+            if given
+        ]
+        if unsupported:
+            raise typer.BadParameter(
+                f"not supported with --watch: {', '.join(unsupported)}",
+                param_hint="--watch",
+            )
+        try:
+            watch_targets = targets.parse_targets(target)
+        except ValueError as e:
+            raise typer.BadParameter(str(e), param_hint="--target") from e
+        if len(watch_targets) > 1:
+            raise typer.BadParameter(
+                "--watch analyzes a single target", param_hint="--target"
+            )
+        try:
+            watch_files(
+                cfn_template,
+                estimates_file,
+                interval=interval,
+                target=watch_targets[0],
+                streaming=stream,
+                assets=assets,
+            )
+        except KeyboardInterrupt:
+            pass
+        sys.exit(SUCCESS)
 
-    # setup analysis
-    # TODO: custom plugins
-    analyzer = Analyzer(aws)
-    analyzer.constrain()
+    from cloudcap import estimates, targets
+    from cloudcap.aws import AWS, UnknownResourceError
+
+    # TODO: multiple CFN templates
 
-    # add user estimates
     user_estimates = estimates.load(estimates_file)
-    analyzer.add_estimates(user_estimates)
+    try:
+        deployment_targets = targets.parse_targets(target)
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--target") from e
+    if model_file and components:
+        raise typer.BadParameter(
+            "components are solved apart, so there is no model of the whole",
+            param_hint="--model",
+        )
+    if presolve and (model_file or components):
+        raise typer.BadParameter(
+            "the presolve only leaves part of the model to z3, and components are solved apart",
+            param_hint="--presolve",
+        )
 
-    # perform analysis
-    result = analyzer.solve()
+    results = None
+    # with a cache, the template (and its nested ones) are parsed once, for
+    # the fingerprint and then for the analysis
+    template = loader = None
+    try:
+        if cache or cache_dir:
+            from cloudcap.aws import CloudFormationStack
+            from cloudcap.cache import CachedResult, ResultCache, key
+            from cloudcap.fingerprint import fingerprint
+            from cloudcap.nested import TemplateLoader
 
-    # interpret analysis result
-    if result == AnalyzerResult.PASS:
-        print("✅ Pass")
-        sys.exit(SUCCESS)
-    elif result == AnalyzerResult.REJECT:
-        print("❌ Reject")
-        sys.exit(SOLVER_REJECT)
-    else:
-        print("⚠️ The solver failed to solve the constraints")
-        sys.exit(SOLVER_ERROR)
+            results = ResultCache(cache_dir)
+            template = CloudFormationStack.load(cfn_template, stream)
+            loader = TemplateLoader(streaming=stream, assets=assets)
+            # edits that can't change the result (and compression) share results
+            cache_key = key(
+                fingerprint(template, cfn_template, loader=loader),
+                user_estimates,
+                [str(t) for t in deployment_targets],
+            )
+            cached = results.get(cache_key)
+            # a cached result has no flows to write
+            if cached is not None and not (model_file and cached.result == "PASS"):
+                report_result(cached.result)
+
+        from cloudcap.analyzer import AnalyzerResult
+
+        # simulate AWS deployments, and setup analysis
+        # TODO: custom plugins
+        aws = AWS()
+        analyzer = targets.deploy(
+            aws,
+            cfn_template,
+            deployment_targets,
+            streaming=stream,
+            demand=user_estimates if lazy else None,
+            assets=assets,
+            template=template,
+            loader=loader,
+        )
+    except UnknownResourceError as e:
+        # e.g. an estimate for a type of resource that isn't modeled
+        logger.error("%s", e)
+        sys.exit(INVALID_INPUT)
+    finally:
+        if loader is not None:
+            loader.close()
+
+    # add user estimates, and perform analysis
+    try:
+        expanded = targets.expand_estimates(user_estimates, deployment_targets)
+        if components:
+            result = AnalyzerResult.combine(
+                r for _, r in analyzer.check_components(expanded)
+            )
+        elif presolve:
+            result = analyzer.check(expanded, presolve=True)
+        else:
+            analyzer.add_estimates(expanded)
+            result = analyzer.solve()
+    except estimates.UnknownResourcesError:
+        # already logged, with every unknown resource
+        sys.exit(INVALID_INPUT)
+
+    if results is not None:
+        # components are solved apart, and the presolve solves part of the
+        # model: there is no model of the whole
+        passed = result == AnalyzerResult.PASS and not (components or presolve)
+        model = analyzer.model() if passed else None
+        results.put(cache_key, CachedResult(result.name, model))
+
+    if model_file and result == AnalyzerResult.PASS:
+        from cloudcap import flows
+
+        flows.write(analyzer.flows(), model_file)
+
+    report_result(result.name)
+
+
+def report_result(result: str) -> None:
+    """Prints an analysis result (an `AnalyzerResult` name) and exits with its status."""
+    print(describe(result))
+    sys.exit(exit_status(result))
 
 
 @app.command()
 def smt2(
     cfn_template: Annotated[str, typer.Argument(help="CloudFormation template")],
     estimates_file: Annotated[
-        Optional[str], typer.Argument(help="Estimates file")
+        Optional[str], typer.Argument(help="Estimates file (YAML, JSON or CSV)")
     ] = None,
+    target: TargetOption = None,
+    stream: StreamOption = False,
+    lazy: LazyOption = False,
+    assets: AssetsOption = None,
+    output: OutputOption = None,
 ):
     """
     Check whether the usage estimates satisfy the constraints of the infrastructure.
     """
-    # simulate AWS deployments
-    aws = AWS()
-    deployment = aws.add_deployment(Regions.us_east_1, Account("123"))
-    deployment.from_cloudformation_template(path=cfn_template)
+    from cloudcap import estimates, targets
+    from cloudcap.aws import AWS, UnknownResourceError
+
+    user_estimates = estimates.load(estimates_file) if estimates_file else None
+    try:
+        deployment_targets = targets.parse_targets(target)
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--target") from e
 
-    # setup analysis
-    analyzer = Analyzer(aws)
-    analyzer.constrain()
+    # simulate AWS deployments, and setup analysis
+    aws = AWS()
+    try:
+        analyzer = targets.deploy(
+            aws,
+            cfn_template,
+            deployment_targets,
+            streaming=stream,
+            demand=user_estimates if lazy else None,
+            assets=assets,
+        )
+    except UnknownResourceError as e:
+        logger.error("%s", e)
+        sys.exit(INVALID_INPUT)
 
     # add user estimates
-    if estimates_file:
-        user_estimates = estimates.load(estimates_file)
-        analyzer.add_estimates(user_estimates)
+    if user_estimates is not None:
+        try:
+            analyzer.add_estimates(
+                targets.expand_estimates(user_estimates, deployment_targets)
+            )
+        except estimates.UnknownResourcesError:
+            sys.exit(INVALID_INPUT)
 
-    # write smt2 to stdout
-    print(analyzer.sexpr())
+    # write smt2, as it is printed
+    if output:
+        with compression.open_file(output, "w") as f:
+            analyzer.write_smt2(f)
+    else:
+        analyzer.write_smt2(sys.stdout)
     sys.exit(SUCCESS)
 
 
 @app.command()
 def estimates_template(
     cfn_template: Annotated[str, typer.Argument(help="CloudFormation template")],
+    stream: StreamOption = False,
+    assets: AssetsOption = None,
+    output: OutputOption = None,
 ):
     """
     Generate a template estimates file file for the given CloudFormation template.
     """
+    from cloudcap import estimates
+    from cloudcap.aws import AWS, Regions, Account
+
     aws = AWS()
     deployment = aws.add_deployment(Regions.us_east_1, Account("123"))
-    deployment.from_cloudformation_template(path=cfn_template)
-    estimates.write_template(aws)
+    deployment.from_cloudformation_template(
+        path=cfn_template, streaming=stream, assets=assets
+    )
+    estimates.write_template(aws, output)
     sys.exit(SUCCESS)
+
+
+def report_batch(results: "Iterable[batch.Result]", output: Optional[str]) -> None:
+    """Writes the results of many pairs, and exits with the worst status."""
+    from cloudcap import batch
+
+    if output:
+        with compression.open_file(output, "w") as f:
+            counts = batch.write_jsonl(results, f)
+    else:
+        counts = batch.write_jsonl(results, sys.stdout)
+
+    if counts.get(batch.ERROR) or counts.get("UNKNOWN"):
+        sys.exit(SOLVER_ERROR)
+    elif counts.get("REJECT"):
+        sys.exit(SOLVER_REJECT)
+    sys.exit(SUCCESS)
+
+
+@app.command()
+def analyze_many(
+    source: Annotated[
+        str,
+        typer.Argument(
+            help="Manifest file or directory of (template, estimates) pairs"
+        ),
+    ],
+    workers: Annotated[
+        Optional[int],
+        typer.Option(
+            "--workers", "-j", help="Number of worker processes (default: #CPUs)"
+        ),
+    ] = None,
+    output: OutputOption = None,
+):
+    """
+    Check many (template, estimates) pairs in parallel, one JSON line per pair.
+    """
+    from cloudcap import batch
+
+    pairs = batch.discover_pairs(source)
+    report_batch(batch.analyze_many(pairs, workers=workers), output)
+
+
+@app.command()
+def coordinate(
+    spool: Annotated[
+        str, typer.Argument(help="Spool directory shared with the workers")
+    ],
+    source: Annotated[
+        str,
+        typer.Argument(
+            help="Manifest file or directory of (template, estimates) pairs"
+        ),
+    ],
+    shard_size: Annotated[
+        int, typer.Option(help="Most (template, estimates) pairs in a unit of work")
+    ] = 16,
+    lease: Annotated[
+        float,
+        typer.Option(
+            help="Seconds without a heartbeat before a worker's units are given to others"
+        ),
+    ] = 30.0,
+    output: OutputOption = None,
+):
+    """
+    Check many (template, estimates) pairs on the workers of a spool directory,
+    one JSON line per pair (see `cloudcap work`).
+    """
+    from cloudcap import batch, distributed
+
+    coordinator = distributed.Coordinator(
+        distributed.Spool(spool), shard_size=shard_size, lease=lease
+    )
+    report_batch(coordinator.run(batch.discover_pairs(source)), output)
+
+
+@app.command()
+def work(
+    spool: Annotated[
+        str, typer.Argument(help="Spool directory shared with the coordinator")
+    ],
+    idle_timeout: Annotated[
+        Optional[float],
+        typer.Option(help="Also stop after this many seconds without work"),
+    ] = None,
+):
+    """
+    Analyze units of work from a spool directory until its coordinator is done.
+    Run one per CPU, on as many machines as share the spool.
+    """
+    from cloudcap import distributed
+
+    distributed.Worker(distributed.Spool(spool)).run(idle_timeout=idle_timeout)
+    sys.exit(SUCCESS)
+
+
+@app.command()
+def diff(
+    base_template: Annotated[
+        str, typer.Argument(help="Base revision of the CloudFormation template")
+    ],
+    head_template: Annotated[
+        str, typer.Argument(help="Head revision of the CloudFormation template")
+    ],
+    estimates_file: Annotated[
+        str, typer.Argument(help="Estimates file (YAML, JSON or CSV)")
+    ],
+    assets: AssetsOption = None,
+):
+    """
+    Check whether a revision of a template still satisfies the estimates,
+    only re-checking the parts of the infrastructure that it changed.
+    """
+    from cloudcap import estimates
+    from cloudcap.aws import CloudFormationStack
+    from cloudcap.incremental import RevisionAnalysis
+
+    user_estimates = estimates.load(estimates_file)
+    try:
+        analysis = RevisionAnalysis(
+            CloudFormationStack.load(base_template),
+            user_estimates,
+            path=base_template,
+            assets=assets,
+        )
+        report = analysis.compare(
+            CloudFormationStack.load(head_template), path=head_template
+        )
+    except estimates.UnknownResourcesError:
+        sys.exit(INVALID_INPUT)
+
+    print(f"Base: {describe(report.base.name)}")
+    print(
+        f"Head: {describe(report.head.name)} ({report.diff}; "
+        f"re-checked {report.checked} of {report.checked + report.reused} components)"
+    )
+    if report.failing:
+        print(f"Failing: {', '.join(report.failing)}")
+    sys.exit(exit_status(report.head.name))
@@ -0,0 +1,111 @@
+"""
+Transparent compression of input and output files.
+
+Compressed input is detected by its magic bytes, whatever its name, and is
+decompressed as it is read. Output is compressed when its name ends with a
+compression suffix (`.gz`, `.bz2`, `.xz` or `.zst`). Either way, there is
+never an uncompressed copy on disk.
+
+zstd needs the `zstandard` package (`pip install cloudcap[zstd]`).
+"""
+
+from __future__ import annotations
+import io
+import os
+from typing import IO, Any, Optional
+
+GZIP = "gzip"
+BZIP2 = "bz2"
+XZ = "xz"
+ZSTD = "zstd"
+
+MAGIC = {
+    b"\x1f\x8b": GZIP,
+    b"BZh": BZIP2,
+    b"\xfd7zXZ\x00": XZ,
+    b"\x28\xb5\x2f\xfd": ZSTD,
+}
+SUFFIXES = {".gz": GZIP, ".bz2": BZIP2, ".xz": XZ, ".zst": ZSTD}
+
+_MAGIC_LENGTH = max(len(m) for m in MAGIC)
+
+
+def detect(path: str | os.PathLike[Any]) -> Optional[str]:
+    """The compression of a file, from its magic bytes, or None."""
+    if not os.path.isfile(path):
+        # e.g. a pipe: peeking would consume its input
+        return None
+    with open(path, "rb") as f:
+        head = f.read(_MAGIC_LENGTH)
+    for magic, compression in MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def splitext(path: str | os.PathLike[Any]) -> tuple[str, str]:
+    """`os.path.splitext`, ignoring a compression suffix: `a.csv.gz` -> `(a, .csv)`."""
+    root, ext = os.path.splitext(path)
+    if ext.lower() in SUFFIXES:
+        root, ext = os.path.splitext(root)
+    return root, ext
+
+
+def open_file(
+    path: str | os.PathLike[Any],
+    mode: str = "r",
+    encoding: str = "utf-8",
+    newline: Optional[str] = None,
+) -> IO[Any]:
+    """
+    Opens a file like `open`, decompressing it or compressing it on the fly.
+
+    Args:
+    - path: The file.
+    - mode (str): `r`, `w`, `rb` or `wb`. When reading, the compression is
+      detected from the content; when writing, from the suffix of `path`.
+    - encoding (str): Encoding of text modes.
+    - newline (Optional[str]): As for `open`, in text modes.
+
+    Returns:
+    - IO[Any]: The file object.
+    """
+    binary = "b" in mode
+    writing = "w" in mode
+    if writing:
+        compression = SUFFIXES.get(os.path.splitext(path)[1].lower())
+    else:
+        compression = detect(path)
+    if compression is None:
+        if binary:
+            return open(path, mode)
+        return open(path, mode, encoding=encoding, newline=newline)
+
+    raw = _open_compressed(path, "wb" if writing else "rb", compression)
+    if binary:
+        return raw
+    return io.TextIOWrapper(raw, encoding=encoding, newline=newline)
+
+
+def _open_compressed(
+    path: str | os.PathLike[Any], mode: str, compression: str
+) -> IO[bytes]:
+    if compression == GZIP:
+        import gzip
+
+        return gzip.open(path, mode)  # type: ignore
+    elif compression == BZIP2:
+        import bz2
+
+        return bz2.open(path, mode)  # type: ignore
+    elif compression == XZ:
+        import lzma
+
+        return lzma.open(path, mode)  # type: ignore
+    try:
+        import zstandard  # type: ignore
+    except ImportError as e:
+        raise RuntimeError(
+            f"{path} is zstd-compressed: install the zstandard package (pip install cloudcap[zstd])"
+        ) from e
+    return zstandard.open(path, mode)
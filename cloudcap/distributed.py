@@ -0,0 +1,439 @@
+"""
+Batch analysis sharded across machines, through a shared spool directory.
+
+A coordinator splits the (template, estimates) pairs into units of work and
+writes them to the spool; workers, on any machine that mounts it, claim
+units, analyze them and write their results back, which the coordinator
+streams out as they arrive. The spool is the only thing nodes share, so the
+throughput grows with the number of workers until the file system is busy.
+
+The spool holds:
+
+- `pending/<unit>.json`: units waiting for a worker;
+- `claimed/<worker>/<unit>.json`: units a worker is analyzing. A claim is
+  an atomic rename out of `pending`, so each unit goes to one worker;
+- `results/<unit>.json`: the results of a unit;
+- `workers/<worker>`: a file each worker touches while it is alive. The
+  units of a worker that stops touching it for a lease are given back to
+  `pending` (or, after `max_attempts`, reported as errors);
+- `done`: the id of the last run whose coordinator has every result, for
+  its workers to exit.
+
+Units are named after their template's digest, and workers prefer the units
+of templates they have already parsed and constrained: they keep the
+analyzers of the last templates they analyzed.
+"""
+
+from __future__ import annotations
+from collections import OrderedDict, defaultdict
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Iterable, Iterator, Optional, TYPE_CHECKING
+
+from cloudcap import batch
+from cloudcap.batch import Pair, Result
+
+if TYPE_CHECKING:
+    from cloudcap.analyzer import Analyzer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD_SIZE = 16
+DEFAULT_LEASE = 30.0
+DEFAULT_HEARTBEAT = 5.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_CACHE_SIZE = 8
+
+_PENDING = "pending"
+_CLAIMED = "claimed"
+_RESULTS = "results"
+_WORKERS = "workers"
+_DONE = "done"
+_SUFFIX = ".json"
+
+
+class Spool:
+    """
+    The directory that a coordinator and its workers share.
+
+    Args:
+    - path: The directory. Created if it doesn't exist.
+    """
+
+    path: str
+
+    def __init__(self, path: str | os.PathLike[Any]) -> None:
+        self.path = os.fspath(path)
+        for directory in (_PENDING, _CLAIMED, _RESULTS, _WORKERS):
+            os.makedirs(os.path.join(self.path, directory), exist_ok=True)
+
+    def reset(self) -> None:
+        """
+        Forgets the units and results of an earlier run.
+
+        Only files are removed: workers may be claiming units into their
+        directories meanwhile, and the units they still finish of the earlier
+        run are told apart by their names.
+        """
+        self.clear(self.pending())
+        self.clear(self.results())
+        for worker in os.listdir(self.claimed()):
+            self.clear(self.claimed(worker))
+
+    def pending(self, name: str = "") -> str:
+        return os.path.join(self.path, _PENDING, name)
+
+    def claimed(self, worker: str = "", name: str = "") -> str:
+        return os.path.join(self.path, _CLAIMED, worker, name)
+
+    def results(self, name: str = "") -> str:
+        return os.path.join(self.path, _RESULTS, name)
+
+    def heartbeat(self, worker: str) -> str:
+        return os.path.join(self.path, _WORKERS, worker)
+
+    def finished(self) -> Optional[str]:
+        """The id of the last run that finished, if any."""
+        try:
+            return self.read(os.path.join(self.path, _DONE))["run"]
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return None
+
+    def finish(self, run: str) -> None:
+        """Tells workers that there is nothing left to do."""
+        self.write(os.path.join(self.path, _DONE), {"run": run})
+        self.clear(self.pending())
+
+    def write(self, path: str, data: Any) -> None:
+        """Writes JSON atomically, so that readers never see part of it."""
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except BaseException:
+            self.remove(tmp)
+            raise
+
+    def read(self, path: str) -> Any:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def names(directory: str) -> list[str]:
+        """The JSON files of a directory (none if it doesn't exist)."""
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        return sorted(n for n in names if n.endswith(_SUFFIX))
+
+    @staticmethod
+    def clear(directory: str) -> None:
+        """Removes the units of a directory."""
+        for name in Spool.names(directory):
+            Spool.remove(os.path.join(directory, name))
+
+    @staticmethod
+    def remove(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+class Coordinator:
+    """
+    Shards pairs into units, and collects their results from the workers.
+
+    Args:
+    - spool (Spool): The spool the workers watch.
+    - shard_size (int): The most pairs in a unit. Pairs that share a template
+      are kept together, so that a worker parses it once for all of them.
+    - lease (float): Seconds without a heartbeat after which a worker is
+      taken for dead, and its units are given to others.
+    - max_attempts (int): How many workers a unit is given to before it is
+      reported as an error: a unit that kills every worker it goes to
+      doesn't stall the run.
+    - poll (float): Seconds between looks at the spool.
+    """
+
+    spool: Spool
+    shard_size: int
+    lease: float
+    max_attempts: int
+    poll: float
+
+    def __init__(
+        self,
+        spool: Spool,
+        shard_size: int = DEFAULT_SHARD_SIZE,
+        lease: float = DEFAULT_LEASE,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        poll: float = 0.2,
+    ) -> None:
+        self.spool = spool
+        self.shard_size = shard_size
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.poll = poll
+        # worker -> (heartbeat mtime, when we saw it change)
+        self._heartbeats: dict[str, tuple[float, float]] = {}
+
+    def shard(self, pairs: Iterable[Pair], run: str = "") -> dict[str, list[Pair]]:
+        """
+        Writes the pending units of pairs to the spool.
+
+        Args:
+        - pairs (Iterable[Pair]): The pairs.
+        - run (str): Tells the units apart from those of other runs, whose
+          late results are then ignored.
+
+        Returns:
+        - dict[str, list[Pair]]: The pairs of each unit, by unit name.
+        """
+        units: dict[str, list[Pair]] = {}
+        groups = batch.group_by_template(pairs).items()
+        for g, (digest, group) in enumerate(groups):
+            prefix = _prefix(digest)
+            for i in range(0, len(group), self.shard_size):
+                name = f"{prefix}-{run[:8]}{g:06d}-{i // self.shard_size:06d}{_SUFFIX}"
+                unit = group[i : i + self.shard_size]
+                self.spool.write(
+                    self.spool.pending(name), {"template": digest, "pairs": unit}
+                )
+                units[name] = unit
+        return units
+
+    def run(self, pairs: Iterable[Pair]) -> Iterator[Result]:
+        """
+        Analyzes pairs on the workers of the spool.
+
+        Returns:
+        - Iterator[Result]: One result per pair, as `batch.analyze_many`,
+          yielded as each unit's results come back.
+        """
+        run = uuid.uuid4().hex
+        self.spool.reset()
+        outstanding = self.shard(pairs, run)
+        attempts: defaultdict[str, int] = defaultdict(int)
+        logger.info("sharded into %d units", len(outstanding))
+        try:
+            while outstanding:
+                progress = False
+                for name in Spool.names(self.spool.results()):
+                    path = self.spool.results(name)
+                    if name in outstanding:
+                        yield from self.spool.read(path)
+                        del outstanding[name]
+                        progress = True
+                    # else a unit that was given to another worker too
+                    Spool.remove(path)
+                for name, results in self._requeue_lost(outstanding, attempts):
+                    yield from results
+                    del outstanding[name]
+                    progress = True
+                if not progress and outstanding:
+                    time.sleep(self.poll)
+        finally:
+            self.spool.finish(run)
+
+    def _requeue_lost(
+        self, outstanding: dict[str, list[Pair]], attempts: defaultdict[str, int]
+    ) -> Iterator[tuple[str, list[Result]]]:
+        """Gives the units of dead workers back, or fails them."""
+        try:
+            workers = os.listdir(self.spool.claimed())
+        except FileNotFoundError:
+            return
+        for worker in workers:
+            if self._alive(worker):
+                continue
+            for name in Spool.names(self.spool.claimed(worker)):
+                path = self.spool.claimed(worker, name)
+                if name not in outstanding:
+                    Spool.remove(path)
+                    continue
+                attempts[name] += 1
+                if attempts[name] >= self.max_attempts:
+                    logger.error("%s was lost by %d workers", name, attempts[name])
+                    Spool.remove(path)
+                    error = RuntimeError(f"lost by {attempts[name]} workers")
+                    yield name, batch.setup_failed(outstanding[name], 0.0, error)
+                    continue
+                logger.warning("%s lost by %s, requeueing", name, worker)
+                try:
+                    os.replace(path, self.spool.pending(name))
+                except FileNotFoundError:
+                    # finished after all
+                    pass
+
+    def _alive(self, worker: str) -> bool:
+        # compares our own clock to itself, not to the file server's or the
+        # worker's, which needn't agree with it
+        now = time.monotonic()
+        try:
+            mtime = os.stat(self.spool.heartbeat(worker)).st_mtime
+        except FileNotFoundError:
+            mtime = -1.0
+        seen = self._heartbeats.get(worker)
+        if seen is None or seen[0] != mtime:
+            self._heartbeats[worker] = (mtime, now)
+            return True
+        return now - seen[1] < self.lease
+
+
+class Worker:
+    """
+    Analyzes the units of a spool until the next run of its coordinator is
+    done.
+
+    Args:
+    - spool (Spool): The spool of the coordinator.
+    - name (Optional[str]): Unique among the workers of the spool. Defaults
+      to `<host>-<pid>`.
+    - heartbeat (float): Seconds between heartbeats; keep it well under the
+      coordinator's lease.
+    - cache_size (int): How many templates' analyzers are kept warm.
+    - poll (float): Seconds between looks for work when there is none.
+    """
+
+    spool: Spool
+    name: str
+    heartbeat: float
+    cache_size: int
+    poll: float
+
+    def __init__(
+        self,
+        spool: Spool,
+        name: Optional[str] = None,
+        heartbeat: float = DEFAULT_HEARTBEAT,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        poll: float = 0.2,
+    ) -> None:
+        self.spool = spool
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.heartbeat = heartbeat
+        self.cache_size = cache_size
+        self.poll = poll
+        self._analyzers: OrderedDict[str, Analyzer] = OrderedDict()
+        self._stopped = threading.Event()
+
+    def run(self, idle_timeout: Optional[float] = None) -> int:
+        """
+        Claims and analyzes units until a run of the coordinator is done.
+
+        Args:
+        - idle_timeout (Optional[float]): Also stop after this many seconds
+          without work.
+
+        Returns:
+        - int: The number of units analyzed.
+        """
+        self._beat()
+        beating = threading.Thread(
+            target=self._beating, name=f"cloudcap-heartbeat-{self.name}", daemon=True
+        )
+        beating.start()
+        analyzed = 0
+        idle_since = time.monotonic()
+        # workers can start before the coordinator, or outlive a run
+        finished = self.spool.finished()
+        try:
+            while self.spool.finished() == finished:
+                name = self.claim()
+                if name is None:
+                    if (
+                        idle_timeout is not None
+                        and time.monotonic() - idle_since > idle_timeout
+                    ):
+                        break
+                    time.sleep(self.poll)
+                    continue
+                if self.analyze(name):
+                    analyzed += 1
+                idle_since = time.monotonic()
+        finally:
+            self._stopped.set()
+            beating.join()
+        logger.info("%s analyzed %d units", self.name, analyzed)
+        return analyzed
+
+    def claim(self) -> Optional[str]:
+        """
+        Claims a pending unit, preferring those of templates in the cache.
+
+        Returns:
+        - Optional[str]: The unit's name, or None if there is none left.
+        """
+        os.makedirs(self.spool.claimed(self.name), exist_ok=True)
+        warm = {_prefix(digest) for digest in self._analyzers}
+        names = Spool.names(self.spool.pending())
+        names.sort(key=lambda n: n.split("-", 1)[0] not in warm)
+        for name in names:
+            try:
+                os.rename(self.spool.pending(name), self.spool.claimed(self.name, name))
+            except FileNotFoundError:
+                # claimed by another worker first
+                continue
+            return name
+        return None
+
+    def analyze(self, name: str) -> bool:
+        """
+        Analyzes a claimed unit, and hands its results in.
+
+        Returns:
+        - bool: False if the unit was taken back first, by a coordinator that
+          took this worker for dead or started another run.
+        """
+        path = self.spool.claimed(self.name, name)
+        try:
+            unit = self.spool.read(path)
+        except FileNotFoundError:
+            return False
+        pairs: list[Pair] = [(t, e) for t, e in unit["pairs"]]
+        start = time.perf_counter()
+        try:
+            analyzer = self._analyzer(unit["template"], pairs[0][0])
+        except Exception as e:  # pylint: disable=broad-except
+            results = batch.setup_failed(pairs, time.perf_counter() - start, e)
+        else:
+            results = batch.check_pairs(analyzer, pairs, time.perf_counter() - start)
+        self.spool.write(self.spool.results(name), results)
+        Spool.remove(path)
+        return True
+
+    def _analyzer(self, digest: str, template: str) -> Analyzer:
+        if digest in self._analyzers:
+            self._analyzers.move_to_end(digest)
+            return self._analyzers[digest]
+        analyzer = batch.prepare(template)
+        self._analyzers[digest] = analyzer
+        if len(self._analyzers) > self.cache_size:
+            self._analyzers.popitem(last=False)
+        return analyzer
+
+    def _beat(self) -> None:
+        with open(self.spool.heartbeat(self.name), "a", encoding="utf-8"):
+            pass
+        os.utime(self.spool.heartbeat(self.name))
+
+    def _beating(self) -> None:
+        while not self._stopped.wait(self.heartbeat):
+            try:
+                self._beat()
+            except OSError as e:
+                logger.warning("heartbeat of %s failed: %s", self.name, e)
+
+
+def _prefix(digest: str) -> str:
+    # a path for templates that couldn't be read (see batch.group_by_template)
+    return "".join(c if c.isalnum() else "_" for c in digest)[-16:]
@@ -1,45 +1,163 @@
+from __future__ import annotations
+import csv
+import json
 import os
+import re
 import sys
-from typing import Any, Optional, TextIO
-from cloudcap.analyzer import NREQUESTS
-from cloudcap.aws import AWS
+from typing import Any, Iterable, Optional, TextIO, TYPE_CHECKING
+from cloudcap import compression, profiling
+from cloudcap.metrics import NREQUESTS
 import yaml
 from io import StringIO
 
+if TYPE_CHECKING:
+    from cloudcap.aws import AWS
+
 Estimates = dict[str, dict[str, int]]
 
+# estimates file formats, by extension. Anything else is YAML.
+JSON = "json"
+CSV = "csv"
+YAML = "yaml"
+FORMATS = {".json": JSON, ".csv": CSV}
+
+# the first column of an estimates CSV file; the others are metrics
+CSV_ID_COLUMN = "logical_id"
+
+# logical ids that can be written as plain YAML scalars
+_PLAIN_ID = re.compile(r"[A-Za-z][A-Za-z0-9]*")
+_YAML_WORDS = re.compile(
+    r"y|Y|yes|Yes|YES|n|N|no|No|NO|true|True|TRUE|false|False|FALSE"
+    r"|on|On|ON|off|Off|OFF|null|Null|NULL"
+)
+
+
+class UnknownResourcesError(KeyError):
+    """Estimates refer to logical ids that are not in the infrastructure."""
+
+    logical_ids: list[str]
+
+    def __init__(self, logical_ids: list[str]) -> None:
+        self.logical_ids = logical_ids
+        super().__init__(logical_ids)
+
+    def __str__(self) -> str:
+        return f"{len(self.logical_ids)} estimated resources do not exist in the infrastructure: {', '.join(self.logical_ids)}"
+
+
+def validate(aws: AWS, estimates: Estimates) -> None:
+    """
+    Checks that every estimated resource exists, all at once.
+
+    Raises:
+    - UnknownResourcesError: With every unknown logical id, in file order.
+    """
+    unknown = estimates.keys() - aws.logical_id_to_resource.keys()
+    if unknown:
+        raise UnknownResourcesError([k for k in estimates if k in unknown])
+
 
 def write_template(aws: AWS, path: Optional[str | os.PathLike[Any]] = None) -> None:
-    # Get the YAML content as a string from _write_template
-    content = template_to_string(aws)
-    
+    """
+    Writes an estimates template (every resource, estimated at 0) to a file
+    or stdout. The file is compressed if its name has a compression suffix
+    (see `cloudcap.compression`).
+    """
     if path:
-        # Write the content to a file if a path is provided
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(content)
+        with compression.open_file(path, "w") as f:
+            _write_template(aws, f)
     else:
-        # Otherwise, print the content to standard output
-        print(content)
+        _write_template(aws, sys.stdout)
+        print()
+
 
 def template_to_string(aws: AWS) -> str:
-    # Create a StringIO object to temporarily hold the output
-    temp_output = StringIO()
-    
-    for r in aws.arns.values():
-        if r.logical_id:
-            template = {f"{r.logical_id}": {"NREQUESTS": 0}}
-            yaml.dump(template, temp_output)
-            temp_output.write("\n")
-    
-    # Retrieve the string from StringIO and write it to the file
-    template_string = temp_output.getvalue()
-    temp_output.close()  # Close the StringIO object when done
-
-    return template_string
-
-def load(path: Optional[str | os.PathLike[Any]] = None) -> Estimates:
-    if path:
-        with open(path, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
+    out = StringIO()
+    _write_template(aws, out)
+    return out.getvalue()
+
+
+def _write_template(aws: AWS, out: TextIO) -> None:
+    # written directly, a buffer at a time: dumping each resource with
+    # yaml.dump is slow for large infrastructures
+    buffer: list[str] = []
+    # replicas of a resource in other targets share its logical id
+    logical_ids = dict.fromkeys(r.logical_id for r in aws.arns.values() if r.logical_id)
+    for logical_id in logical_ids:
+        buffer.append(f"{_yaml_key(logical_id)}:\n  {NREQUESTS}: 0\n\n")
+        if len(buffer) >= 4096:
+            out.write("".join(buffer))
+            buffer.clear()
+    out.write("".join(buffer))
+
+
+def _yaml_key(logical_id: str) -> str:
+    if _PLAIN_ID.fullmatch(logical_id) and not _YAML_WORDS.fullmatch(logical_id):
+        return logical_id
+    # a JSON string is a valid double-quoted YAML scalar
+    return json.dumps(logical_id)
+
+
+def load(
+    path: Optional[str | os.PathLike[Any]] = None, file_format: Optional[str] = None
+) -> Estimates:
+    """
+    Loads estimates from a file, or stdin.
+
+    Args:
+    - path: The estimates file, possibly compressed (see
+      `cloudcap.compression`). Defaults to stdin.
+    - file_format (Optional[str]): `YAML`, `JSON` or `CSV`. Defaults to the format
+      of the file's extension, and to YAML.
+
+      A CSV file has a header row of `logical_id` and metric names, then one
+      row per resource; empty cells are not estimated.
+
+    Returns:
+    - Estimates: The estimates.
+    """
+    if file_format is None:
+        file_format = (
+            FORMATS.get(compression.splitext(path)[1].lower(), YAML) if path else YAML
+        )
+    with profiling.span("load_estimates"):
+        if path:
+            with compression.open_file(path, newline="") as f:
+                return _load(f, file_format)
+        else:
+            return _load(sys.stdin, file_format)
+
+
+def loads(text: str, file_format: str = YAML) -> Estimates:
+    """Loads estimates from a string, in `YAML` (or JSON), `JSON` or `CSV`."""
+    return _load(StringIO(text), file_format)
+
+
+def _load(f: TextIO, file_format: str) -> Estimates:
+    if file_format == JSON:
+        return json.load(f) or {}
+    elif file_format == CSV:
+        return _load_csv(csv.reader(f))
     else:
-        return yaml.safe_load(sys.stdin)
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        return yaml.load(f, Loader=loader) or {}
+
+
+def _load_csv(rows: Iterable[list[str]]) -> Estimates:
+    rows = iter(rows)
+    header = next(rows, None)
+    if not header:
+        return {}
+    if header[0].strip() != CSV_ID_COLUMN:
+        raise ValueError(
+            f"the first column of an estimates CSV file must be {CSV_ID_COLUMN}, got {header[0]}"
+        )
+    metrics = [m.strip() for m in header[1:]]
+    estimates: Estimates = {}
+    for row in rows:
+        if not row:
+            continue
+        estimates[row[0].strip()] = {
+            metric: int(cell) for metric, cell in zip(metrics, row[1:]) if cell.strip()
+        }
+    return estimates
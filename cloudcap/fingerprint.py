@@ -0,0 +1,220 @@
+"""
+Fingerprints of templates that only change when their analysis can.
+
+A template is projected onto what its resources are modeled from, and the
+projection is hashed:
+
+- each resource's `Type`, and the properties of its type that the stack
+  models (`aws.MODELED_PROPERTIES`) or that a plugin declares relevant
+  (`Plugin.relevant_properties`): the names that feed ARNs and URLs, event
+  source mappings, nested stacks' templates and parameters;
+- of a Lambda's `Environment`, only the values that can refer to a
+  resource (intrinsic functions, ARNs and URLs), not the variables' names;
+- the parameters' defaults, and the outputs' values (for nested stacks);
+- the fingerprints of nested stacks' templates.
+
+Editing a function's `Description`, `Runtime`, `Tags` or `Code`, a
+resource's `DependsOn` or `DeletionPolicy`, or reordering a template then
+keeps its fingerprint, and the results cached for it (see `cloudcap.cache`).
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Iterable, Optional, TYPE_CHECKING
+
+from cloudcap.cfn_template import CfnValue
+
+if TYPE_CHECKING:
+    from cloudcap.nested import TemplateLoader
+    from cloudcap.plugins import Plugin
+
+logger = logging.getLogger(__name__)
+
+# resource type -> the properties that its modeling depends on
+RelevantProperties = dict[str, tuple[str, ...]]
+
+ENVIRONMENT = "Environment"
+
+
+def relevant_properties(
+    plugins: Optional[Iterable[type[Plugin]]] = None,
+) -> RelevantProperties:
+    """
+    The properties that modeling depends on: the stack's, and the plugins'.
+
+    Args:
+    - plugins (Optional[Iterable[type[Plugin]]]): Defaults to the builtin
+      plugins.
+    """
+    from cloudcap.aws import MODELED_PROPERTIES
+
+    if plugins is None:
+        from cloudcap.plugins import builtin_plugins
+
+        plugins = builtin_plugins.plugins
+    relevant = {rtype: set(props) for rtype, props in MODELED_PROPERTIES.items()}
+    for plugin in plugins:
+        for rtype, props in plugin.relevant_properties.items():
+            relevant.setdefault(rtype, set()).update(props)
+    return {rtype: tuple(sorted(props)) for rtype, props in relevant.items()}
+
+
+def project_resource(body: CfnValue, relevant: RelevantProperties) -> CfnValue:
+    """The part of a resource's body that its modeling depends on."""
+    from cloudcap.nested import ASSET_PATH, NESTED_STACK
+
+    if not isinstance(body, dict):
+        return body
+    rtype = body.get("Type")
+    projection: dict[str, CfnValue] = {"Type": rtype}
+    properties = body.get("Properties")
+    if isinstance(properties, dict):
+        projection["Properties"] = {
+            name: (
+                _references(properties[name])
+                if name == ENVIRONMENT
+                else properties[name]
+            )
+            for name in relevant.get(rtype, ())  # type: ignore[arg-type]
+            if name in properties
+        }
+    metadata = body.get("Metadata")
+    if rtype == NESTED_STACK and isinstance(metadata, dict):
+        # where the nested template is found
+        projection["Metadata"] = {ASSET_PATH: metadata.get(ASSET_PATH)}
+    return projection
+
+
+def resource_fingerprint(
+    body: CfnValue, relevant: Optional[RelevantProperties] = None
+) -> str:
+    """
+    Hashes the part of a resource's body that its modeling depends on.
+
+    Must be called before the body is resolved by a CloudFormationStack,
+    which rewrites it in place.
+    """
+    if relevant is None:
+        relevant = relevant_properties()
+    return _digest(project_resource(body, relevant))
+
+
+def fingerprint(
+    template: CfnValue,
+    path: str | os.PathLike[Any] = "",
+    assets: Optional[str] = None,
+    plugins: Optional[Iterable[type[Plugin]]] = None,
+    loader: Optional[TemplateLoader] = None,
+) -> str:
+    """
+    The fingerprint of a template (see the module's documentation).
+
+    Must be called before the template is resolved by a CloudFormationStack,
+    which rewrites it in place.
+
+    Args:
+    - template (CfnValue): The parsed template.
+    - path: Its file, next to which nested stacks' templates are found.
+    - assets (Optional[str]): See `cloudcap.nested`.
+    - plugins (Optional[Iterable[type[Plugin]]]): The plugins of the
+      analysis. Defaults to the builtin plugins.
+    - loader (Optional[TemplateLoader]): The loader of nested templates to
+      share with the stack that is analyzed, which then doesn't parse them
+      again; the caller closes it. Else `assets` is used.
+
+    Returns:
+    - str: A hex digest.
+    """
+    from cloudcap.nested import TemplateLoader
+
+    relevant = relevant_properties(plugins)
+    if loader is not None:
+        return _fingerprint(template, path, relevant, loader, ())
+    loader = TemplateLoader(assets=assets)
+    try:
+        return _fingerprint(template, path, relevant, loader, ())
+    finally:
+        loader.close()
+
+
+def _fingerprint(
+    template: CfnValue,
+    path: str | os.PathLike[Any],
+    relevant: RelevantProperties,
+    loader: TemplateLoader,
+    ancestors: tuple[str, ...],
+) -> str:
+    from cloudcap.nested import NESTED_STACK
+
+    if path:
+        ancestors += (os.path.realpath(path),)
+    resources: dict[str, CfnValue] = {}
+    for logical_id, body in (template.get("Resources") or {}).items():
+        resources[logical_id] = project_resource(body, relevant)
+        if isinstance(body, dict) and body.get("Type") == NESTED_STACK:
+            resources[logical_id]["Template"] = _nested_fingerprint(  # type: ignore
+                body, path, relevant, loader, ancestors
+            )
+    parameters = template.get("Parameters") or {}
+    outputs = template.get("Outputs") or {}
+    return _digest(
+        {
+            "Parameters": {
+                name: p.get("Default") if isinstance(p, dict) else p
+                for name, p in parameters.items()
+            },
+            "Resources": resources,
+            "Outputs": {
+                name: o.get("Value") if isinstance(o, dict) else o
+                for name, o in outputs.items()
+            },
+        }
+    )
+
+
+def _nested_fingerprint(
+    body: CfnValue,
+    parent: str | os.PathLike[Any],
+    relevant: RelevantProperties,
+    loader: TemplateLoader,
+    ancestors: tuple[str, ...],
+) -> Optional[str]:
+    """The fingerprint of a nested stack's template; None if it has none."""
+    from cloudcap.aws import CloudFormationTemplateError
+
+    try:
+        path = loader.template_path(parent, body)
+    except CloudFormationTemplateError:
+        return None
+    if path is None or os.path.realpath(path) in ancestors:
+        # the analysis fails on these
+        return None
+    try:
+        template = loader.get(path)
+    except OSError:
+        logger.debug("no template for nested stack at %s", path)
+        return None
+    return _fingerprint(template, path, relevant, loader, ancestors)
+
+
+def _references(environment: CfnValue) -> CfnValue:
+    """The values of an environment that can refer to resources, in order."""
+    if not isinstance(environment, dict):
+        return environment
+    values = [
+        v
+        for v in environment.values()
+        if not isinstance(v, str) or v.startswith("arn:") or "://" in v
+    ]
+    return sorted(values, key=_canonical) if len(values) > 1 else values
+
+
+def _canonical(value: CfnValue) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def _digest(value: CfnValue) -> str:
+    return hashlib.sha256(_canonical(value).encode("utf-8")).hexdigest()
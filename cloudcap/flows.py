@@ -0,0 +1,114 @@
+"""
+The flows of a passing analysis: the value of every metric of every resource
+and edge in the solution the solver found, as columns (e.g. for
+`pandas.DataFrame(flows.nodes)`), written as JSON or CSV.
+"""
+
+from __future__ import annotations
+import csv
+import json
+import os
+from typing import Any, Optional, Sequence, TextIO, TYPE_CHECKING
+
+from cloudcap import compression
+
+if TYPE_CHECKING:
+    from cloudcap.aws import Resource
+
+# file formats, by extension. Anything else is JSON.
+JSON = "json"
+CSV = "csv"
+FORMATS = {".csv": CSV}
+
+NODE_COLUMNS = ("logical_id", "arn", "metric", "value")
+EDGE_COLUMNS = ("source", "source_arn", "target", "target_arn", "metric", "value")
+# a CSV file has one row per node (without a target) and per edge
+CSV_COLUMNS = ("kind",) + EDGE_COLUMNS
+NODE = "node"
+EDGE = "edge"
+
+
+class Flows:
+    """
+    - nodes: columns `NODE_COLUMNS`, one row per (resource, metric).
+    - edges: columns `EDGE_COLUMNS`, one row per (source, target, metric).
+    """
+
+    nodes: dict[str, list[Any]]
+    edges: dict[str, list[Any]]
+
+    def __init__(
+        self,
+        node_indexes: Sequence[tuple[Resource, str]],
+        node_values: Sequence[int],
+        edge_indexes: Sequence[tuple[Resource, Resource, str]],
+        edge_values: Sequence[int],
+    ) -> None:
+        # ARNs are built on every access: build each once
+        arns: dict[int, str] = {}
+
+        def arn(r: Resource) -> str:
+            if id(r) not in arns:
+                arns[id(r)] = r.arn
+            return arns[id(r)]
+
+        self.nodes = {
+            "logical_id": [r.logical_id for r, _ in node_indexes],
+            "arn": [arn(r) for r, _ in node_indexes],
+            "metric": [m for _, m in node_indexes],
+            "value": list(node_values),
+        }
+        self.edges = {
+            "source": [r.logical_id for r, _, _ in edge_indexes],
+            "source_arn": [arn(r) for r, _, _ in edge_indexes],
+            "target": [r.logical_id for _, r, _ in edge_indexes],
+            "target_arn": [arn(r) for _, r, _ in edge_indexes],
+            "metric": [m for _, _, m in edge_indexes],
+            "value": list(edge_values),
+        }
+
+    def to_dict(self) -> dict[str, dict[str, list[Any]]]:
+        return {"nodes": self.nodes, "edges": self.edges}
+
+
+def write(
+    flows: Flows,
+    path: str | os.PathLike[Any],
+    file_format: Optional[str] = None,
+) -> None:
+    """
+    Writes flows to a file.
+
+    Args:
+    - flows (Flows): The flows.
+    - path: The file, compressed if its name has a compression suffix (see
+      `cloudcap.compression`).
+    - file_format (Optional[str]): `JSON` or `CSV`. Defaults to the format of
+      the file's extension, and to JSON.
+    """
+    if file_format is None:
+        file_format = FORMATS.get(compression.splitext(path)[1].lower(), JSON)
+    with compression.open_file(path, "w", newline="") as f:
+        if file_format == CSV:
+            write_csv(flows, f)
+        else:
+            json.dump(flows.to_dict(), f)
+            f.write("\n")
+
+
+def write_csv(flows: Flows, out: TextIO) -> None:
+    writer = csv.writer(out)
+    writer.writerow(CSV_COLUMNS)
+    nodes = flows.nodes
+    writer.writerows(
+        zip(
+            [NODE] * len(nodes["value"]),
+            nodes["logical_id"],
+            nodes["arn"],
+            [""] * len(nodes["value"]),
+            [""] * len(nodes["value"]),
+            nodes["metric"],
+            nodes["value"],
+        )
+    )
+    writer.writerows(zip([EDGE] * len(flows.edges["value"]), *flows.edges.values()))
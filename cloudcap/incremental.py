@@ -0,0 +1,367 @@
+"""
+Incremental analysis: keeps a constrained analysis around and updates only
+what changed between revisions of a template or of the estimates.
+"""
+
+from __future__ import annotations
+import copy
+import logging
+import os
+from typing import Any, Iterable, Optional
+
+from cloudcap.analyzer import Analyzer, AnalyzerResult, Component, ComponentChecker
+from cloudcap.aws import AWS, Account, CloudFormationStack, Region, Regions, Resource
+from cloudcap.cfn_template import CfnValue
+from cloudcap.estimates import (
+    Estimates,
+    UnknownResourcesError,
+    validate as validate_estimates,
+)
+from cloudcap.fingerprint import relevant_properties, resource_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def resource_digests(template: CfnValue) -> dict[str, str]:
+    """
+    The fingerprints of a template's resources (see `cloudcap.fingerprint`):
+    edits that don't change how a resource is modeled don't re-create it.
+    """
+    relevant = relevant_properties()
+    return {
+        logical_id: resource_fingerprint(body, relevant)
+        for logical_id, body in template["Resources"].items()
+    }
+
+
+def nested_stacks_of(template: CfnValue) -> list[str]:
+    """The logical ids of a template's nested stacks."""
+    from cloudcap.nested import NESTED_STACK
+
+    return [
+        logical_id
+        for logical_id, body in template["Resources"].items()
+        if isinstance(body, dict) and body.get("Type") == NESTED_STACK
+    ]
+
+
+def _directory(path: str | os.PathLike[Any]) -> str:
+    return os.path.realpath(os.path.dirname(os.fspath(path)))
+
+
+class ResourceDiff:
+    """The logical ids that differ between two revisions of a template."""
+
+    added: set[str]
+    removed: set[str]
+    modified: set[str]
+
+    def __init__(self, base: dict[str, str], head: dict[str, str]) -> None:
+        """
+        Args:
+        - base (dict[str, str]): Resource digests of the base revision.
+        - head (dict[str, str]): Resource digests of the head revision.
+        """
+        self.added = head.keys() - base.keys()
+        self.removed = base.keys() - head.keys()
+        self.modified = {
+            logical_id
+            for logical_id in base.keys() & head.keys()
+            if base[logical_id] != head[logical_id]
+        }
+
+    @property
+    def changed(self) -> set[str]:
+        return self.added | self.removed | self.modified
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.modified)
+
+    def __str__(self) -> str:
+        return f"{len(self.added)} added, {len(self.removed)} removed, {len(self.modified)} modified"
+
+
+class IncrementalAnalysis:
+    """
+    An analysis of one template that can be updated in place.
+
+    A new revision of the template only re-creates and re-constrains the
+    resources whose body changed and the resources that depend on them.
+    Estimates are checked in a solver scope, so changing them doesn't touch
+    the template's constraints at all.
+    """
+
+    aws: AWS
+    stack: CloudFormationStack
+    analyzer: Analyzer
+    digests: dict[str, str]
+    # resources whose constraints may have changed in the last update
+    # (None: everything was analyzed from scratch)
+    affected: Optional[list[Resource]]
+
+    def __init__(
+        self,
+        template: CfnValue,
+        region: Region = Regions.us_east_1,
+        account: Account = Account("123"),
+        path: str | os.PathLike[Any] = "",
+        streaming: bool = False,
+        assets: Optional[str] = None,
+    ) -> None:
+        """
+        Args:
+        - template (CfnValue): The first revision of the template.
+        - region (Region), account (Account): Where it is deployed.
+        - path: Its file, next to which nested stacks' templates are found.
+        - streaming (bool): Load revisions as streams (see
+          `CloudFormationStack.load`).
+        - assets (Optional[str]): Directory of the nested stacks' templates
+          (see `cloudcap.nested`).
+        """
+        self.region = region
+        self.account = account
+        self.path = path
+        self.streaming = streaming
+        self.assets = assets
+        self._load(template)
+
+    def _load(self, template: CfnValue) -> None:
+        from cloudcap.nested import TemplateLoader
+
+        self._broken = True
+        self.digests = resource_digests(template)
+        self.aws = AWS()
+        self.aws.add_deployment(self.region, self.account)
+        # kept by the stack, for the nested stacks of later revisions
+        loader = TemplateLoader(streaming=self.streaming, assets=self.assets)
+        try:
+            self.stack = CloudFormationStack(
+                self.aws,
+                self.region,
+                self.account,
+                template,
+                self.path,
+                keep_template=not self.streaming,
+                loader=loader,
+            )
+        finally:
+            loader.close()
+        self.analyzer = Analyzer(self.aws)
+        self.analyzer.constrain()
+        self.affected = None
+        self._broken = False
+
+    @classmethod
+    def from_file(
+        cls,
+        path: str | os.PathLike[Any],
+        region: Region = Regions.us_east_1,
+        account: Account = Account("123"),
+        streaming: bool = False,
+        assets: Optional[str] = None,
+    ) -> IncrementalAnalysis:
+        return cls(
+            CloudFormationStack.load(path, streaming),
+            region,
+            account,
+            path,
+            streaming,
+            assets,
+        )
+
+    def update(
+        self, template: CfnValue, path: Optional[str | os.PathLike[Any]] = None
+    ) -> ResourceDiff:
+        """
+        Moves the analysis to a new revision of the template.
+
+        Args:
+        - template (CfnValue): The new revision.
+        - path: Its file, if it isn't the previous revision's. Without an
+          assets directory, nested stacks' templates are found next to it, so
+          if it is in another directory, the nested stacks are re-created.
+
+        Returns:
+        - ResourceDiff: What changed compared to the previous revision.
+        """
+        digests = resource_digests(template)
+        diff = ResourceDiff(self.digests, digests)
+        if path is not None:
+            if self.assets is None and _directory(path) != _directory(self.path):
+                diff.modified |= {
+                    logical_id
+                    for logical_id in nested_stacks_of(template)
+                    if logical_id in self.digests
+                }
+            self.path = path
+            self.stack.path = path
+        if self._broken:
+            # a previous update failed half-way: start over
+            self._load(template)
+        elif diff:
+            try:
+                removed, changed = self.stack.update(template, diff.changed)
+                self.affected = self.analyzer.update(removed, changed)
+            except Exception:
+                self._broken = True
+                raise
+            logger.info("template updated (%s): %d resources", diff, len(changed))
+        else:
+            self.affected = []
+        self.digests = digests
+        return diff
+
+    def update_from_file(
+        self, path: Optional[str | os.PathLike[Any]] = None
+    ) -> ResourceDiff:
+        return self.update(
+            CloudFormationStack.load(path or self.path, self.streaming), path
+        )
+
+    def check(self, estimates: Estimates) -> AnalyzerResult:
+        return self.analyzer.check(estimates)
+
+
+class RevisionReport:
+    """The outcome of checking a head revision against a base revision."""
+
+    diff: ResourceDiff
+    base: AnalyzerResult
+    head: AnalyzerResult
+    # components of the head that were solved, and that reused the base's result
+    checked: int
+    reused: int
+    # logical ids of the resources in components that didn't pass in the head
+    failing: list[str]
+
+    def __init__(
+        self,
+        diff: ResourceDiff,
+        base: AnalyzerResult,
+        head: AnalyzerResult,
+        checked: int,
+        reused: int,
+        failing: list[str],
+    ) -> None:
+        self.diff = diff
+        self.base = base
+        self.head = head
+        self.checked = checked
+        self.reused = reused
+        self.failing = failing
+
+
+class RevisionAnalysis:
+    """
+    Checks revisions of a template against one set of estimates, reusing the
+    analysis of a base revision.
+
+    The base is solved once, component by component (see
+    `Analyzer.components`). A head revision is then loaded incrementally, and
+    only the components with resources whose constraints changed are solved
+    again; the others keep the base's result. Afterwards, the analysis goes
+    back to the base revision the same way, ready for the next head.
+    """
+
+    analysis: IncrementalAnalysis
+    estimates: Estimates
+    base_result: AnalyzerResult
+
+    def __init__(
+        self,
+        base_template: CfnValue,
+        estimates: Estimates,
+        region: Region = Regions.us_east_1,
+        account: Account = Account("123"),
+        path: str | os.PathLike[Any] = "",
+        assets: Optional[str] = None,
+    ) -> None:
+        # resolving a template rewrites it, so keep a pristine copy of the base
+        self._base_template = copy.deepcopy(base_template)
+        self._base_path = path
+        self.estimates = estimates
+        self.analysis = IncrementalAnalysis(
+            base_template, region, account, path, assets=assets
+        )
+        self._verdicts: dict[frozenset[int], tuple[Component, AnalyzerResult]] = {}
+        self.base_result = self._check_base()
+
+    def _check(
+        self, affected: Optional[Iterable[Resource]]
+    ) -> tuple[list[tuple[Component, AnalyzerResult]], int]:
+        """
+        Solves the components of the current revision, reusing the base's
+        result for components without affected resources.
+
+        Returns:
+        - The components with their results, and how many were reused.
+        """
+        analyzer = self.analysis.analyzer
+        try:
+            validate_estimates(self.analysis.aws, self.estimates)
+        except UnknownResourcesError as e:
+            logger.error("%s", e)
+            raise
+        affected_ids = {id(r) for r in affected} if affected is not None else None
+        checker = ComponentChecker(analyzer, self.estimates)
+        results: list[tuple[Component, AnalyzerResult]] = []
+        reused = 0
+        for component in analyzer.components():
+            known = self._verdicts.get(component.key)
+            if (
+                known is not None
+                and affected_ids is not None
+                and affected_ids.isdisjoint(component.key)
+            ):
+                results.append((component, known[1]))
+                reused += 1
+            else:
+                results.append((component, checker.check(component)))
+        return results, reused
+
+    def _check_base(self) -> AnalyzerResult:
+        results, _ = self._check(self.analysis.affected)
+        # keeping the components also keeps their resources (and so the ids
+        # in the keys) alive
+        self._verdicts = {c.key: (c, result) for c, result in results}
+        return AnalyzerResult.combine(result for _, result in results)
+
+    def compare(
+        self,
+        head_template: CfnValue,
+        path: Optional[str | os.PathLike[Any]] = None,
+    ) -> RevisionReport:
+        """
+        Checks a head revision of the template against the estimates.
+
+        Args:
+        - head_template (CfnValue): The head revision. It is resolved (and so
+          rewritten) in place.
+        - path: Its file, next to which its nested stacks' templates are
+          found. Defaults to the base's.
+
+        Returns:
+        - RevisionReport: The results of the base and the head revisions.
+        """
+        diff = self.analysis.update(head_template, path)
+        try:
+            results, reused = self._check(self.analysis.affected)
+        finally:
+            self.analysis.update(copy.deepcopy(self._base_template), self._base_path)
+            self._check_base()
+
+        failing = [
+            r.logical_id
+            for component, result in results
+            if result != AnalyzerResult.PASS
+            for r in component.resources
+            if r.logical_id
+        ]
+        return RevisionReport(
+            diff,
+            self.base_result,
+            AnalyzerResult.combine(result for _, result in results),
+            checked=len(results) - reused,
+            reused=reused,
+            failing=failing,
+        )
@@ -0,0 +1,223 @@
+"""
+Nested stacks (`AWS::CloudFormation::Stack`), loaded from local files.
+
+A nested stack's template is found, without any network access, from:
+
+- its `aws:asset:path` metadata, which CDK sets to the file of the template
+  in its output directory (e.g. `cdk.out`);
+- otherwise, the last part of its `TemplateURL`, e.g. `child.yaml` or the
+  `<hash>.json` object key of a CDK asset.
+
+Either is looked up in the assets directory, which defaults to the directory
+of the parent template, and must be in it: a path that leaves it (absolute,
+with `..`, or through a symbolic link) is an error, so that a template can't
+make cloudcap read other local files.
+
+Templates are parsed in worker processes (threads on a single CPU): each
+template's nested stacks start loading as soon as it is parsed, so that with
+enough CPUs, loading a tree of templates takes about as long as its deepest
+chain of nested stacks. A template that several stacks nest is parsed once.
+"""
+
+from __future__ import annotations
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+import logging
+import os
+import threading
+from typing import Any, Iterator, Optional
+
+from cloudcap.cfn_template import CfnValue, map_strings_in_cfn_value
+
+logger = logging.getLogger(__name__)
+
+NESTED_STACK = "AWS::CloudFormation::Stack"
+ASSET_PATH = "aws:asset:path"
+# qualifies the logical ids of a nested stack's resources: `Child.Queue`
+SEPARATOR = "."
+
+
+class TemplateLoader:
+    """
+    Loads the templates of nested stacks concurrently, each file once.
+
+    Args:
+    - streaming (bool): See `CloudFormationStack.load`.
+    - assets (Optional[str]): The directory that nested templates are looked
+      up in. Defaults to the directory of each parent template.
+    - max_workers (Optional[int]): Templates loaded at the same time.
+    - processes (Optional[bool]): Parse in worker processes rather than
+      threads: parsing is Python code, which threads only run one at a
+      time. Defaults to processes when there is more than one CPU.
+    """
+
+    streaming: bool
+    assets: Optional[str]
+    processes: bool
+
+    def __init__(
+        self,
+        streaming: bool = False,
+        assets: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        processes: Optional[bool] = None,
+    ) -> None:
+        self.streaming = streaming
+        self.assets = assets
+        cpus = os.cpu_count() or 1
+        self.processes = cpus > 1 if processes is None else processes
+        self._max_workers = max_workers or (cpus if self.processes else cpus + 4)
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._templates: dict[str, Future[CfnValue]] = {}
+
+    def template_path(
+        self, parent: str | os.PathLike[Any], body: CfnValue
+    ) -> Optional[str]:
+        """
+        The file of a nested stack's template.
+
+        Args:
+        - parent: The file of the parent template ("" if it has none).
+        - body (CfnValue): The nested stack's resource body.
+
+        Returns:
+        - Optional[str]: The file (its real path), or None if the body doesn't
+          name one.
+
+        Raises:
+        - CloudFormationTemplateError: If the file isn't in the assets
+          directory.
+        """
+        directory = self.assets or os.path.dirname(os.fspath(parent))
+        metadata = body.get("Metadata") if isinstance(body, dict) else None
+        if isinstance(metadata, dict) and isinstance(metadata.get(ASSET_PATH), str):
+            return _confine(directory, metadata[ASSET_PATH])
+        properties = body.get("Properties") if isinstance(body, dict) else None
+        url = properties.get("TemplateURL") if isinstance(properties, dict) else None
+        # a URL built with Fn::Join or Fn::Sub ends with its object key
+        parts = list(_strings(url))
+        if not parts:
+            return None
+        return _confine(directory, parts[-1].rstrip("/").rsplit("/", 1)[-1])
+
+    def prefetch(
+        self, path: str | os.PathLike[Any], start: bool = True
+    ) -> Optional[Future[CfnValue]]:
+        """
+        Starts loading a template, unless it is loading or loaded already.
+
+        Args:
+        - path: The template's file.
+        - start (bool): Start a pool if the loader has none (it's closed).
+
+        Returns:
+        - Optional[Future[CfnValue]]: The template, or None if the loader is
+          closed and `start` is false.
+        """
+        key = os.path.realpath(path)
+        with self._lock:
+            if key in self._templates:
+                return self._templates[key]
+            if self._pool is None:
+                if not start:
+                    return None
+                self._pool = self._executor()
+            future = self._pool.submit(_load, key, self.streaming)
+            self._templates[key] = future
+        # its nested stacks start loading as soon as it is parsed
+        future.add_done_callback(lambda f: self._prefetch_nested(key, f))
+        return future
+
+    def get(self, path: str | os.PathLike[Any]) -> CfnValue:
+        """
+        A copy of a template: stacks resolve their templates in place.
+
+        Raises:
+        - CloudFormationTemplateError: If the file is not a template.
+        - OSError: If the file can't be read.
+        """
+        future = self.prefetch(path)
+        assert future is not None
+        return map_strings_in_cfn_value(future.result(), str)
+
+    def close(self) -> None:
+        """
+        Stops loading templates. Loaded ones are kept, and the loader can be
+        used again: it starts a new pool.
+        """
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            # loaded again if they are needed after all
+            for key, future in list(self._templates.items()):
+                if not future.done() or future.cancelled():
+                    del self._templates[key]
+
+    def _executor(self) -> Executor:
+        if self.processes:
+            return ProcessPoolExecutor(self._max_workers)
+        return ThreadPoolExecutor(
+            self._max_workers, thread_name_prefix="cloudcap-templates"
+        )
+
+    def _prefetch_nested(self, path: str, future: Future[CfnValue]) -> None:
+        if future.cancelled() or future.exception() is not None:
+            # raised by get(), if the template is needed
+            return
+        from cloudcap.aws import CloudFormationTemplateError
+
+        for body in nested_stacks(future.result()):
+            try:
+                child = self.template_path(path, body)
+            except CloudFormationTemplateError:
+                # raised again when the stack is created
+                continue
+            # once closed, nothing needs it anymore
+            if child is not None and self.prefetch(child, start=False) is None:
+                return
+
+
+def _load(path: str, streaming: bool) -> CfnValue:
+    from cloudcap.aws import CloudFormationStack
+
+    template = CloudFormationStack.load(path, streaming)
+    logger.debug("loaded nested template %s", path)
+    return template
+
+
+def _confine(directory: str, name: str) -> str:
+    """The real path of a file of a directory, which `name` must not leave."""
+    from cloudcap.aws import CloudFormationTemplateError
+
+    root = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(root, name))
+    if name in ("", ".", "..") or os.path.commonpath([root, path]) != root:
+        raise CloudFormationTemplateError(
+            f"nested template {name!r} is not a file of {root}"
+        )
+    return path
+
+
+def nested_stacks(template: CfnValue) -> Iterator[CfnValue]:
+    """The bodies of a template's nested stacks."""
+    for body in template.get("Resources", {}).values():
+        if isinstance(body, dict) and body.get("Type") == NESTED_STACK:
+            yield body
+
+
+def _strings(value: CfnValue) -> Iterator[str]:
+    """The strings of a value, in order."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, list):
+        for v in value:
+            yield from _strings(v)
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _strings(v)
@@ -1,7 +1,7 @@
 from __future__ import annotations
 import abc
-from cloudcap.aws import AWS
-from typing import TYPE_CHECKING
+from cloudcap.aws import AWS, Resource
+from typing import Iterable, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from cloudcap.analyzer import (
@@ -16,6 +16,14 @@ if TYPE_CHECKING:
 
 
 class Plugin(abc.ABC):
+    # part of the key of cached analysis results (see cloudcap.cache): bump it
+    # whenever the constraints that the plugin generates change
+    version: str = "1"
+    # properties of resource types (beyond those the stack models, see
+    # aws.MODELED_PROPERTIES) that the plugin's constraints depend on: part
+    # of the fingerprint of templates (see cloudcap.fingerprint)
+    relevant_properties: dict[str, tuple[str, ...]] = {}
+
     def __init__(self, analyzer: Analyzer) -> None:
         super().__init__()
         self.analyzer = analyzer
@@ -37,3 +45,14 @@ class Plugin(abc.ABC):
     @abc.abstractmethod
     def constrain(self) -> None:
         raise NotImplementedError("Plugins need to have a constrain() method")
+
+    def constrain_resources(self, resources: Iterable[Resource]) -> None:
+        """
+        Constrain only the given resources, after they were (re-)created.
+
+        Plugins that support this should add each resource's constraints
+        within `self.analyzer.owned_by(resource)`. By default, everything is
+        constrained again: constraints that aren't attributed to a resource
+        are dropped and regenerated on every update.
+        """
+        self.constrain()
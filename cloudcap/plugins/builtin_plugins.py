@@ -1,6 +1,7 @@
+from typing import Iterable
 from cloudcap.metrics import NREQUESTS
 from cloudcap.plugins import Plugin
-from cloudcap.aws import AWSSQSQueue, AWSLambdaFunction
+from cloudcap.aws import AWSSQSQueue, AWSLambdaFunction, Resource
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,9 +21,13 @@ class AWSLambdaFunctionPlugin(Plugin):
         return "builtin_aws_lambda_function_plugin"
 
     def constrain(self) -> None:
-        for resource in self.aws.arns.values():
+        self.constrain_resources(self.aws.arns.values())
+
+    def constrain_resources(self, resources: Iterable[Resource]) -> None:
+        for resource in resources:
             if isinstance(resource, AWSLambdaFunction):
-                self.constrain_one(resource)
+                with self.analyzer.owned_by(resource):
+                    self.constrain_one(resource)
 
     def constrain_one(self, function: AWSLambdaFunction) -> None:
         """
@@ -37,7 +42,7 @@ class AWSLambdaFunctionPlugin(Plugin):
         """
         for v in function.environment.values():
             if isinstance(v, str):  # type: ignore
-                maybe_resource = self.aws[v]
+                maybe_resource = self.aws.get(v)
                 if maybe_resource:
                     # can't really constrain much
                     # the only thing is that it may be >= 0
@@ -57,9 +62,13 @@ class AWSSQSQueuePlugin(Plugin):
         return "builtin_aws_sqs_queue_plugin"
 
     def constrain(self) -> None:
-        for resource in self.aws.arns.values():
+        self.constrain_resources(self.aws.arns.values())
+
+    def constrain_resources(self, resources: Iterable[Resource]) -> None:
+        for resource in resources:
             if isinstance(resource, AWSSQSQueue):
-                self.constrain_one(resource)
+                with self.analyzer.owned_by(resource):
+                    self.constrain_one(resource)
 
     def constrain_one(self, queue: AWSSQSQueue) -> None:
         """
@@ -0,0 +1,461 @@
+"""
+Presolving: simplifies the constraints of an analysis with its estimates
+before z3 solves them.
+
+Flow constraints and most plugin constraints are linear equations between a
+few variables, and estimates fix many of the variables, so much of a problem
+is decided by substitution alone:
+
+- variables that are equal, e.g. a queue and the edge to the function polling
+  it, or a resource and its only incoming edge, are merged into one;
+- estimates are propagated through the equations: an equation with a single
+  unknown variable left determines it;
+- an equation or bound without unknowns left is checked: one that doesn't
+  hold rejects the estimates, without z3;
+- bounds on a variable that nothing else constrains only have to agree.
+
+z3 solves what is left, over the variables that remain, and isn't called at
+all when nothing is. Constraints that aren't linear are left to z3 as they
+are, tied to the variables they use.
+"""
+
+from __future__ import annotations
+from collections import deque
+import logging
+from typing import Any, Optional, TYPE_CHECKING
+
+import z3  # type: ignore
+from z3 import z3core  # type: ignore
+
+from cloudcap import profiling
+from cloudcap.analyzer import (
+    AnalyzerResult,
+    Constraint,
+    EdgeVariableIndex,
+    NodeVariableIndex,
+)
+from cloudcap.estimates import (
+    Estimates,
+    UnknownResourcesError,
+    validate as validate_estimates,
+)
+
+if TYPE_CHECKING:
+    from cloudcap.analyzer import Analyzer
+
+logger = logging.getLogger(__name__)
+
+Index = NodeVariableIndex | EdgeVariableIndex
+
+# relations of a linear constraint to 0
+EQ = "=="
+GE = ">="
+
+
+class Linear:
+    """`sum(coefficients[v] * v) + constant` == 0 (EQ) or >= 0 (GE)."""
+
+    coefficients: dict[Index, int]
+    constant: int
+    relation: str
+
+    def __init__(
+        self, coefficients: dict[Index, int], constant: int, relation: str
+    ) -> None:
+        self.coefficients = coefficients
+        self.constant = constant
+        self.relation = relation
+
+    def holds(self) -> bool:
+        """Whether the constraint holds, once it has no variables left."""
+        if self.relation == EQ:
+            return self.constant == 0
+        return self.constant >= 0
+
+    def __str__(self) -> str:
+        terms = ""
+        for index, coefficient in self.coefficients.items():
+            sign = "-" if coefficient < 0 else "+"
+            factor = "" if abs(coefficient) == 1 else f"{abs(coefficient)}*"
+            terms += f" {sign} {factor}{_index_name(index)}"
+        terms = terms.removeprefix(" + ").removeprefix(" ") or "0"
+        return f"{terms} {self.relation} {-self.constant}"
+
+
+class Presolved:
+    """
+    - result: PASS or REJECT if the presolve decided, otherwise None.
+    - constraints: The constraints left for z3, if undecided.
+    - eliminated: Number of variables that z3 doesn't see.
+    - conflict: On REJECT, the constraint found not to hold.
+    """
+
+    result: Optional[AnalyzerResult]
+    constraints: list[Constraint]
+    eliminated: int
+    conflict: Optional[str]
+
+    def __init__(
+        self,
+        result: Optional[AnalyzerResult],
+        constraints: list[Constraint],
+        eliminated: int,
+        conflict: Optional[str] = None,
+    ) -> None:
+        self.result = result
+        self.constraints = constraints
+        self.eliminated = eliminated
+        self.conflict = conflict
+
+
+def presolve(analyzer: Analyzer, estimates: Estimates) -> Presolved:
+    """
+    Simplifies a constrained analyzer's constraints with estimates.
+
+    Only the constraints that the plugins generated and the flow constraints
+    are considered: constraints added to the solver otherwise are not.
+
+    Args:
+    - analyzer (Analyzer): The constrained analyzer.
+    - estimates (Estimates): The usage estimates to check.
+
+    Returns:
+    - Presolved: The result if decided, otherwise the constraints left.
+
+    Raises:
+    - UnknownResourcesError: If an estimated resource doesn't exist.
+    """
+    try:
+        validate_estimates(analyzer.aws, estimates)
+    except UnknownResourcesError as e:
+        logger.error("%s", e)
+        raise
+    with profiling.span("presolve"):
+        presolved = _Presolve(analyzer, estimates).run()
+    profiling.count("presolve_eliminated", presolved.eliminated)
+    profiling.count("presolve_constraints", len(presolved.constraints))
+    if presolved.conflict is not None:
+        logger.info("presolve rejected the estimates at %s", presolved.conflict)
+    return presolved
+
+
+class _Presolve:
+    def __init__(self, analyzer: Analyzer, estimates: Estimates) -> None:
+        self.analyzer = analyzer
+        # union-find of equal variables: roots aren't in `parent`
+        self.parent: dict[Index, Index] = {}
+        self.values: dict[Index, int] = {}
+        # linear constraints besides estimates and nonnegativity
+        self.originals: list[Linear] = []
+        # constraints that aren't linear, with the variables they may use
+        self.opaque: list[tuple[Constraint, set[Index]]] = []
+        self.nonnegative = analyzer.nonnegative()
+        self.estimates = [
+            ((analyzer.aws.logical_id_to_resource[logical_id], metric), estimate)
+            for logical_id, metrics in estimates.items()
+            for metric, estimate in metrics.items()
+        ]
+
+        parser = _Parser(analyzer, set().union(*analyzer.group_variables.values()))
+        for owner, group in analyzer.groups.items():
+            for constraint in group:
+                linear = parser.parse(constraint)
+                if linear is None:
+                    self.opaque.append((constraint, analyzer.group_variables[owner]))
+                else:
+                    self.originals.extend(linear)
+        for index, incomings in analyzer.flow_sums().items():
+            coefficients: dict[Index, int] = {index: 1}
+            for incoming in incomings:
+                coefficients[incoming] = -1
+            self.originals.append(Linear(coefficients, 0, EQ))
+
+    def find(self, index: Index) -> Index:
+        parent = self.parent
+        root = index
+        while root in parent:
+            root = parent[root]
+        while index is not root and index in parent:
+            parent[index], index = root, parent[index]
+        return root
+
+    def run(self) -> Presolved:
+        find = self.find
+        for linear in self.originals:
+            if linear.relation == EQ and not linear.constant:
+                if len(linear.coefficients) == 2:
+                    (a, ca), (b, cb) = linear.coefficients.items()
+                    if ca == -cb:
+                        root_a, root_b = find(a), find(b)
+                        if root_a != root_b:
+                            self.parent[root_b] = root_a
+
+        # in terms of the merged variables
+        rows: list[Linear] = []
+        occurs: dict[Index, list[int]] = {}
+        for linear in self.originals:
+            coefficients: dict[Index, int] = {}
+            for index, coefficient in linear.coefficients.items():
+                root = find(index)
+                coefficients[root] = coefficients.get(root, 0) + coefficient
+            if len(coefficients) < len(linear.coefficients):
+                coefficients = {r: c for r, c in coefficients.items() if c}
+            for root in coefficients:
+                occurs.setdefault(root, []).append(len(rows))
+            rows.append(Linear(coefficients, linear.constant, linear.relation))
+        nonnegative = {find(index) for index in self.nonnegative}
+
+        # propagate the estimates, and the variables that equations determine
+        values = self.values
+        decided = [False] * len(rows)
+        queue = deque(i for i, row in enumerate(rows) if len(row.coefficients) <= 1)
+
+        def assign(root: Index, value: int) -> bool:
+            if value < 0 and root in nonnegative:
+                return False
+            values[root] = value
+            for j in occurs.get(root, ()):
+                if not decided[j]:
+                    other = rows[j]
+                    other.constant += other.coefficients.pop(root) * value
+                    if len(other.coefficients) <= 1:
+                        queue.append(j)
+            return True
+
+        for index, estimate in self.estimates:
+            root = find(index)
+            if root in values:
+                if values[root] != estimate:
+                    return self._rejected(f"{_index_name(index)} == {estimate}")
+            elif not assign(root, estimate):
+                return self._rejected(f"{_index_name(index)} >= 0")
+        while queue:
+            i = queue.popleft()
+            row = rows[i]
+            if decided[i]:
+                continue
+            if not row.coefficients:
+                decided[i] = True
+                if not row.holds():
+                    return self._rejected(str(self.originals[i]))
+                continue
+            if row.relation != EQ:
+                # a bound, once the rest is propagated
+                continue
+            ((root, coefficient),) = row.coefficients.items()
+            value, remainder = divmod(-row.constant, coefficient)
+            decided[i] = True
+            if remainder or not assign(root, value):
+                return self._rejected(str(self.originals[i]))
+
+        # bounds on single variables, and what is left for z3
+        bounds: dict[Index, list[int]] = {}
+        residual: list[int] = []
+        for i, row in enumerate(rows):
+            if decided[i]:
+                continue
+            if len(row.coefficients) > 1:
+                residual.append(i)
+            else:
+                bounds.setdefault(next(iter(row.coefficients)), []).append(i)
+
+        remaining: dict[Index, None] = {}
+        for i in residual:
+            remaining.update(dict.fromkeys(rows[i].coefficients))
+        for _, indexes in self.opaque:
+            for index in indexes:
+                if find(index) not in values:
+                    remaining[find(index)] = None
+
+        for root, rows_of_root in bounds.items():
+            if root in remaining:
+                residual.extend(rows_of_root)
+                continue
+            low = 0 if root in nonnegative else None
+            high = None
+            for i in rows_of_root:
+                ((_, coefficient),) = rows[i].coefficients.items()
+                constant = rows[i].constant
+                if coefficient > 0:
+                    # coefficient * x >= -constant
+                    bound = -(constant // coefficient)
+                    low = bound if low is None else max(low, bound)
+                else:
+                    bound = constant // -coefficient
+                    high = bound if high is None else min(high, bound)
+                if low is not None and high is not None and low > high:
+                    return self._rejected(str(self.originals[i]))
+
+        eliminated = self._variables() - len(remaining)
+        if not residual and not self.opaque:
+            return Presolved(AnalyzerResult.PASS, [], eliminated)
+        constraints = self._constraints(
+            rows, residual, [r for r in remaining if r in nonnegative]
+        )
+        return Presolved(None, constraints, eliminated)
+
+    def _constraints(
+        self, rows: list[Linear], residual: list[int], nonnegative: list[Index]
+    ) -> list[Constraint]:
+        variable = self.analyzer._variable  # pylint: disable=protected-access
+        constraints = []
+        for i in residual:
+            row = rows[i]
+            terms = [
+                variable(root) if c == 1 else c * variable(root)
+                for root, c in row.coefficients.items()
+            ]
+            total = z3.Sum(terms)
+            if row.relation == EQ:
+                constraints.append(total == -row.constant)
+            else:
+                constraints.append(total >= -row.constant)
+        for root in nonnegative:
+            constraints.append(variable(root) >= 0)
+        for constraint, indexes in self.opaque:
+            # tie the variables it uses to what they were merged into
+            for index in indexes:
+                root = self.find(index)
+                if root in self.values:
+                    constraints.append(variable(index) == self.values[root])
+                elif root != index:
+                    constraints.append(variable(index) == variable(root))
+            constraints.append(constraint)
+        return constraints
+
+    def _rejected(self, conflict: str) -> Presolved:
+        return Presolved(AnalyzerResult.REJECT, [], self._variables(), conflict)
+
+    def _variables(self) -> int:
+        return len(self.analyzer.node_variables) + len(self.analyzer.edge_variables)
+
+
+class _Parser:
+    """Reads z3 constraints as `Linear` constraints, through z3's C API."""
+
+    def __init__(self, analyzer: Analyzer, indexes: set[Index]) -> None:
+        self.ctx = analyzer.ctx.ref()
+        get_id = z3core.Z3_get_ast_id
+        variable = analyzer._variable  # pylint: disable=protected-access
+        self.indexes = {
+            get_id(self.ctx, variable(index).as_ast()): index for index in indexes
+        }
+
+    def parse(self, constraint: Constraint) -> Optional[list[Linear]]:
+        """The linear constraints that `constraint` is the conjunction of, or None."""
+        return self._relation(constraint.as_ast())
+
+    def _app(self, ast: Any) -> tuple[int, list[Any]]:
+        """The kind of an application's declaration, and its arguments."""
+        ctx = self.ctx
+        decl = z3core.Z3_get_app_decl(ctx, ast)
+        args = [
+            z3core.Z3_get_app_arg(ctx, ast, i)
+            for i in range(z3core.Z3_get_app_num_args(ctx, ast))
+        ]
+        return z3core.Z3_get_decl_kind(ctx, decl), args
+
+    def _relation(self, ast: Any) -> Optional[list[Linear]]:
+        if z3core.Z3_get_ast_kind(self.ctx, ast) != z3.Z3_APP_AST:
+            return None
+        op, args = self._app(ast)
+        if op == z3.Z3_OP_AND:
+            conjuncts = []
+            for arg in args:
+                linear = self._relation(arg)
+                if linear is None:
+                    return None
+                conjuncts.extend(linear)
+            return conjuncts
+        if len(args) != 2 or op not in _RELATIONS:
+            return None
+        left, right = self._term(args[0]), self._term(args[1])
+        if left is None or right is None:
+            return None
+        # left - right REL 0
+        coefficients = dict(left[0])
+        for index, coefficient in right[0].items():
+            coefficients[index] = coefficients.get(index, 0) - coefficient
+        constant = left[1] - right[1]
+        sign, offset, relation = _RELATIONS[op]
+        return [
+            Linear(
+                {i: sign * c for i, c in coefficients.items() if c},
+                sign * constant + offset,
+                relation,
+            )
+        ]
+
+    def _term(self, ast: Any) -> Optional[tuple[dict[Index, int], int]]:
+        """An integer term as (coefficients, constant), or None."""
+        ctx = self.ctx
+        # most terms are variables
+        index = self.indexes.get(z3core.Z3_get_ast_id(ctx, ast))
+        if index is not None:
+            return {index: 1}, 0
+        kind = z3core.Z3_get_ast_kind(ctx, ast)
+        if kind == z3.Z3_NUMERAL_AST:
+            try:
+                return {}, int(z3core.Z3_get_numeral_string(ctx, ast))
+            except ValueError:
+                # not an integer
+                return None
+        if kind != z3.Z3_APP_AST:
+            return None
+        op, args = self._app(ast)
+        if op == z3.Z3_OP_UNINTERPRETED or not args:
+            # not one of the analyzer's variables
+            return None
+        terms = []
+        for arg in args:
+            term = self._term(arg)
+            if term is None:
+                return None
+            terms.append(term)
+        if op == z3.Z3_OP_ADD:
+            return _combine(terms, [1] * len(terms))
+        if op == z3.Z3_OP_SUB:
+            return _combine(terms, [1] + [-1] * (len(terms) - 1))
+        if op == z3.Z3_OP_UMINUS and len(terms) == 1:
+            return _combine(terms, [-1])
+        if op == z3.Z3_OP_MUL:
+            factor = 1
+            variable_terms = []
+            for coefficients, constant in terms:
+                if coefficients:
+                    variable_terms.append((coefficients, constant))
+                else:
+                    factor *= constant
+            if not variable_terms:
+                return {}, factor
+            if len(variable_terms) == 1:
+                return _combine(variable_terms, [factor])
+        return None
+
+
+# relation -> (sign, offset, relation) of `sign * (left - right) + offset`
+_RELATIONS = {
+    z3.Z3_OP_EQ: (1, 0, EQ),
+    z3.Z3_OP_GE: (1, 0, GE),
+    z3.Z3_OP_LE: (-1, 0, GE),
+    # integers: left > right is left - right - 1 >= 0
+    z3.Z3_OP_GT: (1, -1, GE),
+    z3.Z3_OP_LT: (-1, -1, GE),
+}
+
+
+def _combine(
+    terms: list[tuple[dict[Index, int], int]], factors: list[int]
+) -> tuple[dict[Index, int], int]:
+    coefficients: dict[Index, int] = {}
+    constant = 0
+    for (term_coefficients, term_constant), factor in zip(terms, factors):
+        for index, coefficient in term_coefficients.items():
+            coefficients[index] = coefficients.get(index, 0) + factor * coefficient
+        constant += factor * term_constant
+    return coefficients, constant
+
+
+def _index_name(index: Index) -> str:
+    """`Queue.nrequests`, or `Queue->Function.nrequests` for an edge."""
+    return "->".join(r.logical_id for r in index[:-1]) + f".{index[-1]}"  # type: ignore
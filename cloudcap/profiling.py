@@ -0,0 +1,125 @@
+"""
+Built-in instrumentation: timing spans for each phase of an analysis,
+counts of what was analyzed, and the solver's statistics.
+
+Profiling is off unless enabled for the current context (thread or task),
+and then costs a single context variable lookup per span.
+"""
+
+from __future__ import annotations
+import contextlib
+import contextvars
+import time
+from typing import Any, ContextManager, Iterator, Optional
+
+
+class Span:
+    """A timed phase; spans with the same path accumulate."""
+
+    def __init__(self, profile: Profile, name: str) -> None:
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self) -> Span:
+        self.profile._stack.append(self.name)
+        self.path = "/".join(self.profile._stack)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        seconds = time.perf_counter() - self.start
+        self.profile._stack.pop()
+        spent = self.profile.spans.setdefault(self.path, [0.0, 0])
+        spent[0] += seconds
+        spent[1] += 1
+
+
+class Profile:
+    """
+    The report of a profiled analysis.
+
+    - spans: seconds spent and number of calls, by phase. Nested phases are
+      named `outer/inner`.
+    - counts: sizes of what was analyzed (resources, edges, variables, ...).
+    - solver: the solver's statistics, from the last time it was called.
+    """
+
+    spans: dict[str, list[Any]]
+    counts: dict[str, int]
+    solver: dict[str, Any]
+
+    def __init__(self) -> None:
+        self.spans = {}
+        self.counts = {}
+        self.solver = {}
+        self._stack: list[str] = []
+        self._start = time.perf_counter()
+
+    def span(self, name: str) -> Span:
+        return Span(self, name)
+
+    def count(self, name: str, value: int) -> None:
+        self.counts[name] = value
+
+    def solver_statistics(self, statistics: Any) -> None:
+        """Records a z3 `Statistics` object."""
+        self.solver = {k: statistics.get_key_value(k) for k in statistics.keys()}
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "seconds": time.perf_counter() - self._start,
+            "spans": {
+                path: {"seconds": seconds, "calls": calls}
+                for path, (seconds, calls) in self.spans.items()
+            },
+            "counts": self.counts,
+            "solver": self.solver,
+        }
+
+
+_profile: contextvars.ContextVar[Optional[Profile]] = contextvars.ContextVar(
+    "cloudcap_profile", default=None
+)
+_NO_SPAN = contextlib.nullcontext()
+
+
+def current() -> Optional[Profile]:
+    """The profile being recorded in this context, if profiling is enabled."""
+    return _profile.get()
+
+
+def enable() -> Profile:
+    """Enables profiling for the rest of the current context."""
+    profile = Profile()
+    _profile.set(profile)
+    return profile
+
+
+def disable() -> None:
+    """Disables profiling for the rest of the current context."""
+    _profile.set(None)
+
+
+@contextlib.contextmanager
+def profiling() -> Iterator[Profile]:
+    """Enables profiling within the block."""
+    profile = Profile()
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+
+def span(name: str) -> ContextManager[Any]:
+    """Times the block as phase `name`, if profiling is enabled."""
+    profile = _profile.get()
+    if profile is None:
+        return _NO_SPAN
+    return profile.span(name)
+
+
+def count(name: str, value: int) -> None:
+    profile = _profile.get()
+    if profile is not None:
+        profile.count(name, value)
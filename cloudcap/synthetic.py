@@ -0,0 +1,128 @@
+"""
+Deterministic generator of synthetic CloudFormation templates and matching
+estimates, for benchmarks and tests.
+
+A template is made of identical *units*. A unit is a chain of *stages*: in
+each stage, `fan_in` SQS queues are mapped to `fan_out` Lambda functions
+(one event source mapping per pair), and every Lambda of a stage refers to
+the queues of the next stage through its environment variables.
+"""
+
+from __future__ import annotations
+import os
+import random
+from typing import Any, Optional
+
+import yaml
+
+from cloudcap.cfn_template import CfnValue
+from cloudcap.estimates import Estimates
+from cloudcap.metrics import NREQUESTS
+
+
+def resources_per_unit(chain_length: int = 2, fan_in: int = 1, fan_out: int = 1) -> int:
+    return chain_length * (fan_in + fan_out + fan_in * fan_out)
+
+
+def generate(
+    resources: int,
+    chain_length: int = 2,
+    fan_in: int = 1,
+    fan_out: int = 1,
+    cross_references: int = 0,
+    consistent: bool = True,
+    seed: int = 0,
+) -> tuple[CfnValue, Estimates]:
+    """
+    Generates a template and estimates for it.
+
+    Args:
+    - resources (int): Approximate number of resources (rounded up to whole units).
+    - chain_length (int): Number of stages per unit.
+    - fan_in (int): Queues per stage, all mapped to each Lambda of the stage.
+    - fan_out (int): Lambdas per stage, each mapped from every queue of the stage.
+    - cross_references (int): Extra environment variables referring to a
+      random queue anywhere in the template, joining units together.
+    - consistent (bool): Whether the estimates are consistent with the
+      template. If not, one Lambda's estimate is off by one.
+    - seed (int): Seed for the estimates and the cross references.
+
+    Returns:
+    - tuple[CfnValue, Estimates]: The template and the estimates.
+    """
+    rng = random.Random(seed)
+    units = max(1, -(-resources // resources_per_unit(chain_length, fan_in, fan_out)))
+    template_resources: dict[str, CfnValue] = {}
+    estimates: Estimates = {}
+    all_queues: list[str] = []
+
+    def queue_id(u: int, s: int, i: int) -> str:
+        return f"Queue{u}x{s}x{i}"
+
+    def function_id(u: int, s: int, j: int) -> str:
+        return f"Function{u}x{s}x{j}"
+
+    for u in range(units):
+        for s in range(chain_length):
+            queues = [queue_id(u, s, i) for i in range(fan_in)]
+            all_queues.extend(queues)
+            for q in queues:
+                template_resources[q] = {
+                    "Type": "AWS::SQS::Queue",
+                    "Properties": {"QueueName": q.lower()},
+                }
+                estimates[q] = {NREQUESTS: rng.randrange(1000)}
+
+            queue_total = sum(estimates[q][NREQUESTS] for q in queues)
+            for j in range(fan_out):
+                f = function_id(u, s, j)
+                properties: dict[str, Any] = {"FunctionName": f.lower()}
+                if s + 1 < chain_length:
+                    properties["Environment"] = {
+                        f"QUEUE_{i}": {"Fn::GetAtt": [queue_id(u, s + 1, i), "Arn"]}
+                        for i in range(fan_in)
+                    }
+                template_resources[f] = {
+                    "Type": "AWS::Lambda::Function",
+                    "Properties": properties,
+                }
+                # a Lambda gets everything from the queues mapped to it
+                estimates[f] = {NREQUESTS: queue_total}
+                for q in queues:
+                    template_resources[f"{q}To{f}"] = {
+                        "Type": "AWS::Lambda::EventSourceMapping",
+                        "Properties": {
+                            "EventSourceArn": {"Fn::GetAtt": [q, "Arn"]},
+                            "FunctionName": {"Fn::GetAtt": [f, "Arn"]},
+                        },
+                    }
+
+    functions = [
+        k for k, v in template_resources.items() if v["Type"] == "AWS::Lambda::Function"
+    ]
+    for n in range(cross_references):
+        f = rng.choice(functions)
+        properties = template_resources[f]["Properties"]
+        properties.setdefault("Environment", {})[f"CROSS_{n}"] = {
+            "Fn::GetAtt": [rng.choice(all_queues), "Arn"]
+        }
+
+    if not consistent:
+        estimates[rng.choice(functions)][NREQUESTS] += 1
+
+    return {"Resources": template_resources}, estimates
+
+
+def write(
+    template: CfnValue,
+    estimates: Estimates,
+    template_path: str | os.PathLike[Any],
+    estimates_path: Optional[str | os.PathLike[Any]] = None,
+) -> None:
+    """Writes a generated template (and its estimates) as YAML."""
+    dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+    with open(template_path, "w", encoding="utf-8") as f:
+        yaml.dump(template, f, Dumper=dumper, sort_keys=False)
+    if estimates_path:
+        with open(estimates_path, "w", encoding="utf-8") as f:
+            yaml.dump(estimates, f, Dumper=dumper, sort_keys=False)
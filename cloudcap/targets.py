@@ -0,0 +1,205 @@
+"""
+Deployment targets: one template deployed to many (region, account) pairs,
+e.g. the stack instances of a StackSet.
+
+The template is loaded, resolved and constrained once, for the first target.
+The other targets get replicas of its resources with only their ARNs and
+URLs substituted (see `CloudFormationStack.replicate`), and instances of its
+constraints (see `Analyzer.replicate`).
+
+Estimates for a plain logical id apply to the resource in every target;
+`<region>/<account>/<logical id>` only estimates one target's resource.
+"""
+
+from __future__ import annotations
+import logging
+from typing import Iterable, Optional, TYPE_CHECKING
+
+from cloudcap.aws import AWS, Account, CloudFormationStack, Region, Regions, Resource
+from cloudcap.cfn_template import CfnValue
+from cloudcap.estimates import Estimates, UnknownResourcesError
+
+if TYPE_CHECKING:
+    from cloudcap.analyzer import Analyzer
+    from cloudcap.nested import TemplateLoader
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = "/"
+
+
+class Target:
+    """A (region, account) pair to deploy to."""
+
+    region: Region
+    account: Account
+
+    def __init__(self, region: Region, account: Account) -> None:
+        self.region = region
+        self.account = account
+
+    @staticmethod
+    def parse(text: str) -> Target:
+        """Parses `<region>/<account id>`, e.g. `eu-west-1/123456789012`."""
+        region, sep, account_id = text.partition(SEPARATOR)
+        if not sep or not region or not account_id or SEPARATOR in account_id:
+            raise ValueError(f"expected <region>/<account id>, got {text}")
+        return Target(Regions.get(region), Account(account_id))
+
+    def qualify(self, logical_id: str) -> str:
+        """The logical id of a resource of this target."""
+        return f"{self}{SEPARATOR}{logical_id}"
+
+    def __str__(self) -> str:
+        return f"{self.region}{SEPARATOR}{self.account.account_id}"
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+class UnknownTargetsError(UnknownResourcesError):
+    """Estimates are qualified with targets that the template isn't deployed to."""
+
+    targets: list[str]
+
+    def __init__(self, logical_ids: list[str], targets: list[str]) -> None:
+        self.targets = targets
+        super().__init__(logical_ids)
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self.logical_ids)} estimates are for targets that are not "
+            f"deployed: {', '.join(self.logical_ids)} (deployed: {', '.join(self.targets)})"
+        )
+
+
+DEFAULT_TARGETS = [Target(Regions.us_east_1, Account("123"))]
+
+
+def parse_targets(texts: Optional[Iterable[str]]) -> list[Target]:
+    targets = [Target.parse(t) for t in texts or ()]
+    return targets or DEFAULT_TARGETS
+
+
+def replicate(
+    stack: CloudFormationStack, targets: list[Target]
+) -> list[dict[Resource, Resource]]:
+    """
+    Deploys a stack's resources to more targets.
+
+    Every target's resources, including the stack's own, are registered
+    under their qualified logical ids (see `Target.qualify`).
+
+    Args:
+    - stack (CloudFormationStack): The stack, deployed to its first target.
+    - targets (list[Target]): The other targets.
+
+    Returns:
+    - list[dict[Resource, Resource]]: For each target, its resources by the
+      stack's resources they replicate.
+    """
+    aws = stack.aws
+    replicas: list[dict[Resource, Resource]] = []
+    for target in targets:
+        aws.add_deployment(target.region, target.account)
+        replica = stack.replicate(target.region, target.account)
+        for original, copy in replica.items():
+            aws.logical_id_to_resource[target.qualify(original.logical_id or "")] = copy
+        replicas.append(replica)
+    own = Target(stack.region, stack.account)
+    for original in replicas[0] if replicas else ():
+        aws.logical_id_to_resource[own.qualify(original.logical_id or "")] = original
+    return replicas
+
+
+def deploy(
+    aws: AWS,
+    path: str,
+    targets: list[Target],
+    streaming: bool = False,
+    demand: Optional[Iterable[str]] = None,
+    assets: Optional[str] = None,
+    template: Optional[CfnValue] = None,
+    loader: Optional[TemplateLoader] = None,
+) -> Analyzer:
+    """
+    Deploys a template to every target, and constrains it.
+
+    Args:
+    - aws (AWS): The registry to deploy to.
+    - path (str): The CloudFormation template.
+    - targets (list[Target]): Where to deploy it.
+    - streaming (bool): See `CloudFormationStack.load`.
+    - demand (Optional[Iterable[str]]): See `CloudFormationStack`. Qualified
+      logical ids demand their unqualified resource.
+    - assets (Optional[str]): Directory of the nested stacks' templates (see
+      `cloudcap.nested`).
+    - template, loader: The template of `path` and a loader of nested
+      templates, if they are loaded (see `CloudFormationStack.from_file`).
+
+    Returns:
+    - Analyzer: The constrained analyzer.
+    """
+    # z3 is only imported once there is something to analyze: a cached
+    # result doesn't need it
+    from cloudcap.analyzer import Analyzer
+
+    first, *others = targets
+    deployment = aws.add_deployment(first.region, first.account)
+    stack = deployment.from_cloudformation_template(
+        path,
+        streaming=streaming,
+        demand=(unqualify(d) for d in demand) if demand is not None else None,
+        assets=assets,
+        template=template,
+        loader=loader,
+    )
+    analyzer = Analyzer(aws)
+    analyzer.constrain()
+    if others:
+        analyzer.replicate(replicate(stack, others))
+    return analyzer
+
+
+def unqualify(logical_id: str) -> str:
+    return logical_id.rsplit(SEPARATOR, 1)[-1]
+
+
+def expand_estimates(estimates: Estimates, targets: list[Target]) -> Estimates:
+    """
+    Applies the estimates of plain logical ids to every target. The estimates
+    of a target's qualified logical ids take precedence, for that target.
+
+    With a single target, resources have plain logical ids: the qualifier of
+    its estimates is dropped.
+
+    Raises:
+    - UnknownTargetsError: If estimates are qualified with a target that
+      isn't one of `targets` (logged).
+    """
+    deployed = [str(t) for t in targets]
+    undeployed = [
+        logical_id
+        for logical_id in estimates
+        if SEPARATOR in logical_id
+        and logical_id.rpartition(SEPARATOR)[0] not in deployed
+    ]
+    if undeployed:
+        e = UnknownTargetsError(undeployed, deployed)
+        logger.error("%s", e)
+        raise e
+    expanded: Estimates = {}
+    for logical_id, metrics in estimates.items():
+        if SEPARATOR not in logical_id:
+            if len(targets) < 2:
+                expanded.setdefault(logical_id, {}).update(metrics)
+                continue
+            for target in targets:
+                expanded.setdefault(target.qualify(logical_id), {}).update(metrics)
+    # a target's own estimates take precedence
+    for logical_id, metrics in estimates.items():
+        if SEPARATOR in logical_id:
+            if len(targets) < 2:
+                logical_id = logical_id.rpartition(SEPARATOR)[2]
+            expanded.setdefault(logical_id, {}).update(metrics)
+    return expanded
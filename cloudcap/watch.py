@@ -0,0 +1,96 @@
+"""
+`cloudcap analyze --watch`: analyze again whenever the template or the
+estimates change on disk.
+"""
+
+from __future__ import annotations
+import logging
+import os
+import time
+from typing import Any, Callable, Optional
+
+from cloudcap import describe, estimates
+from cloudcap.incremental import IncrementalAnalysis
+from cloudcap.targets import DEFAULT_TARGETS, Target, expand_estimates
+
+logger = logging.getLogger(__name__)
+
+# (mtime, size) of a file, or None if it doesn't exist (e.g. mid-save)
+Stamp = Optional[tuple[int, int]]
+
+
+def stamp(path: str | os.PathLike[Any]) -> Stamp:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def watch(
+    cfn_template: str,
+    estimates_file: str,
+    interval: float = 0.5,
+    report: Callable[[str], None] = print,
+    iterations: Optional[int] = None,
+    target: Target = DEFAULT_TARGETS[0],
+    streaming: bool = False,
+    assets: Optional[str] = None,
+) -> None:
+    """
+    Polls the template and the estimates file and reports an analysis result
+    after every change, until interrupted.
+
+    A change to the template only re-creates and re-constrains the resources
+    that changed (and their dependents); a change to the estimates only
+    solves again.
+
+    Args:
+    - cfn_template (str): CloudFormation template.
+    - estimates_file (str): Estimates file.
+    - interval (float): Seconds between polls.
+    - report (Callable[[str], None]): Where to report results to.
+    - iterations (Optional[int]): Stop after this many polls (for testing).
+    - target (Target): Where the template is deployed.
+    - streaming, assets: See `IncrementalAnalysis`.
+    """
+    analysis: Optional[IncrementalAnalysis] = None
+    user_estimates: Optional[estimates.Estimates] = None
+    stamps: tuple[Stamp, Stamp] = (None, None)
+
+    while iterations is None or iterations > 0:
+        if iterations is not None:
+            iterations -= 1
+        current = (stamp(cfn_template), stamp(estimates_file))
+        if current == stamps or None in current:
+            time.sleep(interval)
+            continue
+        template_changed = current[0] != stamps[0]
+        estimates_changed = current[1] != stamps[1]
+        stamps = current
+
+        start = time.perf_counter()
+        try:
+            what = []
+            if analysis is None:
+                # also after a failed first load: it may fail because of
+                # something else, e.g. a nested stack's template
+                analysis = IncrementalAnalysis.from_file(
+                    cfn_template, target.region, target.account, streaming, assets
+                )
+                what.append("template")
+            elif template_changed:
+                what.append(f"template: {analysis.update_from_file(cfn_template)}")
+            if estimates_changed or user_estimates is None:
+                user_estimates = expand_estimates(
+                    estimates.load(estimates_file), [target]
+                )
+                what.append("estimates")
+            result = analysis.check(user_estimates)
+        except Exception as e:  # pylint: disable=broad-except
+            # keep watching: the files may be in the middle of being edited
+            logger.debug("analysis failed", exc_info=True)
+            report(f"⚠️ {type(e).__name__}: {e}")
+            continue
+        seconds = time.perf_counter() - start
+        report(f"{describe(result.name)} ({'; '.join(what)}; {seconds:.3f}s)")
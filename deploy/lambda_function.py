@@ -5,72 +5,225 @@ from cloudcap import (
     __app_name__,
     __version__,
     estimates,
+    profiling,
 )
-from cloudcap.analyzer import Analyzer, AnalyzerResult
-from cloudcap.aws import AWS, Regions, Account
+from cloudcap.aws import AWS, Regions, Account, CloudFormationStack
+from cloudcap.cache import CachedResult, ResultCache, key
+from cloudcap.fingerprint import fingerprint
 from cloudcap.logging import setup_logging
+from cloudcap.nested import TemplateLoader
+import os
 import tempfile
+import time
 import json
 import yaml
 
-# If 'generateEstimatesTemplate' is True, generates an estimate template based on the deployment and returns it as json.
+# A request is one job, or a batch of jobs in 'jobs' (e.g. all the analyses of a review page).
+# If a job's 'generateEstimatesTemplate' is True, generates an estimate template based on the deployment and returns it as json.
 # Otherwise, it loads the user-provided 'estimates', performs resource analysis, and returns the analysis result.
+# If 'profile' is True, the response also has a 'profile' with per-phase timings, counts and solver statistics.
+# If 'cache' is True, the result of an identical earlier analysis is reused, and the response has 'cached'.
+#
+# The jobs of a batch with the same 'cfn_template' share it: it is parsed and constrained once,
+# and each job's estimates are checked against it incrementally.
+# The response has a result per job, in order, with the job's 'id' if it has one, its 'seconds'
+# and the 'setup_seconds' of parsing and constraining that it paid for (0 when an earlier job did).
+# A job of a batch that fails has the result 'ERROR' and an 'error', without failing the others;
+# a request that is one job fails (raises) as it always did.
 
-def lambda_handler(event, context):
-    aws = AWS()
-    deployment = aws.add_deployment(Regions.us_east_1, Account("123"))
+# kept across warm invocations; /tmp is the only writable directory
+results = ResultCache('/tmp/cloudcap-cache')
 
+def lambda_handler(event, context):
     loadedBody = json.loads(event['body'])
 
-    # Write CloudFormation template to a temporary file
-    with tempfile.NamedTemporaryFile(mode='w', delete=False) as cfn_file:
-        cfn_file.write(loadedBody['cfn_template'])
-        cfn_file_path = cfn_file.name
-    
-    if loadedBody.get('generateEstimatesTemplate'):
+    # warm invocations share the context: always reset the profile
+    if loadedBody.get('profile'):
+        profile = profiling.enable()
+    else:
+        profile = None
+        profiling.disable()
+
+    if 'jobs' in loadedBody:
+        response = {'results': run_jobs(loadedBody['jobs'], loadedBody.get('cache'))}
+    else:
+        response = run_jobs([loadedBody], loadedBody.get('cache'), raise_errors=True)[0]
+
+    if profile:
+        response['profile'] = profile.to_dict()
+    return {
+        'statusCode': 200, 
+        'body': json.dumps(response),
+        'headers': {
+            "Access-Control-Allow-Origin": "*"
+        },
+    }
+
+
+def run_jobs(jobs, cache=False, raise_errors=False):
+    """
+    Runs jobs, sharing each template between its jobs; returns their responses in order.
+    If raise_errors is True, a job that fails raises instead of having the result 'ERROR'.
+    """
+    responses = [None] * len(jobs)
+    by_template = {}
+    for i, job in enumerate(jobs):
+        by_template.setdefault(job['cfn_template'], []).append(i)
+
+    for cfn_template, indices in by_template.items():
+        # Write CloudFormation template to a directory of its own: its nested stacks' templates
+        # are looked up next to it, and must not be other files of /tmp
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'template.yaml')
+            with open(path, 'w') as cfn_file:
+                cfn_file.write(cfn_template)
+            caching = [jobs[i].get('cache', cache) for i in indices]
+            template = SharedTemplate(path, any(caching))
+            try:
+                for i, job_cache in zip(indices, caching):
+                    responses[i] = run_job(jobs[i], template, job_cache, raise_errors)
+            finally:
+                template.close()
+    return responses
+
+
+class SharedTemplate:
+    """
+    A template of a request, parsed and constrained at most once for all its jobs.
+    The fingerprint of a cached job is computed from the same parse (and the same
+    nested templates) as the analysis.
+    """
+
+    def __init__(self, path, cache=False):
+        self.path = path
+        # fingerprinted before the stack resolves the template in place
+        self.cache = cache
+        # seconds spent parsing, constraining and fingerprinting, so far
+        self.setup_seconds = 0.0
+        self._template = None
+        self._loader = TemplateLoader()
+        self._aws = None
+        self._analyzer = None
+        self._fingerprint = None
+        # a template that fails to load fails every job, without loading it again
+        self._error = None
+
+    def aws(self):
+        if self._aws is None:
+            if self.cache:
+                self.fingerprint()
+            self._aws = self._setup(self._load)
+        return self._aws
+
+    def analyzer(self):
+        if self._analyzer is None:
+            aws = self.aws()
+            self._analyzer = self._setup(lambda: self._constrain(aws))
+        return self._analyzer
+
+    def fingerprint(self):
+        # edits that can't change the result share it
+        if self._fingerprint is None:
+            assert self._aws is None, 'the template is already resolved'
+            self._fingerprint = self._setup(
+                lambda: fingerprint(self._parsed(), self.path, loader=self._loader)
+            )
+        return self._fingerprint
+
+    def close(self):
+        self._loader.close()
+
+    def _parsed(self):
+        if self._template is None:
+            self._template = CloudFormationStack.load(self.path)
+        return self._template
+
+    def _load(self):
         aws = AWS()
         deployment = aws.add_deployment(Regions.us_east_1, Account("123"))
-        deployment.from_cloudformation_template(path=cfn_file_path)
-        templateString = estimates.template_to_string(aws)
-        return {
-            'statusCode': 200, 
-            'body': json.dumps({'result' : yaml.safe_load(templateString)}),
-            'headers': {
-                "Access-Control-Allow-Origin": "*"
-            },
-        }
-    
-    deployment.from_cloudformation_template(path=cfn_file_path)
-
-    # setup analysis
-    analyzer = Analyzer(aws)
-    analyzer.constrain()
-
-    # Write user estimates to a temporary file
-    with tempfile.NamedTemporaryFile(mode='w', delete=False) as estimates_file:
-        estimates_file.write(loadedBody['estimates'])
-        estimates_file_path = estimates_file.name
-
-    # add estimates    
-    user_estimates = estimates.load(estimates_file_path)
-    analyzer.add_estimates(user_estimates)
-
-    # perform analysis
-    result = analyzer.solve()
+        deployment.from_cloudformation_template(
+            path=self.path, template=self._parsed(), loader=self._loader
+        )
+        return aws
+
+    def _constrain(self, aws):
+        # z3 is only needed (and only imported) for an actual analysis
+        from cloudcap.analyzer import Analyzer
+
+        # setup analysis
+        analyzer = Analyzer(aws)
+        analyzer.constrain()
+        return analyzer
+
+    def _setup(self, step):
+        if self._error is not None:
+            raise self._error
+        start = time.perf_counter()
+        try:
+            return step()
+        except Exception as e:
+            self._error = e
+            raise
+        finally:
+            self.setup_seconds += time.perf_counter() - start
+
+
+def run_job(job, template, cache, raise_errors=False):
+    start = time.perf_counter()
+    setup_seconds = template.setup_seconds
+    response = {}
+    if 'id' in job:
+        response['id'] = job['id']
+    try:
+        if job.get('generateEstimatesTemplate'):
+            templateString = estimates.template_to_string(template.aws())
+            response['result'] = yaml.safe_load(templateString)
+        else:
+            response.update(analyze(job, template, cache))
+    except Exception as e:
+        if raise_errors:
+            raise
+        response['result'] = 'ERROR'
+        response['error'] = str(e)
+    setup_seconds = template.setup_seconds - setup_seconds
+    response['seconds'] = time.perf_counter() - start - setup_seconds
+    response['setup_seconds'] = setup_seconds
+    return response
+
+
+def analyze(job, template, cache):
+    user_estimates = estimates.loads(job['estimates'])
+
+    # a cached result skips constraining and solving altogether
+    cached = None
+    if cache:
+        cache_key = key(template.fingerprint(), user_estimates)
+        cached = results.get(cache_key)
+
+    if cached is not None:
+        result = cached.result
+    else:
+        from cloudcap.analyzer import AnalyzerResult
+
+        # perform analysis, against the template's constraints
+        analyzer = template.analyzer()
+        outcome = analyzer.check(user_estimates)
+        result = outcome.name
+
+        if cache:
+            model = analyzer.model() if outcome == AnalyzerResult.PASS else None
+            results.put(cache_key, CachedResult(result, model))
 
     api_response = ""
 
-    if result == AnalyzerResult.PASS:
+    if result == "PASS":
         api_response = "PASS"
-    elif result == AnalyzerResult.REJECT:
+    elif result == "REJECT":
         api_response = "REJECT"
     else:
         api_response = "ERROR"
 
-    return {
-        'statusCode': 200, 
-        'body': json.dumps({'result' : api_response}),
-        'headers': {
-            "Access-Control-Allow-Origin": "*"
-        },
-    }
+    response = {'result' : api_response}
+    if cache:
+        response['cached'] = cached is not None
+    return response
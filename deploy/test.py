@@ -1,3 +1,5 @@
+import json
+
 from lambda_function import lambda_handler
 
 genTemplate = {"body": "{\"estimates\": \"MyQueue:\\n  nrequests: 10\\n\\nLambdaFunction:\\n  nrequests: 10\",\r\n  \"cfn_template\": \"Resources:\\n  LambdaFunction:\\n    Type: AWS::Lambda::Function\\n    Properties:\\n      FunctionName: lambda1\\n      Code:\\n        S3Bucket: my-source-bucket\\n        S3Key: lambda\/my-nodejs-app.zip\\n      Handler: index.handler\\n      Runtime: nodejs8.10\\n      Timeout: 60\\n      MemorySize: 512\\n      Environment:\\n        TestQueue: !GetAtt MyQueue.Arn\\n\\n  LambdaFunctionEventSourceMapping:\\n    Type: AWS::Lambda::EventSourceMapping\\n    Properties:\\n      BatchSize: 10\\n      Enabled: true\\n      EventSourceArn: !GetAtt MyQueue.Arn\\n      FunctionName: !GetAtt LambdaFunction.Arn\\n\\n  MyQueue:\\n    Type: AWS::SQS::Queue\\n    Properties:\\n      QueueName: queue1\\n      DelaySeconds: 0\\n      VisibilityTimeout: 120(cloudcap-py3.11) \",\r\n\"generateEstimatesTemplate\": 1\r\n}"}
@@ -6,6 +8,26 @@ payloadReject = {"body": "{\"estimates\": \"MyQueue:\\n  nrequests: 999\\n\\nLam
 
 payloadPass = {"body": "{\"estimates\": \"MyQueue:\\n  nrequests: 10\\n\\nLambdaFunction:\\n  nrequests: 10\",\r\n  \"cfn_template\": \"Resources:\\n  LambdaFunction:\\n    Type: AWS::Lambda::Function\\n    Properties:\\n      FunctionName: lambda1\\n      Code:\\n        S3Bucket: my-source-bucket\\n        S3Key: lambda\/my-nodejs-app.zip\\n      Handler: index.handler\\n      Runtime: nodejs8.10\\n      Timeout: 60\\n      MemorySize: 512\\n      Environment:\\n        TestQueue: !GetAtt MyQueue.Arn\\n\\n  LambdaFunctionEventSourceMapping:\\n    Type: AWS::Lambda::EventSourceMapping\\n    Properties:\\n      BatchSize: 10\\n      Enabled: true\\n      EventSourceArn: !GetAtt MyQueue.Arn\\n      FunctionName: !GetAtt LambdaFunction.Arn\\n\\n  MyQueue:\\n    Type: AWS::SQS::Queue\\n    Properties:\\n      QueueName: queue1\\n      DelaySeconds: 0\\n      VisibilityTimeout: 120(cloudcap-py3.11) \",\r\n\"generateEstimatesTemplate\": 0\r\n}"}
 
+# one request for all the jobs of a page: the jobs share the template
+payloadBatch = {"body": json.dumps({
+    "jobs": [
+        dict(json.loads(payloadPass["body"]), id="pass"),
+        dict(json.loads(payloadReject["body"]), id="reject"),
+        dict(json.loads(genTemplate["body"]), id="estimates"),
+        # fails on its own, with the result ERROR
+        dict(json.loads(payloadPass["body"]), id="unknown", estimates="Nope:\n  nrequests: 1"),
+    ],
+    "cache": 0,
+})}
+
 print(lambda_handler(genTemplate, {}))
 print(lambda_handler(payloadReject, {}))
-print(lambda_handler(payloadPass, {}))
\ No newline at end of file
+print(lambda_handler(payloadPass, {}))
+print(lambda_handler(payloadBatch, {}))
+
+# a request that is one job raises when it fails, as before batches
+payloadUnknown = {"body": json.dumps(dict(json.loads(payloadPass["body"]), estimates="Nope:\n  nrequests: 1"))}
+try:
+    lambda_handler(payloadUnknown, {})
+except Exception as e:
+    print("raised", type(e).__name__, e)
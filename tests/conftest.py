@@ -0,0 +1,48 @@
+import os
+from typing import Any, Callable, Iterable
+
+import pytest
+import yaml
+
+from cloudcap import synthetic
+from cloudcap.analyzer import Analyzer
+from cloudcap.aws import AWS, Account, CloudFormationStack, Regions
+from cloudcap.estimates import Estimates
+from cloudcap.plugins import Plugin
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+SQS_LAMBDA = os.path.join(EXAMPLES, "sqs-lambda.yaml")
+
+# estimates that examples/sqs-lambda.yaml satisfies, and estimates that it doesn't
+PASS_ESTIMATES = {"MyQueue": {"nrequests": 10}, "LambdaFunction": {"nrequests": 10}}
+REJECT_ESTIMATES = {"MyQueue": {"nrequests": 999}, "LambdaFunction": {"nrequests": 10}}
+# as in an estimates file
+PASS_ESTIMATES_YAML = yaml.safe_dump(PASS_ESTIMATES)
+REJECT_ESTIMATES_YAML = yaml.safe_dump(REJECT_ESTIMATES)
+
+SyntheticAnalyzer = Callable[..., tuple[Analyzer, Estimates]]
+
+
+@pytest.fixture
+def synthetic_analyzer() -> SyntheticAnalyzer:
+    """
+    Constrains analyzers of synthetic templates.
+
+    The fixture is a function of `synthetic.generate`'s arguments and of the
+    plugins to add to the builtin ones, which returns the constrained
+    analyzer and the template's estimates.
+    """
+
+    def build(
+        resources: int, plugins: Iterable[type[Plugin]] = (), **options: Any
+    ) -> tuple[Analyzer, Estimates]:
+        template, estimates = synthetic.generate(resources, **options)
+        aws = AWS()
+        CloudFormationStack(aws, Regions.us_east_1, Account("123"), template)
+        analyzer = Analyzer(aws)
+        for plugin in plugins:
+            analyzer.add_plugin(plugin)
+        analyzer.constrain()
+        return analyzer, estimates
+
+    return build
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import pytest
+import z3  # type: ignore
+
+from cloudcap import api
+from cloudcap.analyzer import Analyzer, AnalyzerResult
+from tests.conftest import PASS_ESTIMATES_YAML, REJECT_ESTIMATES, SQS_LAMBDA
+
+
+def template() -> str:
+    with open(SQS_LAMBDA, encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def hard_solve(monkeypatch):
+    """Makes every analysis solve a problem that z3 doesn't finish."""
+    add_estimates = Analyzer.add_estimates
+
+    def add_hard_estimates(self, estimates):
+        add_estimates(self, estimates)
+        x, y, z = z3.Ints("x y z", ctx=self.ctx)
+        self.solver.add(x * x * x + y * y * y + z * z * z == 42)
+
+    monkeypatch.setattr(Analyzer, "add_estimates", add_hard_estimates)
+
+
+@pytest.mark.parametrize("executor", [api.THREAD, api.PROCESS])
+def test_analyze(executor):
+    pool = api.AnalysisPool(executor, max_concurrency=2)
+
+    async def run():
+        return await asyncio.gather(
+            pool.analyze(template(), PASS_ESTIMATES_YAML),
+            pool.analyze(template(), REJECT_ESTIMATES),
+            pool.estimates_template(template()),
+        )
+
+    try:
+        passed, rejected, estimates_template = asyncio.run(run())
+    finally:
+        pool.shutdown()
+    assert passed == AnalyzerResult.PASS
+    assert rejected == AnalyzerResult.REJECT
+    assert "LambdaFunction:" in estimates_template
+
+
+def test_timeout_interrupts_solver(hard_solve):
+    pool = api.AnalysisPool(api.THREAD, max_concurrency=1)
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    async def run():
+        ticker = asyncio.create_task(tick())
+        start = time.perf_counter()
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.analyze(template(), PASS_ESTIMATES_YAML, timeout=0.5)
+        # the slot was only released once the solver stopped
+        assert time.perf_counter() - start < 5
+        ticker.cancel()
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+    # the loop kept running while z3 solved
+    assert ticks > 10
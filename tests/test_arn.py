@@ -1,12 +1,60 @@
+import pytest
+
 from cloudcap.aws import *
 
 
 def test_AWSLambdaFunction_arn():
     aws = AWS()
     region = Regions.us_east_1
-    account_id = "1234567890"
+    account = Account("1234567890")
     function_name = "test_lambda"
     f = AWSLambdaFunction(
-        aws=aws, region=region, account_id=account_id, function_name=function_name
+        aws=aws, region=region, account=account, function_name=function_name
     )
     assert f.arn == "arn:aws:lambda:us-east-1:1234567890:function:test_lambda"
+
+
+def test_index_lookups():
+    aws = AWS()
+    account = Account("1234567890")
+    f = AWSLambdaFunction(
+        aws=aws, region=Regions.us_east_1, account=account, function_name="f"
+    )
+    q = AWSSQSQueue(aws=aws, region=Regions.us_east_1, account=account, queue_name="q")
+    other = AWSSQSQueue(
+        aws=aws, region=Regions.get("eu-west-1"), account=account, queue_name="q"
+    )
+
+    assert aws["arn:aws:sqs:us-east-1:1234567890:q"] is q
+    assert aws["https://sqs.us-east-1.amazonaws.com/1234567890/q"] is q
+    # strings that aren't a resource's miss without raising
+    assert aws.get("debug") is None
+    assert aws.get("arn:aws:sqs:us-east-1:1234567890:none") is None
+    assert aws.get({"Ref": "q"}) is None
+    assert aws.index.named("sqs", "q") == [q, other]
+    assert aws.index.with_prefix("arn:aws:sqs:") == [other, q]
+
+    # names, ARNs qualified with an alias and partial ARNs
+    for reference in (
+        "f",
+        "arn:aws:lambda:us-east-1:1234567890:function:f",
+        "arn:aws:lambda:us-east-1:1234567890:function:f:PROD",
+        "1234567890:function:f",
+    ):
+        assert q.find_lambda_by_name(reference) is f
+    assert other.find_lambda_by_name("f") is None
+
+    aws.unregister_resources([q])
+    assert aws.get("https://sqs.us-east-1.amazonaws.com/1234567890/q") is None
+    assert aws.index.named("sqs", "q") == [other]
+    assert aws.index.with_prefix("arn:aws:sqs:") == [other]
+
+
+def test_resources_implement_replicate():
+    class Unreplicable(Resource):
+        @property
+        def arn(self):
+            return "arn:aws:sns:us-east-1:1234567890:topic"
+
+    with pytest.raises(TypeError, match="replicate"):
+        Unreplicable(AWS(), Regions.us_east_1, Account("1234567890"))
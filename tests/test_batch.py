@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shutil
+
+from cloudcap import batch
+from tests.conftest import PASS_ESTIMATES_YAML, REJECT_ESTIMATES_YAML, SQS_LAMBDA
+
+
+def test_analyze_many(tmp_path):
+    for name in ("a", "b"):
+        shutil.copy(SQS_LAMBDA, tmp_path / f"{name}.yaml")
+        (tmp_path / f"{name}.estimates.yaml").write_text(PASS_ESTIMATES_YAML)
+    (tmp_path / "a.peak.estimates.yaml").write_text(REJECT_ESTIMATES_YAML)
+
+    pairs = batch.discover_pairs(tmp_path)
+    assert len(pairs) == 3
+    # a.yaml and b.yaml are identical, so they are analyzed together
+    assert len(batch.group_by_template(pairs)) == 1
+
+    results = {
+        os.path.basename(r["estimates"]): r
+        for r in batch.analyze_many(pairs, workers=2)
+    }
+    assert results["a.estimates.yaml"]["status"] == "PASS"
+    assert results["b.estimates.yaml"]["status"] == "PASS"
+    assert results["a.peak.estimates.yaml"]["status"] == "REJECT"
+
+
+def test_pairs_of_one_template_are_sharded(tmp_path, monkeypatch):
+    shutil.copy(SQS_LAMBDA, tmp_path / "my.app.yaml")
+    for i in range(4):
+        (tmp_path / f"my.app.s{i}.estimates.yaml").write_text(PASS_ESTIMATES_YAML)
+    (tmp_path / "my.app.estimates.yaml").write_text(REJECT_ESTIMATES_YAML)
+    pairs = batch.discover_pairs(tmp_path)
+    assert len(pairs) == 5
+    assert {os.path.basename(t) for t, _ in pairs} == {"my.app.yaml"}
+
+    shards = []
+    analyze_template = batch.analyze_template
+    monkeypatch.setattr(
+        batch,
+        "ProcessPoolExecutor",
+        lambda max_workers: ThreadPoolExecutor(max_workers=max_workers),
+    )
+    monkeypatch.setattr(
+        batch,
+        "analyze_template",
+        lambda shard: shards.append(len(shard)) or analyze_template(shard),
+    )
+    results = list(batch.analyze_many(pairs, workers=2))
+    assert sorted(shards) == [2, 3]
+    assert sorted(r["status"] for r in results) == ["PASS"] * 4 + ["REJECT"]
@@ -0,0 +1,79 @@
+import os
+
+from typer.testing import CliRunner
+
+from cloudcap import SOLVER_REJECT, SUCCESS
+from cloudcap.cache import CachedResult, ResultCache, key
+from cloudcap.cli import app
+from tests.conftest import PASS_ESTIMATES_YAML, REJECT_ESTIMATES_YAML, SQS_LAMBDA
+
+
+def test_key_is_normalized():
+    estimates = {"A": {"nrequests": 1}, "B": {"nrequests": 2}}
+    reordered = {"B": {"nrequests": 2}, "A": {"nrequests": 1}}
+    assert key("f1", estimates) == key("f1", reordered)
+    assert key("f1", estimates) != key("f2", estimates)
+    assert key("f1", estimates) != key("f1", {"A": {"nrequests": 2}})
+    assert key("f1", estimates) != key("f1", estimates, ["eu-west-1/1"])
+
+
+def test_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=2, max_bytes=1 << 20)
+    for k in "abc":
+        cache.put(k, CachedResult("PASS", {"x": 1}))
+    assert list(cache._memory) == ["b", "c"]
+    # still on disk, and shared with other processes
+    assert ResultCache(str(tmp_path)).get("a").result == "PASS"
+
+    entry_size = os.path.getsize(tmp_path / "a.json")
+    small = ResultCache(str(tmp_path), max_bytes=2 * entry_size)
+    os.utime(tmp_path / "a.json", (0, 0))
+    small.put("d", CachedResult("REJECT"))
+    assert sorted(os.listdir(tmp_path)) == ["c.json", "d.json"]
+
+
+def test_analyze_cache(tmp_path):
+    template = SQS_LAMBDA
+    (tmp_path / "pass.yaml").write_text(PASS_ESTIMATES_YAML)
+    (tmp_path / "reject.yaml").write_text(REJECT_ESTIMATES_YAML)
+    cache_dir = str(tmp_path / "cache")
+    runner = CliRunner()
+
+    def analyze(estimates: str) -> int:
+        args = ["analyze", "--cache-dir", cache_dir, template, estimates]
+        return runner.invoke(app, args).exit_code
+
+    assert analyze(str(tmp_path / "pass.yaml")) == SUCCESS
+    assert analyze(str(tmp_path / "reject.yaml")) == SOLVER_REJECT
+    assert len(os.listdir(cache_dir)) == 2
+
+    entries = ResultCache(cache_dir)._entries()
+    models = [
+        ResultCache(cache_dir).get(os.path.basename(p)[:-5]) for p, _, _ in entries
+    ]
+    assert sorted(m.result for m in models) == ["PASS", "REJECT"]
+    assert any(m.model and 10 in m.model.values() for m in models)
+
+    # served from the cache
+    assert analyze(str(tmp_path / "pass.yaml")) == SUCCESS
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_cache_miss_parses_the_template_once(tmp_path, monkeypatch):
+    from cloudcap.aws import CloudFormationStack
+
+    loaded = []
+    load = CloudFormationStack.load
+
+    def counting_load(path, streaming=False):
+        loaded.append(path)
+        return load(path, streaming)
+
+    monkeypatch.setattr(CloudFormationStack, "load", counting_load)
+    (tmp_path / "pass.yaml").write_text(PASS_ESTIMATES_YAML)
+    template = SQS_LAMBDA
+    args = ["analyze", "--cache-dir", str(tmp_path / "cache")]
+    args += [template, str(tmp_path / "pass.yaml")]
+    assert CliRunner().invoke(app, args).exit_code == SUCCESS
+    # fingerprinted and analyzed
+    assert loaded == [template]
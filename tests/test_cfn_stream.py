@@ -0,0 +1,75 @@
+import json
+import os
+
+from cloudcap import cfn_stream
+from cloudcap.aws import MODELED_PROPERTIES, CloudFormationStack
+from tests.conftest import EXAMPLES
+
+TEMPLATE = """
+AWSTemplateFormatVersion: "2010-09-09"
+Metadata:
+  Huge: [1, 2, 3]
+Resources:
+  Fn:
+    Metadata: {aws:cdk:path: Stack/Fn}
+    Type: AWS::Lambda::Function
+    Properties:
+      FunctionName: fn
+      Role: !GetAtt Role.Arn
+      Environment:
+        Variables:
+          QUEUE: !Ref Queue
+          COUNT: 3
+          NAME: !Sub "${AWS::StackName}-x"
+  Queue:
+    Properties:
+      QueueName: "007"
+      DelaySeconds: 0
+    Type: AWS::SQS::Queue
+  Role:
+    Type: AWS::IAM::Role
+    Properties:
+      Policies: [{PolicyName: p}]
+Outputs:
+  X: {Value: !Ref Fn}
+"""
+
+
+def test_keeps_only_modeled_properties(tmp_path):
+    path = tmp_path / "template.yaml"
+    path.write_text(TEMPLATE)
+
+    assert cfn_stream.load_resources(path, MODELED_PROPERTIES) == {
+        "Resources": {
+            "Fn": {
+                "Type": "AWS::Lambda::Function",
+                "Properties": {
+                    "FunctionName": "fn",
+                    "Environment": {
+                        "Variables": {
+                            "QUEUE": {"Ref": "Queue"},
+                            "COUNT": 3,
+                            "NAME": {"Fn::Sub": "${AWS::StackName}-x"},
+                        }
+                    },
+                },
+            },
+            "Queue": {"Type": "AWS::SQS::Queue", "Properties": {"QueueName": "007"}},
+            "Role": {"Type": "AWS::IAM::Role", "Properties": {}},
+        },
+        # kept for nested stacks
+        "Outputs": {"X": {"Value": {"Ref": "Fn"}}},
+    }
+
+
+def test_matches_pruned_full_load(tmp_path):
+    for name in ["sqs-lambda.yaml", "sns-lambda-alias.yaml"]:
+        path = os.path.join(EXAMPLES, name)
+        full = CloudFormationStack.load(path)
+        streamed = CloudFormationStack.load(path, streaming=True)
+        assert streamed == cfn_stream.prune(full, MODELED_PROPERTIES)
+
+        # JSON templates are streamed too
+        json_path = tmp_path / (name + ".json")
+        json_path.write_text(json.dumps(full))
+        assert CloudFormationStack.load(json_path, streaming=True) == streamed
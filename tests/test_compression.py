@@ -0,0 +1,31 @@
+import gzip
+
+import pytest
+
+from cloudcap import compression, estimates
+from cloudcap.aws import CloudFormationStack
+from tests.conftest import SQS_LAMBDA
+
+
+@pytest.mark.parametrize("suffix", [".gz", ".bz2", ".xz"])
+def test_round_trip(tmp_path, suffix):
+    path = tmp_path / f"estimates.csv{suffix}"
+    with compression.open_file(path, "w") as f:
+        f.write("logical_id,nrequests\nMyQueue,10\n")
+    assert compression.detect(path) == compression.SUFFIXES[suffix]
+    assert compression.splitext(path)[1] == ".csv"
+    assert estimates.load(path) == {"MyQueue": {"nrequests": 10}}
+
+
+def test_detected_by_content(tmp_path):
+    with open(SQS_LAMBDA, "rb") as f:
+        text = f.read()
+    # the name doesn't say it's compressed
+    path = tmp_path / "template.yaml"
+    path.write_bytes(gzip.compress(text))
+    assert compression.detect(path) == compression.GZIP
+    expected = CloudFormationStack.load(SQS_LAMBDA)
+    assert CloudFormationStack.load(path) == expected
+    assert CloudFormationStack.load(path, streaming=True)["Resources"].keys() == (
+        expected["Resources"].keys()
+    )
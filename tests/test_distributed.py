@@ -0,0 +1,64 @@
+import os
+import shutil
+import threading
+
+from cloudcap import batch
+from cloudcap.distributed import Coordinator, Spool, Worker
+from tests.conftest import PASS_ESTIMATES_YAML, REJECT_ESTIMATES_YAML, SQS_LAMBDA
+
+
+def scenarios(path):
+    shutil.copy(SQS_LAMBDA, path / "a.yaml")
+    for i in range(6):
+        estimates = REJECT_ESTIMATES_YAML if i % 3 == 0 else PASS_ESTIMATES_YAML
+        (path / f"a.s{i}.estimates.yaml").write_text(estimates)
+    return batch.discover_pairs(path)
+
+
+def start(workers):
+    threads = [threading.Thread(target=w.run, daemon=True) for w in workers]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_workers_share_the_units(tmp_path):
+    pairs = scenarios(tmp_path)
+    spool = Spool(tmp_path / "spool")
+    workers = [Worker(spool, name=f"w{i}", poll=0.01) for i in range(2)]
+    threads = start(workers)
+    results = list(Coordinator(spool, shard_size=2, poll=0.01).run(pairs))
+    for thread in threads:
+        thread.join(timeout=60)
+        assert not thread.is_alive()
+
+    statuses = {os.path.basename(r["estimates"]): r["status"] for r in results}
+    assert statuses == {
+        f"a.s{i}.estimates.yaml": "REJECT" if i % 3 == 0 else "PASS" for i in range(6)
+    }
+    # each worker parsed the template once, however many units it took
+    assert all(len(w._analyzers) <= 1 for w in workers)
+
+
+def test_units_of_dead_workers_are_requeued(tmp_path):
+    pairs = scenarios(tmp_path)
+    spool = Spool(tmp_path / "spool")
+    coordinator = Coordinator(spool, shard_size=2, lease=0.3, poll=0.01)
+    results = []
+    coordinating = threading.Thread(
+        target=lambda: results.extend(coordinator.run(pairs)), daemon=True
+    )
+    coordinating.start()
+
+    # claims a unit, then dies without a heartbeat
+    dead = Worker(spool, name="dead")
+    while dead.claim() is None:
+        pass
+    for thread in start([Worker(spool, name="alive", heartbeat=0.05, poll=0.01)]):
+        thread.join(timeout=60)
+        assert not thread.is_alive()
+    coordinating.join(timeout=60)
+    assert not coordinating.is_alive()
+
+    assert len(results) == len(pairs)
+    assert {r["status"] for r in results} == {"PASS", "REJECT"}
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from cloudcap import estimates
+from cloudcap.aws import AWS, Account, Regions
+from cloudcap.estimates import UnknownResourcesError
+
+TEMPLATE = """
+Resources:
+  MyQueue:
+    Type: AWS::SQS::Queue
+    Properties:
+      QueueName: queue1
+  "Yes":
+    Type: AWS::SQS::Queue
+    Properties:
+      QueueName: queue2
+"""
+
+
+@pytest.fixture
+def aws(tmp_path):
+    path = tmp_path / "template.yaml"
+    path.write_text(TEMPLATE)
+    aws = AWS()
+    aws.add_deployment(Regions.us_east_1, Account("123")).from_cloudformation_template(
+        path=str(path)
+    )
+    return aws
+
+
+def test_template_round_trips(aws, tmp_path):
+    path = tmp_path / "estimates.yaml"
+    estimates.write_template(aws, path)
+    assert estimates.load(path) == {
+        "MyQueue": {"nrequests": 0},
+        "Yes": {"nrequests": 0},
+    }
+    assert estimates.template_to_string(aws) == path.read_text()
+
+
+def test_loads_json_and_csv(tmp_path):
+    expected = {"MyQueue": {"nrequests": 10}, "Yes": {"other": 2}}
+    json_path = tmp_path / "estimates.json"
+    json_path.write_text(json.dumps(expected))
+    csv_path = tmp_path / "estimates.csv"
+    csv_path.write_text("logical_id,nrequests,other\nMyQueue,10,\nYes,,2\n")
+
+    assert estimates.load(json_path) == expected
+    assert estimates.load(csv_path) == expected
+
+
+def test_reports_every_unknown_resource(aws):
+    with pytest.raises(UnknownResourcesError) as e:
+        estimates.validate(
+            aws, {"Nope": {}, "MyQueue": {"nrequests": 1}, "AlsoNope": {}}
+        )
+    assert e.value.logical_ids == ["Nope", "AlsoNope"]
+    assert isinstance(e.value, KeyError)
@@ -0,0 +1,69 @@
+import json
+
+from cloudcap.aws import CloudFormationStack
+from cloudcap.fingerprint import fingerprint, relevant_properties
+from cloudcap.plugins.builtin_plugins import AWSLambdaFunctionPlugin
+from tests.conftest import SQS_LAMBDA
+
+
+def example():
+    return CloudFormationStack.load(SQS_LAMBDA)
+
+
+def test_cosmetic_edits_keep_the_fingerprint():
+    template = example()
+    base = fingerprint(example())
+    function = template["Resources"]["LambdaFunction"]
+    function["Properties"]["Runtime"] = "python3.12"
+    function["Properties"]["Description"] = "edited"
+    function["Properties"]["Code"] = {"S3Bucket": "b", "S3Key": "other.zip"}
+    function["Properties"]["Environment"]["LOG_LEVEL"] = "debug"
+    function["DependsOn"] = ["MyQueue"]
+    template["Resources"] = dict(reversed(template["Resources"].items()))
+    assert fingerprint(template) == base
+
+
+def test_modeled_edits_change_the_fingerprint():
+    base = fingerprint(example())
+    renamed = example()
+    renamed["Resources"]["MyQueue"]["Properties"]["QueueName"] = "queue2"
+    assert fingerprint(renamed) != base
+
+    referring = example()
+    environment = referring["Resources"]["LambdaFunction"]["Properties"]["Environment"]
+    environment["OTHER"] = "arn:aws:sqs:us-east-1:123:queue1"
+    assert fingerprint(referring) != base
+
+
+def test_plugins_declare_relevant_properties(monkeypatch):
+    template = example()
+    template["Resources"]["LambdaFunction"]["Properties"]["Timeout"] = 30
+    base = fingerprint(template)
+    template["Resources"]["LambdaFunction"]["Properties"]["Timeout"] = 60
+    assert fingerprint(template) == base
+
+    monkeypatch.setattr(
+        AWSLambdaFunctionPlugin,
+        "relevant_properties",
+        {"AWS::Lambda::Function": ("Timeout",)},
+    )
+    assert "Timeout" in relevant_properties()["AWS::Lambda::Function"]
+    assert fingerprint(template) != base
+
+
+def test_nested_templates_are_part_of_the_fingerprint(tmp_path):
+    parent = {
+        "Resources": {
+            "Child": {
+                "Type": "AWS::CloudFormation::Stack",
+                "Properties": {"TemplateURL": "https://s3.amazonaws.com/b/child.yaml"},
+            }
+        }
+    }
+    child = tmp_path / "child.yaml"
+    child.write_text(json.dumps(example()))
+    base = fingerprint(parent, tmp_path / "parent.yaml")
+    renamed = example()
+    renamed["Resources"]["MyQueue"]["Properties"]["QueueName"] = "queue2"
+    child.write_text(json.dumps(renamed))
+    assert fingerprint(parent, tmp_path / "parent.yaml") != base
@@ -0,0 +1,49 @@
+import csv
+import json
+
+from cloudcap import flows
+from cloudcap.analyzer import Analyzer, AnalyzerResult
+from cloudcap.estimates import Estimates
+
+
+def solved(analyzer: Analyzer, estimates: Estimates) -> Analyzer:
+    analyzer.add_estimates(estimates)
+    assert analyzer.solve() == AnalyzerResult.PASS
+    return analyzer
+
+
+def test_values_match_model(synthetic_analyzer):
+    analyzer = solved(*synthetic_analyzer(100, fan_in=2))
+    model = analyzer.solver.model()
+    nodes, edges = analyzer.values()
+    assert nodes == [
+        model.eval(v, model_completion=True).as_long()
+        for v in analyzer.node_variables.values()
+    ]
+    assert edges == [
+        model.eval(v, model_completion=True).as_long()
+        for v in analyzer.edge_variables.values()
+    ]
+    assert analyzer.model() == {
+        str(v): value
+        for v, value in zip(
+            [*analyzer.node_variables.values(), *analyzer.edge_variables.values()],
+            nodes + edges,
+        )
+    }
+
+
+def test_write(tmp_path, synthetic_analyzer):
+    result = solved(*synthetic_analyzer(100, fan_in=2)).flows()
+    assert len(result.nodes["value"]) == len(result.nodes["logical_id"]) > 0
+    assert set(result.edges["source"]) <= set(result.nodes["logical_id"])
+
+    flows.write(result, tmp_path / "flows.json")
+    assert json.loads((tmp_path / "flows.json").read_text()) == result.to_dict()
+
+    flows.write(result, tmp_path / "flows.csv")
+    with open(tmp_path / "flows.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == len(result.nodes["value"]) + len(result.edges["value"])
+    edge = next(r for r in rows if r["kind"] == flows.EDGE)
+    assert edge["target"] and int(edge["value"]) >= 0
@@ -0,0 +1,62 @@
+import subprocess
+import sys
+
+from tests.conftest import SQS_LAMBDA
+
+# modules that are slow to import and only needed by some commands
+HEAVY_MODULES = {"z3", "networkx", "cfn_flip"}
+
+# import time budget (microseconds) for `cloudcap --version`
+VERSION_IMPORT_BUDGET_US = 100_000
+
+
+def importtime(*args: str) -> dict[str, int]:
+    """
+    Runs python with `-X importtime` and parses its report.
+
+    Returns:
+    - dict[str, int]: cumulative import time in microseconds of every
+      top-level import, keyed by module name. Nested imports are reported
+      with a cumulative time of 0 so that their presence can be checked.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules: dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            # header line
+            continue
+        top_level = not name.startswith("  ")
+        modules[name.strip()] = int(cumulative) if top_level else 0
+    return modules
+
+
+def imports_heavy(modules: dict[str, int]) -> set[str]:
+    return {m for m in modules if m.split(".")[0] in HEAVY_MODULES}
+
+
+def test_cli_import_is_light():
+    modules = importtime("-c", "import cloudcap.cli")
+    assert "cloudcap.cli" in modules
+    assert imports_heavy(modules) == set()
+
+
+def test_estimates_template_does_not_import_z3():
+    modules = importtime("-m", "cloudcap", "estimates-template", SQS_LAMBDA)
+    assert "cloudcap.cli" in modules
+    assert "z3" not in modules
+
+
+def test_version_import_budget():
+    modules = importtime("-m", "cloudcap", "--version")
+    assert imports_heavy(modules) == set()
+    assert "typer" not in modules
+    spent = sum(t for m, t in modules.items() if m.startswith("cloudcap"))
+    assert spent < VERSION_IMPORT_BUDGET_US
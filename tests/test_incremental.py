@@ -0,0 +1,247 @@
+import json
+import shutil
+
+import pytest
+from typer.testing import CliRunner
+
+from cloudcap import targets
+from cloudcap.analyzer import Analyzer, AnalyzerResult
+from cloudcap.aws import AWS, Account, CloudFormationStack, Regions
+from cloudcap.cli import app
+from cloudcap.incremental import IncrementalAnalysis, RevisionAnalysis
+from cloudcap.watch import watch
+from tests.conftest import PASS_ESTIMATES, REJECT_ESTIMATES, SQS_LAMBDA
+
+SECOND_QUEUE = """
+  OtherQueue:
+    Type: AWS::SQS::Queue
+    Properties:
+      QueueName: queue2
+
+  OtherEventSourceMapping:
+    Type: AWS::Lambda::EventSourceMapping
+    Properties:
+      EventSourceArn: !GetAtt OtherQueue.Arn
+      FunctionName: !GetAtt LambdaFunction.Arn
+"""
+
+ESTIMATES = [PASS_ESTIMATES, REJECT_ESTIMATES]
+
+
+def revisions(tmp_path):
+    with open(SQS_LAMBDA, encoding="utf-8") as f:
+        base = f.read()
+    texts = [
+        base,
+        base.replace("queue1", "renamed"),
+        base + SECOND_QUEUE,
+        # the mapping no longer points to the Lambda
+        base.replace("FunctionName: !GetAtt LambdaFunction.Arn", "FunctionName: other"),
+        base,
+    ]
+    for i, text in enumerate(texts):
+        path = tmp_path / f"{i}.yaml"
+        path.write_text(text)
+        yield path
+
+
+def fresh_check(path, estimates) -> AnalyzerResult:
+    aws = AWS()
+    CloudFormationStack.from_file(aws, Regions.us_east_1, Account("123"), path)
+    analyzer = Analyzer(aws)
+    analyzer.constrain()
+    return analyzer.check(estimates)
+
+
+def test_incremental_matches_fresh_analysis(tmp_path):
+    analysis = None
+    for path in revisions(tmp_path):
+        if analysis is None:
+            analysis = IncrementalAnalysis.from_file(path)
+        else:
+            analysis.update_from_file(path)
+        for estimates in ESTIMATES:
+            assert analysis.check(estimates) == fresh_check(path, estimates)
+
+
+def test_incremental_update_only_recreates_changed(tmp_path):
+    paths = list(revisions(tmp_path))
+    analysis = IncrementalAnalysis.from_file(paths[0])
+    function = analysis.aws.logical_id_to_resource["LambdaFunction"]
+    queue = analysis.aws.logical_id_to_resource["MyQueue"]
+
+    diff = analysis.update_from_file(paths[2])
+    assert diff.added == {"OtherQueue", "OtherEventSourceMapping"}
+    # untouched resources are kept as they are
+    assert analysis.aws.logical_id_to_resource["LambdaFunction"] is function
+    assert analysis.aws.logical_id_to_resource["MyQueue"] is queue
+    assert analysis.check({"OtherQueue": {"nrequests": 5}, **ESTIMATES[0]}) == (
+        AnalyzerResult.REJECT
+    )
+
+
+def test_revision_analysis_reuses_unaffected_components(tmp_path):
+    paths = list(revisions(tmp_path))
+    with open(paths[0], encoding="utf-8") as f:
+        base = f.read()
+    # a second, independent pipeline
+    pipeline = SECOND_QUEUE.replace("LambdaFunction.Arn", "OtherFunction.Arn")
+    pipeline += """
+  OtherFunction:
+    Type: AWS::Lambda::Function
+    Properties:
+      FunctionName: lambda2
+"""
+    (tmp_path / "base.yaml").write_text(base + pipeline)
+    (tmp_path / "renamed.yaml").write_text((base + pipeline).replace("queue2", "q2"))
+    (tmp_path / "joined.yaml").write_text(
+        base
+        + SECOND_QUEUE.replace("Other", "Third").replace("queue2", "queue3")
+        + pipeline
+    )
+
+    estimates = {
+        "OtherQueue": {"nrequests": 5},
+        "OtherFunction": {"nrequests": 5},
+        **ESTIMATES[0],
+    }
+    analysis = RevisionAnalysis(
+        CloudFormationStack.load(tmp_path / "base.yaml"), estimates
+    )
+    assert analysis.base_result == AnalyzerResult.PASS
+
+    report = analysis.compare(CloudFormationStack.load(tmp_path / "renamed.yaml"))
+    assert report.diff.modified == {"OtherQueue"}
+    assert (report.checked, report.reused) == (1, 1)
+    assert report.head == AnalyzerResult.PASS
+
+    for name in ("joined.yaml", "base.yaml", "renamed.yaml"):
+        report = analysis.compare(CloudFormationStack.load(tmp_path / name))
+        assert report.head == fresh_check(tmp_path / name, estimates)
+
+    with pytest.raises(KeyError):
+        analysis.compare(CloudFormationStack.load(paths[0]))
+    report = analysis.compare(CloudFormationStack.load(tmp_path / "base.yaml"))
+    assert report.head == AnalyzerResult.PASS
+
+
+def test_watch_reports_each_change(tmp_path):
+    parent = tmp_path / "parent.yaml"
+    parent.write_text(
+        "Resources:\n"
+        "  Child:\n"
+        "    Type: AWS::CloudFormation::Stack\n"
+        "    Properties:\n"
+        "      TemplateURL: https://s3.amazonaws.com/templates/child.yaml\n"
+    )
+    estimates_file = tmp_path / "estimates.json"
+
+    def fix():
+        # the nested template is missing at first; then only the estimates
+        # change, and the template is loaded again anyway
+        shutil.copy(SQS_LAMBDA, tmp_path / "child.yaml")
+        estimates_file.write_text(json.dumps(child(ESTIMATES[0])))
+
+    edits = [
+        fix,
+        lambda: estimates_file.write_text(json.dumps(child(ESTIMATES[1]))),
+        lambda: None,
+    ]
+    estimates_file.write_text(json.dumps(child(ESTIMATES[0]), indent=2))
+    lines = []
+
+    def report(line):
+        lines.append(line)
+        edits[len(lines) - 1]()
+
+    watch(str(parent), str(estimates_file), interval=0, report=report, iterations=50)
+    assert len(lines) == 3
+    assert lines[0].startswith("⚠️ CloudFormationTemplateError")
+    assert lines[1].startswith("✅ Pass (template; estimates;")
+    assert lines[2].startswith("❌ Reject (estimates;")
+
+
+def test_watch_uses_the_target_and_assets(tmp_path):
+    assets = tmp_path / "assets"
+    assets.mkdir()
+    shutil.copy(SQS_LAMBDA, assets / "child.yaml")
+    parent = tmp_path / "parent.yaml"
+    parent.write_text(
+        "Resources:\n"
+        "  Child:\n"
+        "    Type: AWS::CloudFormation::Stack\n"
+        "    Properties:\n"
+        "      TemplateURL: https://s3.amazonaws.com/templates/child.yaml\n"
+    )
+    estimates_file = tmp_path / "estimates.json"
+    estimates = {f"eu-west-1/456/{k}": v for k, v in child(ESTIMATES[1]).items()}
+    estimates_file.write_text(json.dumps(estimates))
+    lines = []
+    watch(
+        str(parent),
+        str(estimates_file),
+        interval=0,
+        report=lines.append,
+        iterations=1,
+        target=targets.Target.parse("eu-west-1/456"),
+        streaming=True,
+        assets=str(assets),
+    )
+    assert len(lines) == 1 and lines[0].startswith("❌ Reject (template; estimates;")
+
+
+@pytest.mark.parametrize(
+    "options", [["--lazy"], ["--presolve"], ["-t", "us-east-1/1", "-t", "eu-west-1/2"]]
+)
+def test_watch_rejects_unsupported_options(options):
+    template = SQS_LAMBDA
+    args = ["analyze", "--watch", *options, template, "estimates.yaml"]
+    result = CliRunner().invoke(app, args)
+    assert result.exit_code == 2
+    assert "--watch" in result.output
+
+
+def child(estimates):
+    return {f"Child.{logical_id}": value for logical_id, value in estimates.items()}
+
+
+def test_diff_finds_the_head_nested_stacks_next_to_the_head(tmp_path):
+    with open(SQS_LAMBDA, encoding="utf-8") as f:
+        text = f.read()
+    children = {
+        "base": text,
+        # the mapping no longer points to the Lambda
+        "head": text.replace(
+            "FunctionName: !GetAtt LambdaFunction.Arn", "FunctionName: other"
+        ),
+    }
+    for revision, child_text in children.items():
+        (tmp_path / revision).mkdir()
+        (tmp_path / revision / "child.yaml").write_text(child_text)
+        (tmp_path / revision / "parent.yaml").write_text(
+            "Resources:\n"
+            "  Child:\n"
+            "    Type: AWS::CloudFormation::Stack\n"
+            "    Properties:\n"
+            "      TemplateURL: https://s3.amazonaws.com/templates/child.yaml\n"
+        )
+    base = tmp_path / "base" / "parent.yaml"
+    head = tmp_path / "head" / "parent.yaml"
+    estimates = child(ESTIMATES[1])
+    assert fresh_check(base, estimates) != fresh_check(head, estimates)
+
+    analysis = RevisionAnalysis(CloudFormationStack.load(base), estimates, path=base)
+    report = analysis.compare(CloudFormationStack.load(head), path=head)
+    assert report.diff.modified == {"Child"}
+    assert report.base == fresh_check(base, estimates)
+    assert report.head == fresh_check(head, estimates)
+    # and the base is restored with its own nested stacks
+    report = analysis.compare(CloudFormationStack.load(base), path=base)
+    assert report.head == report.base
+
+    estimates_file = tmp_path / "estimates.json"
+    estimates_file.write_text(json.dumps(estimates))
+    result = CliRunner().invoke(
+        app, ["diff", str(base), str(head), str(estimates_file)]
+    )
+    assert fresh_check(head, estimates).name.lower() in result.output.lower()
@@ -0,0 +1,104 @@
+import copy
+import os
+
+import pytest
+from typer.testing import CliRunner
+
+from cloudcap import INVALID_INPUT, synthetic
+from cloudcap.analyzer import Analyzer, AnalyzerResult
+from cloudcap.aws import (
+    AWS,
+    Account,
+    CloudFormationStack,
+    Regions,
+    UnknownResourceError,
+)
+from cloudcap.cli import app
+from tests.conftest import EXAMPLES
+
+
+def lazy_stack(template, demand):
+    aws = AWS()
+    stack = CloudFormationStack(
+        aws, Regions.us_east_1, Account("123"), template, demand=demand
+    )
+    return aws, stack
+
+
+def test_unmodeled_resources_are_stubs():
+    template = CloudFormationStack.load(os.path.join(EXAMPLES, "sns-lambda-alias.yaml"))
+    aws, stack = lazy_stack(template, ["SQSQueue"])
+    assert set(aws.logical_id_to_resource) == {"SQSQueue"}
+    assert "SNSTopic" in stack.stubs
+
+    analyzer = Analyzer(aws)
+    analyzer.constrain()
+    assert analyzer.check({"SQSQueue": {"nrequests": 5}}) == AnalyzerResult.PASS
+
+    with pytest.raises(UnknownResourceError, match=r"SNSTopic \(AWS::SNS::Topic\)"):
+        lazy_stack(template, ["SNSTopic"])
+
+
+@pytest.mark.parametrize("command", ["analyze", "smt2"])
+def test_estimates_of_unmodeled_resources_are_invalid_input(tmp_path, command):
+    (tmp_path / "estimates.yaml").write_text("SNSTopic:\n  nrequests: 10\n")
+    template = os.path.join(EXAMPLES, "sns-lambda-alias.yaml")
+    args = [command, "--lazy", template, str(tmp_path / "estimates.yaml")]
+    result = CliRunner().invoke(app, args)
+    assert result.exit_code == INVALID_INPUT
+    assert not isinstance(result.exception, UnknownResourceError)
+
+
+def test_only_reachable_resources_are_modeled():
+    template, estimates = synthetic.generate(60, consistent=False, seed=1)
+    aws = AWS()
+    CloudFormationStack(aws, Regions.us_east_1, Account("123"), copy.deepcopy(template))
+    eager = Analyzer(aws)
+    eager.constrain()
+
+    # each unit of the template is a separate part of the infrastructure
+    results = []
+    for unit in range(10):
+        subset = {
+            k: v
+            for k, v in estimates.items()
+            if k.startswith((f"Queue{unit}x", f"Function{unit}x"))
+        }
+        aws, stack = lazy_stack(copy.deepcopy(template), subset)
+        assert set(aws.logical_id_to_resource) == set(subset)
+        assert len(stack.event_source_mappings) == 2
+        lazy = Analyzer(aws)
+        lazy.constrain()
+        results.append(lazy.check(subset))
+        assert results[-1] == eager.check(subset)
+    assert AnalyzerResult.REJECT in results
+
+
+def test_update_materializes_newly_reachable_resources():
+    template = {
+        "Resources": {
+            "Queue": {"Type": "AWS::SQS::Queue", "Properties": {"QueueName": "q"}},
+            "Other": {"Type": "AWS::SQS::Queue", "Properties": {"QueueName": "o"}},
+            "Function": {
+                "Type": "AWS::Lambda::Function",
+                "Properties": {"FunctionName": "f"},
+            },
+            "Mapping": {
+                "Type": "AWS::Lambda::EventSourceMapping",
+                "Properties": {
+                    "EventSourceArn": {"Fn::GetAtt": ["Queue", "Arn"]},
+                    "FunctionName": {"Fn::GetAtt": ["Function", "Arn"]},
+                },
+            },
+        }
+    }
+    aws, stack = lazy_stack(copy.deepcopy(template), ["Function"])
+    assert set(stack.stubs) == {"Other"}
+
+    head = copy.deepcopy(template)
+    head["Resources"]["Function"]["Properties"]["Environment"] = {
+        "OTHER": {"Ref": "Other"}
+    }
+    stack.update(head, ["Function"])
+    assert not stack.stubs
+    assert set(aws.logical_id_to_resource) == {"Queue", "Other", "Function"}
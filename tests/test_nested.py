@@ -0,0 +1,221 @@
+import functools
+import os
+
+import pytest
+
+from cloudcap import targets
+from cloudcap.analyzer import AnalyzerResult
+from cloudcap.aws import (
+    AWS,
+    Account,
+    CloudFormationStack,
+    CloudFormationTemplateError,
+    Regions,
+)
+from cloudcap.nested import TemplateLoader
+
+PARENT = """
+Resources:
+  Queue:
+    Type: AWS::SQS::Queue
+    Properties:
+      QueueName: jobs
+  Workers:
+    Type: AWS::CloudFormation::Stack
+    Properties:
+      TemplateURL: https://s3.amazonaws.com/templates/worker.yaml
+      Parameters:
+        QueueArn: !GetAtt Queue.Arn
+  MoreWorkers:
+    Type: AWS::CloudFormation::Stack
+    Properties:
+      TemplateURL: https://s3.amazonaws.com/templates/worker.yaml
+      Parameters:
+        QueueArn: !GetAtt Queue.Arn
+        Name: other
+  Reporter:
+    Type: AWS::Lambda::Function
+    Properties:
+      FunctionName: reporter
+      Environment:
+        WORKER: !GetAtt Workers.Outputs.WorkerArn
+"""
+
+WORKER = """
+Parameters:
+  QueueArn:
+    Type: String
+  Name:
+    Type: String
+    Default: worker
+Resources:
+  Worker:
+    Type: AWS::Lambda::Function
+    Properties:
+      FunctionName: !Ref Name
+  Mapping:
+    Type: AWS::Lambda::EventSourceMapping
+    Properties:
+      FunctionName: !Ref Name
+      EventSourceArn: !Ref QueueArn
+  Dead:
+    Type: AWS::CloudFormation::Stack
+    Metadata:
+      aws:asset:path: dead.json
+    Properties:
+      TemplateURL:
+        Fn::Join: ["", ["https://s3.", {Ref: AWS::URLSuffix}, "/0123abcd.json"]]
+      Parameters:
+        Name: !Ref Name
+Outputs:
+  WorkerArn:
+    Value: !Ref Worker
+"""
+
+DEAD = """
+{
+  "Parameters": {"Name": {"Type": "String"}},
+  "Resources": {
+    "DeadQueue": {"Type": "AWS::SQS::Queue", "Properties": {"QueueName": {"Ref": "Name"}}}
+  }
+}
+"""
+
+
+@pytest.fixture
+def templates(tmp_path):
+    (tmp_path / "parent.yaml").write_text(PARENT)
+    (tmp_path / "worker.yaml").write_text(WORKER)
+    (tmp_path / "dead.json").write_text(DEAD)
+    return tmp_path
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_nested_stacks_form_one_registry(templates, streaming):
+    aws = AWS()
+    stack = CloudFormationStack.from_file(
+        aws,
+        Regions.us_east_1,
+        Account("123"),
+        templates / "parent.yaml",
+        streaming=streaming,
+    )
+    assert set(aws.logical_id_to_resource) == {
+        "Queue",
+        "Reporter",
+        "Workers.Worker",
+        "Workers.Dead.DeadQueue",
+        "MoreWorkers.Worker",
+        "MoreWorkers.Dead.DeadQueue",
+    }
+    assert len(list(stack.stacks())) == 5
+    # parameters in
+    queue = aws.logical_id_to_resource["Queue"]
+    assert sorted(m.function_name for m in queue.event_source_mappings) == [
+        "other",
+        "worker",
+    ]
+    assert (
+        aws.logical_id_to_resource["MoreWorkers.Dead.DeadQueue"].queue_name == "other"
+    )
+    # outputs out
+    worker = aws.logical_id_to_resource["Workers.Worker"]
+    assert aws.logical_id_to_resource["Reporter"].environment == {"WORKER": worker.arn}
+
+
+def test_shared_template_is_parsed_once(templates, monkeypatch):
+    loaded = []
+    load = CloudFormationStack.load
+
+    def counting_load(path, streaming=False):
+        loaded.append(os.path.basename(path))
+        return load(path, streaming)
+
+    monkeypatch.setattr(CloudFormationStack, "load", counting_load)
+    # counted in this process
+    monkeypatch.setattr(
+        TemplateLoader,
+        "__init__",
+        functools.partialmethod(TemplateLoader.__init__, processes=False),
+    )
+    aws = AWS()
+    path = str(templates / "parent.yaml")
+    analyzer = targets.deploy(aws, path, targets.DEFAULT_TARGETS)
+    assert sorted(loaded) == ["dead.json", "parent.yaml", "worker.yaml"]
+
+    estimates = {
+        "Queue": {"nrequests": 10},
+        "Workers.Worker": {"nrequests": 10},
+        "MoreWorkers.Worker": {"nrequests": 10},
+    }
+    assert analyzer.check(estimates) == AnalyzerResult.PASS
+    estimates["MoreWorkers.Worker"] = {"nrequests": 11}
+    assert analyzer.check(estimates) == AnalyzerResult.REJECT
+
+
+def test_worker_processes_load_the_tree(templates):
+    loader = TemplateLoader(processes=True, max_workers=2)
+    try:
+        template = loader.get(templates / "parent.yaml")
+        assert set(template["Resources"]) == {
+            "Queue",
+            "Workers",
+            "MoreWorkers",
+            "Reporter",
+        }
+        dead = loader.get(templates / "dead.json")
+        assert set(dead["Resources"]) == {"DeadQueue"}
+        assert len(loader._templates) == 3
+    finally:
+        loader.close()
+
+
+def test_cycles_of_nested_stacks_are_errors(tmp_path):
+    (tmp_path / "loop.yaml").write_text("""
+Resources:
+  Again:
+    Type: AWS::CloudFormation::Stack
+    Properties:
+      TemplateURL: https://s3.amazonaws.com/templates/loop.yaml
+""")
+    with pytest.raises(CloudFormationTemplateError, match="nests its own template"):
+        CloudFormationStack.from_file(
+            AWS(), Regions.us_east_1, Account("123"), tmp_path / "loop.yaml"
+        )
+
+
+def test_update_closes_the_loader(templates):
+    aws = AWS()
+    stack = CloudFormationStack.from_file(
+        aws, Regions.us_east_1, Account("123"), templates / "parent.yaml"
+    )
+    template = CloudFormationStack.load(templates / "parent.yaml")
+    template["Resources"]["MoreWorkers"]["Properties"]["Parameters"]["Name"] = "third"
+    stack.update(template, ["MoreWorkers"])
+    assert "MoreWorkers.Dead.DeadQueue" in aws.logical_id_to_resource
+    assert stack.loader is not None and stack.loader._pool is None
+
+
+@pytest.mark.parametrize(
+    "metadata, url",
+    [
+        ({"aws:asset:path": "/etc/passwd"}, None),
+        ({"aws:asset:path": "../outside.yaml"}, None),
+        (None, "https://s3.amazonaws.com/templates/.."),
+        (None, "https://s3.amazonaws.com/templates/."),
+        (None, ""),
+    ],
+)
+def test_nested_templates_stay_in_the_assets_directory(tmp_path, metadata, url):
+    inside = tmp_path / "templates"
+    inside.mkdir()
+    (tmp_path / "outside.yaml").write_text(DEAD)
+    body = {"Type": "AWS::CloudFormation::Stack", "Properties": {}}
+    if metadata:
+        body["Metadata"] = metadata
+    if url is not None:
+        body["Properties"]["TemplateURL"] = url
+    with pytest.raises(CloudFormationTemplateError, match="is not a file of"):
+        TemplateLoader().template_path(inside / "parent.yaml", body)
+    with pytest.raises(CloudFormationTemplateError, match="is not a file of"):
+        TemplateLoader(assets=str(inside)).template_path("", body)
@@ -0,0 +1,55 @@
+import pytest
+import z3  # type: ignore
+
+from cloudcap.analyzer import AnalyzerResult
+from cloudcap.metrics import NREQUESTS
+from cloudcap.plugins import Plugin
+from cloudcap.presolve import presolve
+
+
+def test_rejects_without_z3(monkeypatch, synthetic_analyzer):
+    analyzer, estimates = synthetic_analyzer(300, fan_in=2)
+    estimates["Function3x0x0"] = {
+        "nrequests": estimates["Function3x0x0"]["nrequests"] + 1
+    }
+    monkeypatch.setattr(z3.Solver, "check", lambda *_: pytest.fail("solved"))
+    presolved = presolve(analyzer, estimates)
+    assert presolved.result == AnalyzerResult.REJECT
+    assert "Function3x0x0" in presolved.conflict
+    assert analyzer.check(estimates, presolve=True) == AnalyzerResult.REJECT
+
+
+@pytest.mark.parametrize("keep", ["Queue", "Function"])
+def test_same_result_as_solving(keep, synthetic_analyzer):
+    analyzer, estimates = synthetic_analyzer(300, fan_in=2)
+    # the others are left for the presolve or z3 to find
+    partial = {k: v for k, v in estimates.items() if k.startswith(keep)}
+    assert analyzer.check(partial, presolve=True) == analyzer.check(partial)
+    # requests can't be negative
+    first = next(k for k in estimates if k.startswith("Function"))
+    partial[first] = {"nrequests": -1}
+    assert analyzer.check(partial, presolve=True) == AnalyzerResult.REJECT
+    assert analyzer.check(partial) == AnalyzerResult.REJECT
+
+
+class Square(Plugin):
+    """Constrains the first function's requests to be a square, not linearly."""
+
+    def name(self) -> str:
+        return "square"
+
+    def constrain(self) -> None:
+        function = self.aws.logical_id_to_resource["Function0x0x0"]
+        root = z3.Int("root", ctx=self.analyzer.ctx)
+        self.add(root * root == self[function, NREQUESTS])
+
+
+def test_nonlinear_constraints_go_to_z3(synthetic_analyzer):
+    analyzer, estimates = synthetic_analyzer(300, plugins=[Square], fan_in=2)
+    functions = {k: v for k, v in estimates.items() if k.startswith("Function")}
+    for nrequests, expected in [(49, AnalyzerResult.PASS), (50, AnalyzerResult.REJECT)]:
+        functions["Function0x0x0"] = {"nrequests": nrequests}
+        presolved = presolve(analyzer, functions)
+        assert presolved.result is None
+        assert analyzer.check(functions, presolve=True) == expected
+        assert analyzer.check(functions) == expected
@@ -0,0 +1,43 @@
+import json
+
+from cloudcap import profiling
+from cloudcap.analyzer import Analyzer, AnalyzerResult
+from cloudcap.aws import AWS, Account, Regions
+from tests.conftest import PASS_ESTIMATES, SQS_LAMBDA
+
+
+def analyze() -> AnalyzerResult:
+    aws = AWS()
+    deployment = aws.add_deployment(Regions.us_east_1, Account("123"))
+    deployment.from_cloudformation_template(path=SQS_LAMBDA)
+    analyzer = Analyzer(aws)
+    analyzer.constrain()
+    return analyzer.check(PASS_ESTIMATES)
+
+
+def test_profile_reports_phases_counts_and_solver_statistics():
+    with profiling.profiling() as profile:
+        assert analyze() == AnalyzerResult.PASS
+    report = json.loads(json.dumps(profile.to_dict()))
+
+    for span in [
+        "load",
+        "dependency_graph",
+        "create_resources",
+        "create_resources/intrinsic_resolution",
+        "constrain/builtin_aws_lambda_function_plugin",
+        "constrain/builtin_aws_sqs_queue_plugin",
+        "constrain/flows",
+        "solve",
+    ]:
+        assert report["spans"][span]["calls"] >= 1
+    assert report["spans"]["create_resources/intrinsic_resolution"]["calls"] == 3
+    assert report["counts"]["resources"] == 3
+    assert report["counts"]["constraints"] > 0
+    assert report["solver"]
+
+
+def test_profiling_is_off_by_default():
+    assert profiling.current() is None
+    assert analyze() == AnalyzerResult.PASS
+    assert profiling.current() is None
@@ -0,0 +1,50 @@
+import io
+
+import z3
+from typer.testing import CliRunner
+
+from cloudcap import SUCCESS, compression
+from cloudcap.analyzer import Analyzer
+from cloudcap.aws import AWS, Account, Regions
+from cloudcap.cli import app
+from tests.conftest import PASS_ESTIMATES_YAML, SQS_LAMBDA
+
+
+def example() -> Analyzer:
+    aws = AWS()
+    deployment = aws.add_deployment(Regions.us_east_1, Account("123"))
+    deployment.from_cloudformation_template(path=SQS_LAMBDA)
+    analyzer = Analyzer(aws)
+    analyzer.constrain()
+    return analyzer
+
+
+def assertions(smt2: str) -> list[str]:
+    return [a.sexpr() for a in z3.parse_smt2_string(smt2)]
+
+
+def test_written_model_is_the_model():
+    analyzer = example()
+    f = io.StringIO()
+    analyzer.write_smt2(f)
+    written = f.getvalue()
+
+    assert assertions(written) == assertions(analyzer.sexpr())
+    # each variable is declared once, before its first use
+    lines = written.splitlines()
+    declarations = [line for line in lines if line.startswith("(declare-fun")]
+    assert len(declarations) == len(set(declarations)) == 4
+    assert lines[0].startswith("(declare-fun")
+
+
+def test_smt2_writes_compressed_output(tmp_path):
+    (tmp_path / "estimates.yaml").write_text(PASS_ESTIMATES_YAML)
+    output = tmp_path / "model.smt2.gz"
+    template = SQS_LAMBDA
+    args = ["smt2", template, str(tmp_path / "estimates.yaml"), "-o", str(output)]
+    assert CliRunner().invoke(app, args).exit_code == SUCCESS
+
+    with compression.open_file(output) as f:
+        written = f.read()
+    assert compression.detect(output) == compression.GZIP
+    assert "(assert (= |arn:aws:sqs:us-east-1:123:queue1.nrequests| 10))" in written
@@ -0,0 +1,43 @@
+import re
+
+from cloudcap.analyzer import Analyzer, AnalyzerResult, ComponentChecker
+from cloudcap.estimates import Estimates
+
+
+def repeated_units(analyzer: Analyzer, estimates: Estimates):
+    """Gives the units of a synthetic template the estimates of the first."""
+    first: dict = {}
+    for logical_id in estimates:
+        # Queue12x0x1 -> Queue0x1
+        role = re.sub(r"^(\D+)\d+x", r"\1", logical_id)
+        estimates[logical_id] = first.setdefault(role, estimates[logical_id])
+    return analyzer, estimates
+
+
+def test_copies_are_solved_once(synthetic_analyzer):
+    analyzer, estimates = repeated_units(*synthetic_analyzer(200, fan_in=2))
+    checker = ComponentChecker(analyzer, estimates)
+    results = [checker.check(c) for c in analyzer.components()]
+    assert len(results) == 20
+    assert set(results) == {AnalyzerResult.PASS}
+    assert len(checker.verdicts) == 1
+    assert analyzer.check(estimates) == AnalyzerResult.PASS
+
+
+def test_estimates_split_shapes(synthetic_analyzer):
+    analyzer, estimates = repeated_units(*synthetic_analyzer(200, fan_in=2))
+    estimates["Function3x0x0"] = {
+        "nrequests": estimates["Function3x0x0"]["nrequests"] + 1
+    }
+    estimates["Function7x0x0"] = estimates["Function3x0x0"]
+
+    results = analyzer.check_components(estimates)
+    failing = sorted(
+        r.logical_id
+        for component, result in results
+        if result == AnalyzerResult.REJECT
+        for r in component.resources
+        if r.logical_id.startswith("Function") and r.logical_id.endswith("x0x0")
+    )
+    assert failing == ["Function3x0x0", "Function7x0x0"]
+    assert analyzer.check(estimates) == AnalyzerResult.REJECT
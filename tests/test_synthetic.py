@@ -0,0 +1,27 @@
+from cloudcap import synthetic
+from cloudcap.analyzer import AnalyzerResult
+
+
+def test_generate_is_deterministic():
+    assert synthetic.generate(100, cross_references=3) == synthetic.generate(
+        100, cross_references=3
+    )
+    assert synthetic.generate(100, seed=1) != synthetic.generate(100, seed=2)
+
+
+def test_generate_size():
+    template, _ = synthetic.generate(1000, chain_length=3, fan_in=2, fan_out=3)
+    unit = synthetic.resources_per_unit(chain_length=3, fan_in=2, fan_out=3)
+    assert 1000 <= len(template["Resources"]) < 1000 + unit
+
+
+def test_generated_estimates_match_consistency(synthetic_analyzer):
+    for kwargs in ({}, {"fan_in": 3, "fan_out": 2, "cross_references": 10}):
+        for consistent, expected in [
+            (True, AnalyzerResult.PASS),
+            (False, AnalyzerResult.REJECT),
+        ]:
+            analyzer, estimates = synthetic_analyzer(
+                200, consistent=consistent, **kwargs
+            )
+            assert analyzer.check(estimates) == expected
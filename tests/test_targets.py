@@ -0,0 +1,65 @@
+import pytest
+
+from cloudcap import synthetic, targets
+from cloudcap.analyzer import Analyzer, AnalyzerResult
+from cloudcap.aws import AWS, Partitions
+from tests.conftest import SQS_LAMBDA
+
+TARGETS = ["us-east-1/123", "eu-west-1/456", "cn-north-1/789"]
+
+
+def test_replicas_are_constrained_like_deployments_from_scratch(tmp_path):
+    path = str(tmp_path / "template.yaml")
+    template, _ = synthetic.generate(30, fan_in=2, cross_references=3)
+    synthetic.write(template, {}, path)
+    deployment_targets = targets.parse_targets(TARGETS)
+
+    aws = AWS()
+    replicated = targets.deploy(aws, path, deployment_targets)
+
+    aws = AWS()
+    for target in deployment_targets:
+        aws.add_deployment(target.region, target.account).from_cloudformation_template(
+            path
+        )
+    from_scratch = Analyzer(aws)
+    from_scratch.constrain()
+
+    def assertions(analyzer):
+        return sorted(map(str, analyzer.solver.assertions()))
+
+    assert assertions(replicated) == assertions(from_scratch)
+
+
+def test_estimates_apply_to_every_target_unless_qualified():
+    deployment_targets = targets.parse_targets(TARGETS)
+    assert deployment_targets[2].region.partition is Partitions.aws_cn
+    analyzer = targets.deploy(AWS(), SQS_LAMBDA, deployment_targets)
+    estimates = {"MyQueue": {"nrequests": 10}, "LambdaFunction": {"nrequests": 10}}
+
+    def check(estimates):
+        return analyzer.check(targets.expand_estimates(estimates, deployment_targets))
+
+    assert check(estimates) == AnalyzerResult.PASS
+    assert check({**estimates, "eu-west-1/456/MyQueue": {"nrequests": 3}}) == (
+        AnalyzerResult.REJECT
+    )
+    assert check({"eu-west-1/456/MyQueue": {"nrequests": 3}}) == AnalyzerResult.PASS
+
+    with pytest.raises(ValueError):
+        targets.Target.parse("us-east-1")
+
+
+def test_sole_target_accepts_its_qualified_estimates():
+    sole = targets.parse_targets(["eu-west-1/456"])
+    analyzer = targets.deploy(AWS(), SQS_LAMBDA, sole)
+    estimates = {
+        "eu-west-1/456/MyQueue": {"nrequests": 10},
+        "LambdaFunction": {"nrequests": 10},
+    }
+    expanded = targets.expand_estimates(estimates, sole)
+    assert set(expanded) == {"MyQueue", "LambdaFunction"}
+    assert analyzer.check(expanded) == AnalyzerResult.PASS
+
+    with pytest.raises(targets.UnknownTargetsError, match="us-east-1/123/MyQueue"):
+        targets.expand_estimates({"us-east-1/123/MyQueue": {"nrequests": 1}}, sole)
@@ -0,0 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudcap import synthetic
+from cloudcap.analyzer import Analyzer, AnalyzerResult
+
+
+def test_concurrent_analyses_share_a_registry(synthetic_analyzer):
+    # once built, the registry is only read
+    aws = synthetic_analyzer(200)[0].aws
+    scenarios = [
+        synthetic.generate(200, consistent=seed % 3 != 0, seed=seed)[1]
+        for seed in range(12)
+    ]
+
+    def analyze(estimates) -> AnalyzerResult:
+        analyzer = Analyzer(aws)
+        analyzer.constrain()
+        return analyzer.check(estimates)
+
+    sequential = [analyze(e) for e in scenarios]
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        concurrent = list(pool.map(analyze, scenarios))
+    assert concurrent == sequential
+    assert set(sequential) == {AnalyzerResult.PASS, AnalyzerResult.REJECT}